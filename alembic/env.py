@@ -12,6 +12,9 @@ from src.bank.models import Bank  # noqa
 from src.account.models import Account, Deposit, Withdraw  # noqa
 from src.loan.models import Loan, LoanCompensation, LoanType  # noqa
 from src.teller.models import Teller  # noqa
+from src.payroll.models import PayrollJob, PayrollStaging  # noqa
+from src.idempotency import IdempotencyRecord  # noqa
+from src.outbox import OutboxMessage  # noqa
 from src.config import settings
 from src.database import Base
 
@@ -0,0 +1,45 @@
+"""add hot path indexes
+
+Revision ID: 3f9d2c7a1b4e
+Revises: c586eff244cb
+Create Date: 2026-10-17 10:15:42.318205
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9d2c7a1b4e'
+down_revision: Union[str, None] = 'c586eff244cb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (index name, table, columns)
+INDEXES = [
+    ('ix_deposit_account_id_created_at', 'deposit', ['account_id', 'created_at']),
+    ('ix_withdraw_account_id_created_at', 'withdraw', ['account_id', 'created_at']),
+    ('ix_loan_compensation_loan_id_created_at', 'loan_compensation', ['loan_id', 'created_at']),
+    ('ix_loan_account_id', 'loan', ['account_id']),
+    ('ix_loan_loan_type_id', 'loan', ['loan_type_id']),
+    ('ix_loan_type_bank_id', 'loan_type', ['bank_id']),
+    ('ix_account_bank_id', 'account', ['bank_id']),
+    ('ix_teller_bank_id', 'teller', ['bank_id']),
+    ('ix_bank_user_association_bank_id', 'bank_user_association', ['bank_id']),
+    ('ix_user_email', 'user', ['email']),
+]
+
+
+def upgrade() -> None:
+    # CREATE INDEX CONCURRENTLY doesn't lock writes, but can't run inside a transaction
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, table, _ in reversed(INDEXES):
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
@@ -0,0 +1,106 @@
+"""partition history tables by month
+
+Revision ID: 8b1e4d6f2a90
+Revises: 3f9d2c7a1b4e
+Create Date: 2026-10-17 11:40:08.512734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8b1e4d6f2a90'
+down_revision: Union[str, None] = '3f9d2c7a1b4e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (table, parent column, parent table, on delete, check constraint, index name)
+TABLES = [
+    ('deposit', 'account_id', 'account', 'CASCADE',
+     ('check_d_amount_gt_100k', 'amount > 100000'),
+     'ix_deposit_account_id_created_at'),
+    ('withdraw', 'account_id', 'account', 'CASCADE',
+     ('check_w_amount_between_range', 'amount BETWEEN 100000 AND 3000000'),
+     'ix_withdraw_account_id_created_at'),
+    ('loan_compensation', 'loan_id', 'loan', 'RESTRICT',
+     ('check_d_amount_gt_0', 'amount > 0'),
+     'ix_loan_compensation_loan_id_created_at'),
+]
+
+# months created ahead of now; the maintenance task keeps this window filled
+MONTHS_AHEAD = 3
+
+
+def _swap(table, parent_column, parent_table, ondelete, check, index, partitioned):
+    name, condition = check
+
+    op.execute(f'ALTER TABLE {table} RENAME TO {table}_old')
+    op.execute(f'ALTER INDEX {table}_pkey RENAME TO {table}_old_pkey')
+    op.execute(f'ALTER INDEX {index} RENAME TO {index}_old')
+    op.execute(f'ALTER TABLE {table}_old RENAME CONSTRAINT {name} TO {name}_old')
+    op.execute(f'ALTER TABLE {table}_old RENAME CONSTRAINT {table}_{parent_column}_fkey TO {table}_old_{parent_column}_fkey')
+
+    # a primary key of a partitioned table has to include the partition key
+    primary_key = '(id, created_at)' if partitioned else '(id)'
+    op.execute(f"""
+        CREATE TABLE {table} (
+            id integer NOT NULL DEFAULT nextval('{table}_id_seq'),
+            amount integer NOT NULL,
+            {parent_column} integer NOT NULL
+                REFERENCES {parent_table} (id) ON DELETE {ondelete},
+            created_at timestamp without time zone NOT NULL
+                DEFAULT TIMEZONE('utc', now()),
+            CONSTRAINT {name} CHECK ({condition}),
+            CONSTRAINT {table}_pkey PRIMARY KEY {primary_key}
+        ) {'PARTITION BY RANGE (created_at)' if partitioned else ''}
+    """)
+
+    if partitioned:
+        op.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+        # one partition per month from the oldest row up to MONTHS_AHEAD from now
+        op.execute(f"""
+            DO $$
+            DECLARE
+                month timestamp;
+            BEGIN
+                FOR month IN
+                    SELECT generate_series(
+                        date_trunc('month', coalesce(
+                            (SELECT min(created_at) FROM {table}_old),
+                            TIMEZONE('utc', now())
+                        )),
+                        date_trunc('month', TIMEZONE('utc', now()))
+                            + interval '{MONTHS_AHEAD} months',
+                        interval '1 month'
+                    )
+                LOOP
+                    EXECUTE format(
+                        'CREATE TABLE %I PARTITION OF {table} FOR VALUES FROM (%L) TO (%L)',
+                        '{table}_p' || to_char(month, 'YYYY_MM'),
+                        month,
+                        month + interval '1 month'
+                    );
+                END LOOP;
+            END
+            $$
+        """)
+
+    op.execute(f'INSERT INTO {table} (id, amount, {parent_column}, created_at) '
+               f'SELECT id, amount, {parent_column}, created_at FROM {table}_old')
+    op.execute(f'ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id')
+    op.execute(f'DROP TABLE {table}_old')
+    op.create_index(index, table, [parent_column, 'created_at'])
+
+
+def upgrade() -> None:
+    for table, parent_column, parent_table, ondelete, check, index in TABLES:
+        _swap(table, parent_column, parent_table, ondelete, check, index, partitioned=True)
+
+
+def downgrade() -> None:
+    # detached partitions are plain tables and aren't merged back
+    for table, parent_column, parent_table, ondelete, check, index in reversed(TABLES):
+        _swap(table, parent_column, parent_table, ondelete, check, index, partitioned=False)
@@ -0,0 +1,79 @@
+"""add ledger_entry and balance_checkpoint
+
+Revision ID: d47a9c3e5b12
+Revises: 8b1e4d6f2a90
+Create Date: 2026-10-17 13:05:27.904113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd47a9c3e5b12'
+down_revision: Union[str, None] = '8b1e4d6f2a90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('ledger_entry',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('account_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(length=20), nullable=False),
+    sa.Column('reference_id', sa.Integer(), nullable=True),
+    sa.Column('amount', sa.Integer(), nullable=False),
+    sa.Column('balance_delta', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text("TIMEZONE('utc', now())"), nullable=False),
+    sa.CheckConstraint("kind IN ('opening', 'deposit', 'withdraw', 'loan_disbursal', 'loan_repayment')", name='check_ledger_entry_kind'),
+    sa.ForeignKeyConstraint(['account_id'], ['account.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_ledger_entry_account_id_created_at', 'ledger_entry', ['account_id', 'created_at'], unique=False)
+    op.create_table('balance_checkpoint',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('account_id', sa.Integer(), nullable=False),
+    sa.Column('balance', sa.Integer(), nullable=False),
+    sa.Column('as_of', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['account_id'], ['account.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('account_id', 'as_of', name='unique_checkpoint_as_of')
+    )
+
+    # existing history becomes the ledger
+    op.execute("""
+        INSERT INTO ledger_entry (account_id, kind, reference_id, amount, balance_delta, created_at)
+        SELECT account_id, 'deposit', id, amount, amount, created_at FROM deposit
+        UNION ALL
+        SELECT account_id, 'withdraw', id, amount, -amount, created_at FROM withdraw
+        UNION ALL
+        SELECT account_id, 'loan_disbursal', id, amount_out, amount_out, created_at FROM loan
+        UNION ALL
+        SELECT loan.account_id, 'loan_repayment', loan_compensation.id,
+               loan_compensation.amount, 0, loan_compensation.created_at
+        FROM loan_compensation JOIN loan ON loan.id = loan_compensation.loan_id
+        ORDER BY created_at
+    """)
+    # whatever the history doesn't explain (initial money, past drift) becomes
+    # an opening entry, so the ledger adds up to the current account.money
+    op.execute("""
+        INSERT INTO ledger_entry (account_id, kind, reference_id, amount, balance_delta, created_at)
+        SELECT account.id, 'opening', NULL,
+               coalesce(account.money, 0) - coalesce(history.balance, 0),
+               coalesce(account.money, 0) - coalesce(history.balance, 0),
+               account.created_at
+        FROM account
+        LEFT JOIN (
+            SELECT account_id, sum(balance_delta) AS balance
+            FROM ledger_entry GROUP BY account_id
+        ) history ON history.account_id = account.id
+        WHERE coalesce(account.money, 0) <> coalesce(history.balance, 0)
+    """)
+
+
+def downgrade() -> None:
+    op.drop_table('balance_checkpoint')
+    op.drop_index('ix_ledger_entry_account_id_created_at', table_name='ledger_entry')
+    op.drop_table('ledger_entry')
@@ -0,0 +1,43 @@
+"""add account balance stripes
+
+Revision ID: 5e2b7f9a0c83
+Revises: d47a9c3e5b12
+Create Date: 2026-10-17 14:20:51.230947
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e2b7f9a0c83'
+down_revision: Union[str, None] = 'd47a9c3e5b12'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('account', sa.Column('stripes', sa.Integer(), server_default='0', nullable=False))
+    op.create_table('account_balance_stripe',
+    sa.Column('account_id', sa.Integer(), nullable=False),
+    sa.Column('stripe', sa.Integer(), nullable=False),
+    sa.Column('money', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['account_id'], ['account.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('account_id', 'stripe')
+    )
+
+
+def downgrade() -> None:
+    # fold striped money back into the account row before dropping the stripes
+    op.execute("""
+        UPDATE account SET money = coalesce(account.money, 0) + stripes.money
+        FROM (
+            SELECT account_id, sum(money) AS money
+            FROM account_balance_stripe GROUP BY account_id
+        ) stripes
+        WHERE stripes.account_id = account.id
+    """)
+    op.drop_table('account_balance_stripe')
+    op.drop_column('account', 'stripes')
@@ -0,0 +1,53 @@
+"""add payroll_job and payroll_staging
+
+Revision ID: a9c4e1d7f605
+Revises: 5e2b7f9a0c83
+Create Date: 2026-10-17 15:30:14.627381
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9c4e1d7f605'
+down_revision: Union[str, None] = '5e2b7f9a0c83'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('payroll_job',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_by', sa.Integer(), nullable=True),
+    sa.Column('file_name', sa.String(length=255), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('loaded_rows', sa.Integer(), nullable=False),
+    sa.Column('invalid_rows', sa.Integer(), nullable=False),
+    sa.Column('applied_rows', sa.Integer(), nullable=False),
+    sa.Column('applied_amount', sa.BigInteger(), nullable=False),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text("TIMEZONE('utc', now())"), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), server_default=sa.text("TIMEZONE('utc', now())"), nullable=False),
+    sa.ForeignKeyConstraint(['created_by'], ['user.id'], ondelete='SET NULL'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('payroll_staging',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('job_id', sa.Integer(), nullable=False),
+    sa.Column('line', sa.Integer(), nullable=False),
+    sa.Column('account_id', sa.Integer(), nullable=False),
+    sa.Column('amount', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['job_id'], ['payroll_job.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    prefixes=['UNLOGGED']
+    )
+    op.create_index('ix_payroll_staging_job_id', 'payroll_staging', ['job_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_payroll_staging_job_id', table_name='payroll_staging')
+    op.drop_table('payroll_staging')
+    op.drop_table('payroll_job')
@@ -0,0 +1,34 @@
+"""add outbox_message
+
+Revision ID: e61b4d9f3a27
+Revises: c3f8a2d6e914
+Create Date: 2026-10-17 17:50:22.914605
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e61b4d9f3a27'
+down_revision: Union[str, None] = 'c3f8a2d6e914'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('outbox_message',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('task', sa.String(length=255), nullable=False),
+    sa.Column('args', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('kwargs', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('created_at', sa.DateTime(), server_default=sa.text("TIMEZONE('utc', now())"), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('outbox_message')
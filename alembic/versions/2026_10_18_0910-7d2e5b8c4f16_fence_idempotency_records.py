@@ -0,0 +1,28 @@
+"""fence idempotency_record
+
+Revision ID: 7d2e5b8c4f16
+Revises: e61b4d9f3a27
+Create Date: 2026-10-18 09:10:27.531904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d2e5b8c4f16'
+down_revision: Union[str, None] = 'e61b4d9f3a27'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('idempotency_record', sa.Column('token', sa.Uuid(), nullable=True))
+    op.add_column('idempotency_record', sa.Column('applied', sa.Boolean(), server_default=sa.text('false'), nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('idempotency_record', 'applied')
+    op.drop_column('idempotency_record', 'token')
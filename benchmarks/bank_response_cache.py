@@ -0,0 +1,108 @@
+"""
+Cache hits of a bank list page, the way they were served before responses
+were cached as rendered bytes and the way they are served now:
+
+- before: get_or_set hands back the decoded value, which FastAPI encodes
+  again with jsonable_encoder and JSONResponse
+- after: get_or_render sends the stored bytes as they are
+- after, inflated: the same for a client that doesn't accept deflate
+
+The page has 100 banks with three loan types each. Prints wall time and CPU
+time per hit, Redis round trip included. Needs Redis from `.env`; entries
+are written under their own prefix and removed afterwards:
+
+    python -m benchmarks.bank_response_cache --hits 2000
+"""
+import argparse
+import asyncio
+import time
+from uuid import uuid4
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from starlette.requests import Request
+
+import src.main  # noqa: F401
+from src.bank.schemas import BankListSchema
+from src.cache import TaggedCache
+from src.redis_client import get_redis, redis_manager
+
+cache = TaggedCache(prefix="benchmark:bank", ttl=600)
+TAGS = ["banks"]
+
+
+def make_page(banks: int) -> dict:
+    return {
+        "size": banks,
+        "next_cursor": None,
+        "data": [
+            BankListSchema(
+                id=uuid4(),
+                name=f"Bank {i}",
+                location=f"{i} Independence Ave, Tashkent",
+                loan_types=[
+                    {"id": i * 3 + j, "name": f"Loan {j}", "interest": 12, "days": 90}
+                    for j in range(3)
+                ],
+            )
+            for i in range(banks)
+        ],
+    }
+
+
+def make_request(accept_encoding: str) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/bank/list/",
+            "headers": [(b"accept-encoding", accept_encoding.encode())],
+        }
+    )
+
+
+async def measure(name: str, hits: int, hit) -> None:
+    await hit()
+    wall, cpu = time.perf_counter(), time.process_time()
+    for _ in range(hits):
+        await hit()
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    print(
+        f"{name:>16}: {wall / hits * 1e6:>8.0f} us/hit wall  "
+        f"{cpu / hits * 1e6:>8.0f} us/hit CPU"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    redis_manager.connect()
+    page = make_page(args.banks)
+
+    async def compute():
+        return page
+
+    async def before():
+        value = await cache.get_or_set("before", TAGS, compute)
+        return JSONResponse(jsonable_encoder(value))
+
+    async def after(request: Request):
+        return await cache.get_or_render(request, "after", TAGS, compute)
+
+    deflating, plain = make_request("gzip, deflate"), make_request("identity")
+    try:
+        await measure("before", args.hits, before)
+        await measure("after", args.hits, lambda: after(deflating))
+        await measure("after, inflated", args.hits, lambda: after(plain))
+    finally:
+        keys = [key async for key in get_redis().scan_iter("benchmark:bank:*")]
+        if keys:
+            await get_redis().delete(*keys)
+        await redis_manager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--hits", type=int, default=2000)
+    parser.add_argument("--banks", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,108 @@
+"""
+Serializing one list page of deposits, the way list endpoints did it before
+page_response and the way they do it now:
+
+- before: an ORM entity per row, DepositListSchema.model_validate on each,
+  then jsonable_encoder and JSONResponse like FastAPI does for a dict
+- after: Core rows of the selected columns through page_response
+
+Prints rows/s (best of --repeat runs) and peak traced memory of each, and
+checks that both produce the same bytes. Rows are built in memory up front,
+so ORM loading isn't part of "before" and no database is needed:
+
+    python -m benchmarks.page_serialization --rows 10000
+"""
+import argparse
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy.engine import Row
+from sqlalchemy.engine.result import IteratorResult, SimpleResultMetaData
+
+import src.main  # noqa: F401
+from src.account.models import Deposit
+from src.account.schemas import DepositListSchema
+from src.dependencies import PageParams, page_response
+
+
+def make_entities(rows: int) -> list[Deposit]:
+    start = datetime(2026, 1, 1)
+    return [
+        Deposit(
+            id=i,
+            amount=100_000 + i,
+            account_id=1,
+            created_at=start + timedelta(seconds=i),
+        )
+        for i in range(rows)
+    ]
+
+
+def make_rows(entities: list[Deposit]) -> list[Row]:
+    # the Row type the endpoints get from select(Deposit.id, Deposit.amount, ...)
+    result = IteratorResult(
+        SimpleResultMetaData(["id", "amount", "created_at"]),
+        iter([(e.id, e.amount, e.created_at) for e in entities]),
+    )
+    return result.all()
+
+
+def before(entities: list[Deposit], params: PageParams) -> bytes:
+    content = {
+        "size": params.size,
+        "next_cursor": None,
+        "data": [
+            DepositListSchema.model_validate(i, from_attributes=True) for i in entities
+        ],
+    }
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def after(rows: list[Row], params: PageParams) -> bytes:
+    return page_response(DepositListSchema, rows, params, None).body
+
+
+def measure(name: str, repeat: int, func, *args) -> bytes:
+    # timed without tracemalloc, which slows allocations down several times
+    elapsed = min(_timed(func, *args) for _ in range(repeat))
+
+    tracemalloc.start()
+    body = func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    rows = args[1].size
+    print(f"{name:>6}: {rows / elapsed:>10,.0f} rows/s  peak {peak / 2**20:6.1f} MB")
+    return body
+
+
+def _timed(func, *args) -> float:
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main(args: argparse.Namespace) -> None:
+    params = PageParams(size=args.rows)
+    entities = make_entities(args.rows)
+    rows = make_rows(entities)
+
+    # warm up pydantic's and the TypeAdapter's caches
+    before(entities[:10], PageParams(size=10))
+    after(rows[:10], PageParams(size=10))
+
+    old = measure("before", args.repeat, before, entities, params)
+    new = measure("after", args.repeat, after, rows, params)
+    assert old == new, "the two paths produce different bytes"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    main(parser.parse_args())
@@ -0,0 +1,117 @@
+"""
+Deposits into one hot account from many concurrent clients, with the balance
+on the account row and spread over balance stripes.
+
+Needs the database from `.env`, migrated to head:
+
+    python -m benchmarks.stripes_contention --concurrency 64 --deposits 5000 --stripes 0 4 16
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from uuid import uuid4
+
+from sqlalchemy import delete, insert
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+import src.main  # noqa: F401
+from src.account.crud import AccountCRUD
+from src.account.models import (
+    Account,
+    AccountBalanceStripe,
+    Deposit,
+    LedgerEntry,
+)
+from src.account.schemas import DepositCreateSchema
+from src.auth.models import User
+from src.bank.models import Bank
+from src.config import settings
+
+
+async def create_account(session_local, stripes: int) -> Account:
+    async with session_local() as db:
+        user = User(
+            name="benchmark",
+            email=f"{uuid4()}@example.com",
+            phone_number="+998900000000",
+            hashed_password=b"-",
+        )
+        bank = Bank(name=f"benchmark-{uuid4()}")
+        db.add_all([user, bank])
+        await db.flush()
+        account = Account(user_id=user.id, bank_id=bank.id, money=0, stripes=stripes)
+        db.add(account)
+        await db.flush()
+        if stripes:
+            await db.execute(
+                insert(AccountBalanceStripe),
+                [{"account_id": account.id, "stripe": i} for i in range(stripes)],
+            )
+        await db.commit()
+        return account
+
+
+async def drop_account(session_local, account: Account) -> None:
+    async with session_local() as db:
+        for model in (LedgerEntry, Deposit):
+            await db.execute(delete(model).where(model.account_id == account.id))
+        await db.execute(delete(Account).where(Account.id == account.id))
+        await db.execute(delete(Bank).where(Bank.id == account.bank_id))
+        await db.execute(delete(User).where(User.id == account.user_id))
+        await db.commit()
+
+
+async def run(session_local, stripes: int, concurrency: int, deposits: int) -> dict:
+    account = await create_account(session_local, stripes)
+    schema = DepositCreateSchema(amount=200_000)
+    latencies = []
+    remaining = iter(range(deposits))
+
+    async def client():
+        for _ in remaining:
+            start = time.perf_counter()
+            async with session_local() as db:
+                await AccountCRUD.create_deposit_in_account(
+                    db=db, account=account, deposit_schema=schema
+                )
+            latencies.append(time.perf_counter() - start)
+
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    finally:
+        await drop_account(session_local, account)
+
+    latencies.sort()
+    return {
+        "stripes": stripes,
+        "deposits/s": round(deposits / elapsed),
+        "p50 ms": round(statistics.median(latencies) * 1000, 2),
+        "p99 ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    engine = create_async_engine(
+        settings.DATABASE_URL_asyncpg,
+        pool_size=args.concurrency,
+        max_overflow=0,
+    )
+    session_local = async_sessionmaker(bind=engine, expire_on_commit=False)
+    try:
+        for stripes in args.stripes:
+            print(await run(session_local, stripes, args.concurrency, args.deposits))
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--deposits", type=int, default=5000)
+    parser.add_argument("--stripes", type=int, nargs="+", default=[0, 4, 16])
+    asyncio.run(main(parser.parse_args()))
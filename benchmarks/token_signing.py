@@ -0,0 +1,111 @@
+"""
+Signing and verifying access tokens with PEM text handed to PyJWT on every
+call, as encode_jwt/decode_jwt did before, and with the pre-parsed keys of
+SigningKeyRing. The key ring is also measured with a throwaway ES256 and
+EdDSA key, to compare the algorithms AUTH_JWT.signing_keys accepts.
+
+Prints signs/s and verifications/s of each. No database or Redis is needed:
+
+    python -m benchmarks.token_signing --operations 500
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+import src.main  # noqa: F401
+from src.auth.utils import SigningKeyRing, signing_key_ring
+from src.config import SigningKey, settings
+
+PAYLOAD = {"sub": "1", "email": "user@example.com", "exp": 4102444800}
+
+
+def rate(operations: int, func) -> float:
+    start = time.perf_counter()
+    for _ in range(operations):
+        func()
+    return operations / (time.perf_counter() - start)
+
+
+def report(name: str, operations: int, sign, verify) -> None:
+    token = sign()
+    signs = rate(operations, sign)
+    verifications = rate(operations, lambda: verify(token))
+    print(f"{name:>14}: {signs:>9,.0f} signs/s  {verifications:>9,.0f} verifications/s")
+
+
+def throwaway_ring(directory: Path, algorithm: str, private_key) -> SigningKeyRing:
+    private_path = directory / f"{algorithm}-private.pem"
+    public_path = directory / f"{algorithm}-public.pem"
+    private_path.write_bytes(
+        private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+    public_path.write_bytes(
+        private_key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo,
+        )
+    )
+    return SigningKeyRing(
+        keys=[
+            SigningKey(
+                kid=algorithm,
+                algorithm=algorithm,
+                private_key_path=private_path,
+                public_key_path=public_path,
+            )
+        ],
+        active_kid=algorithm,
+    )
+
+
+def main(args: argparse.Namespace) -> None:
+    key = next(
+        key
+        for key in settings.AUTH_JWT.signing_keys
+        if key.kid == settings.AUTH_JWT.active_kid
+    )
+    private_pem = key.private_key_path.read_text()
+    public_pem = key.public_key_path.read_text()
+
+    report(
+        f"{key.algorithm} PEM",
+        args.operations,
+        lambda: jwt.encode(PAYLOAD, private_pem, algorithm=key.algorithm),
+        lambda token: jwt.decode(token, public_pem, algorithms=[key.algorithm]),
+    )
+    report(
+        f"{key.algorithm} key ring",
+        args.operations,
+        lambda: signing_key_ring.sign(PAYLOAD),
+        signing_key_ring.verify,
+    )
+
+    with tempfile.TemporaryDirectory() as directory:
+        for algorithm, private_key in (
+            ("ES256", ec.generate_private_key(ec.SECP256R1())),
+            ("EdDSA", ed25519.Ed25519PrivateKey.generate()),
+        ):
+            ring = throwaway_ring(Path(directory), algorithm, private_key)
+            report(
+                f"{algorithm} key ring",
+                args.operations,
+                lambda: ring.sign(PAYLOAD),
+                ring.verify,
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--operations", type=int, default=500)
+    main(parser.parse_args())
@@ -1,7 +1,9 @@
 #!/bin/bash
 
 if [[ "${1}" == "celery" ]]; then
-  celery --app=src.tasks.tasks:app worker -l INFO
+  celery --app=src.tasks.tasks:app worker --beat -l INFO
+elif [[ "${1}" == "relay" ]]; then
+  python -m src.tasks.outbox
 elif [[ "${1}" == "flower" ]]; then
   celery --app=src.tasks.tasks:app flower
  fi
\ No newline at end of file
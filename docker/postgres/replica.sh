@@ -0,0 +1,15 @@
+#!/bin/bash
+set -e
+
+export PGPASSWORD="$POSTGRES_PASSWORD"
+
+if [[ ! -s "$PGDATA/PG_VERSION" ]]; then
+  until pg_basebackup --pgdata="$PGDATA" --host=postgres_db --port=5432 \
+    --username="$POSTGRES_USER" --wal-method=stream --write-recovery-conf; do
+    echo "waiting for the primary to accept replication connections"
+    sleep 2
+  done
+  chmod 0700 "$PGDATA"
+fi
+
+exec postgres
@@ -0,0 +1,5 @@
+#!/bin/bash
+set -e
+
+# allow streaming replication connections from the replica container
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
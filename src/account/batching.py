@@ -0,0 +1,129 @@
+import asyncio
+import contextvars
+
+from prometheus_client import Histogram
+from sqlalchemy import Executable, Row
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from src.config import settings
+from src.database import AsyncSessionLocal, CommitTracker, current_commit_tracker
+
+GROUP_COMMIT_SIZE = Histogram(
+    "group_commit_operations",
+    "Money operations committed per transaction",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+
+# account id, statement, the caller's future and commit tracker
+_Pending = tuple[int, Executable, asyncio.Future, CommitTracker | None]
+
+
+class GroupCommitBatcher:
+    """
+    Gathers money statements arriving within `window` seconds (or until
+    `max_ops` are waiting) and commits them in one transaction, so a burst
+    of operations pays for one WAL flush instead of one each.
+
+    If the shared transaction fails, every statement of the batch is retried
+    in its own transaction and only the failing ones get the error.
+
+    Flushes run outside of the callers' contexts; each caller's commit
+    tracker is marked once its own statement is committed and returned a row.
+    """
+
+    def __init__(
+        self,
+        session_local: async_sessionmaker[AsyncSession],
+        window: float,
+        max_ops: int,
+        enabled: bool = True,
+    ) -> None:
+        self.session_local = session_local
+        self.window = window
+        self.max_ops = max_ops
+        self.enabled = enabled
+        self._pending: list[_Pending] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._flushes: set[asyncio.Task] = set()
+
+    async def execute(self, statement: Executable, key: int) -> Row | None:
+        """
+        Runs `statement` in the next batch and returns its first row.
+        Statements are applied ordered by `key` (the account id), keeping the
+        arrival order per key, so concurrent batches lock rows in one order.
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((key, statement, future, current_commit_tracker()))
+
+        if len(self._pending) >= self.max_ops:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(
+                self.window, self._flush, context=contextvars.Context()
+            )
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        task = asyncio.create_task(self._apply(batch), context=contextvars.Context())
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+
+    async def _apply(self, batch: list[_Pending]) -> None:
+        batch.sort(key=lambda item: item[0])
+        GROUP_COMMIT_SIZE.observe(len(batch))
+
+        try:
+            async with self.session_local() as session:
+                rows = [
+                    (await session.execute(statement)).first()
+                    for _, statement, _, _ in batch
+                ]
+                await session.commit()
+        except Exception:
+            await asyncio.gather(*(self._apply_one(item) for item in batch))
+            return
+
+        for (_, _, future, tracker), row in zip(batch, rows):
+            # a statement that returned nothing wrote nothing
+            if tracker is not None and row is not None:
+                tracker.committed = True
+            if not future.done():
+                future.set_result(row)
+
+    async def _apply_one(self, item: _Pending) -> None:
+        _, statement, future, tracker = item
+        try:
+            async with self.session_local() as session:
+                row = (await session.execute(statement)).first()
+                await session.commit()
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if tracker is not None and row is not None:
+                tracker.committed = True
+            if not future.done():
+                future.set_result(row)
+
+    async def close(self) -> None:
+        self._flush()
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+
+
+money_batcher = GroupCommitBatcher(
+    session_local=AsyncSessionLocal,
+    window=settings.GROUP_COMMIT_WINDOW_MS / 1000,
+    max_ops=settings.GROUP_COMMIT_MAX_OPS,
+    enabled=settings.GROUP_COMMIT_ENABLED,
+)
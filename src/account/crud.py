@@ -1,30 +1,104 @@
+from collections import defaultdict
+from typing import AsyncIterator
 from uuid import UUID
 
 from fastapi import HTTPException, status
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import (
+    CTE,
+    Row,
+    select,
+    update,
+    insert,
+    literal,
+    and_,
+    func,
+    union_all,
+    values,
+    column,
+    true,
+    false,
+    Integer,
+    String,
+    cast,
+)
 
-from src.account.models import Deposit, Account, Withdraw
+from src.account.batching import money_batcher
+from src.account.models import (
+    Deposit,
+    Account,
+    AccountBalanceStripe,
+    Withdraw,
+    LedgerEntry,
+    BalanceCheckpoint,
+)
 from src.account.schemas import (
     AccountCreateSchema,
     WithdrawCreateSchema,
     DepositCreateSchema,
+    DepositOperationSchema,
+    WithdrawOperationSchema,
 )
+from src.account.utils import ACCOUNT_CACHE_EXCLUDE, account_cache_key
 from src.auth.models import User
+from src.cache import orm_restore, orm_snapshot, resource_cache
+from src.membership import membership_index
 from src.bank.models import Bank
+from src.config import settings
+from src.loan.models import Loan, LoanCompensation
+from src.dependencies import PageParams, keyset_paginate, next_page
+
+
+def ledger_entry_cte(
+    name: str, kind: str, account_id, reference_id, amount, balance_delta, created_at
+) -> CTE:
+    """
+    INSERT into ledger_entry as a data-modifying CTE, so the entry is written
+    by the same statement as the change it records.
+    """
+    return (
+        insert(LedgerEntry)
+        .from_select(
+            [
+                "account_id",
+                "kind",
+                "reference_id",
+                "amount",
+                "balance_delta",
+                "created_at",
+            ],
+            select(
+                account_id,
+                literal(kind, String),
+                reference_id,
+                amount,
+                balance_delta,
+                created_at,
+            ),
+            include_defaults=False,
+        )
+        .cte(name)
+    )
 
 
 class AccountCRUD:
 
     @staticmethod
-    async def list_accounts_in_bank(db: AsyncSession, bank: Bank) -> list:
+    async def list_accounts_in_bank(
+        db: AsyncSession, bank: Bank, params: PageParams
+    ) -> tuple[list, str | None]:
         query = select(
-            Account.id, Account.user_id, Account.money, Account.created_at
+            Account.id,
+            Account.user_id,
+            Account.balance.label("money"),
+            Account.created_at,
         ).where(Account.bank_id == bank.id)
+        query = keyset_paginate(query, params, Account.id)
 
         result = (await db.execute(query)).all()
 
-        return list(result)
+        return next_page(list(result), params, Account.id)
 
     @staticmethod
     async def create_account_in_bank(
@@ -46,8 +120,16 @@ class AccountCRUD:
 
             new_account = Account(**data)
             db.add(new_account)
+            if new_account.money:
+                db.add(
+                    LedgerEntry(
+                        account=new_account,
+                        kind="opening",
+                        amount=new_account.money,
+                        balance_delta=new_account.money,
+                    )
+                )
             await db.commit()
-            return new_account
         except Exception as e:
             if "unique_account_in_bank" in str(e).lower():
                 raise HTTPException(
@@ -58,6 +140,11 @@ class AccountCRUD:
                 status_code=400, detail={"message": "user_id or bank_id is invalid"}
             )
 
+        # drops a cached "not found" of the id
+        await resource_cache.invalidate(account_cache_key(new_account.id))
+        await membership_index.add("account", new_account.user_id, new_account.id)
+        return new_account
+
     @staticmethod
     async def retrieve_account_in_bank(
         db: AsyncSession, account_id: int
@@ -66,24 +153,111 @@ class AccountCRUD:
         result = await db.scalar(query)
         return result
 
+    @staticmethod
+    async def retrieve_account_cached(
+        db: AsyncSession, account_id: int
+    ) -> Account | None:
+        """
+        `retrieve_account_in_bank` served from the resource cache, merged into
+        `db`. `money` isn't cached and needs a refresh before it is read.
+        """
+
+        async def load():
+            account = await AccountCRUD.retrieve_account_in_bank(
+                db=db, account_id=account_id
+            )
+            if account is None:
+                return None
+            return orm_snapshot(account, exclude=ACCOUNT_CACHE_EXCLUDE)
+
+        snapshot = await resource_cache.get_or_load(account_cache_key(account_id), load)
+        if snapshot is None:
+            return None
+        return await db.merge(orm_restore(Account, snapshot), load=False)
+
+    @staticmethod
+    async def _execute_money_statement(
+        db: AsyncSession, query, account_id: int
+    ) -> Row | None:
+        if money_batcher.enabled:
+            return await money_batcher.execute(query, key=account_id)
+
+        result = (await db.execute(query)).first()
+        # a statement whose guard matched nothing wrote nothing; not committing
+        # it keeps the request retryable under its Idempotency-Key
+        if result is None:
+            await db.rollback()
+        else:
+            await db.commit()
+        return result
+
     @staticmethod
     async def create_deposit_in_account(
         db: AsyncSession,
         account: Account,
         deposit_schema: DepositCreateSchema,
     ):
-        data = deposit_schema.model_dump()
-        data["account_id"] = account.id
+        amount = deposit_schema.model_dump()["amount"]
 
-        try:
-            new_deposit = Deposit(**data)
-            account.money += data["amount"]
-
-            db.add(new_deposit)
-            await db.commit()
+        # credit, history row and ledger entry in a single statement, so
+        # concurrent deposits never overwrite each other's balance. The stripe
+        # count is read by the statement itself: `account` may be a cached copy
+        stripe = (
+            select(cast(func.floor(func.random() * Account.stripes), Integer))
+            .where(and_(Account.id == account.id, Account.stripes > 0))
+            .scalar_subquery()
+        )
+        stripe_credited = (
+            update(AccountBalanceStripe)
+            .where(
+                and_(
+                    AccountBalanceStripe.account_id == account.id,
+                    AccountBalanceStripe.stripe == stripe,
+                )
+            )
+            .values(money=AccountBalanceStripe.money + amount)
+            .returning(AccountBalanceStripe.account_id.label("id"))
+            .cte("stripe_credited")
+        )
+        row_credited = (
+            update(Account)
+            .where(and_(Account.id == account.id, Account.stripes == 0))
+            .values(money=func.coalesce(Account.money, 0) + amount)
+            .returning(Account.id)
+            .cte("row_credited")
+        )
+        credited = union_all(
+            select(stripe_credited.c.id), select(row_credited.c.id)
+        ).cte("credited")
+        deposited = (
+            insert(Deposit)
+            .from_select(
+                ["amount", "account_id"],
+                select(literal(amount, Integer), credited.c.id),
+                include_defaults=False,
+            )
+            .returning(
+                Deposit.id, Deposit.amount, Deposit.account_id, Deposit.created_at
+            )
+            .cte("deposited")
+        )
+        recorded = ledger_entry_cte(
+            "recorded",
+            "deposit",
+            account_id=deposited.c.account_id,
+            reference_id=deposited.c.id,
+            amount=deposited.c.amount,
+            balance_delta=deposited.c.amount,
+            created_at=deposited.c.created_at,
+        )
+        query = select(deposited).add_cte(recorded)
 
-            return new_deposit
+        try:
+            new_deposit = await AccountCRUD._execute_money_statement(
+                db, query, account_id=account.id
+            )
         except Exception as e:
+            await db.rollback()
             if "check_d_amount_gt_100k" in str(e).lower():
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
@@ -91,39 +265,432 @@ class AccountCRUD:
                 )
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
+        if not new_deposit:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail={"account_id": f"Account with id {account.id} is not found"},
+            )
+
+        return new_deposit
+
     @staticmethod
     async def create_withdraw_in_account(
         db: AsyncSession,
         account: Account,
         withdraw_schema: WithdrawCreateSchema,
     ):
-        data = withdraw_schema.model_dump()
-        data["account_id"] = account.id
+        amount = withdraw_schema.model_dump()["amount"]
+
+        if account.stripes:
+            enough = await AccountCRUD._debit_stripes(db, account.id, amount)
+            debited = (
+                select(Account.id)
+                .where(and_(Account.id == account.id, true() if enough else false()))
+                .cte("debited")
+            )
+        else:
+            # the balance check is part of the UPDATE, so it can't act on a stale value
+            debited = (
+                update(Account)
+                .where(and_(Account.id == account.id, Account.money >= amount))
+                .values(money=Account.money - amount)
+                .returning(Account.id)
+                .cte("debited")
+            )
+        withdrawn = (
+            insert(Withdraw)
+            .from_select(
+                ["amount", "account_id"],
+                select(literal(amount, Integer), debited.c.id),
+                include_defaults=False,
+            )
+            .returning(
+                Withdraw.id, Withdraw.amount, Withdraw.account_id, Withdraw.created_at
+            )
+            .cte("withdrawn")
+        )
+        recorded = ledger_entry_cte(
+            "recorded",
+            "withdraw",
+            account_id=withdrawn.c.account_id,
+            reference_id=withdrawn.c.id,
+            amount=withdrawn.c.amount,
+            balance_delta=-withdrawn.c.amount,
+            created_at=withdrawn.c.created_at,
+        )
+        query = select(withdrawn).add_cte(recorded)
 
         try:
-            new_withdraw = Withdraw(**data)
-            diff = data["amount"] - account.money
-            if account.money == 0:
+            if account.stripes:
+                # the stripes are already locked and debited by this session
+                new_withdraw = (await db.execute(query)).first()
+                if new_withdraw is None:
+                    await db.rollback()
+                else:
+                    await db.commit()
+            else:
+                new_withdraw = await AccountCRUD._execute_money_statement(
+                    db, query, account_id=account.id
+                )
+        except Exception as e:
+            await db.rollback()
+            if "check_w_amount_between_range" in str(e).lower():
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
-                    detail={"message": "the account has no money"},
+                    detail={"amount": "it needs to be between 100 000 and 3 000 000"},
                 )
-            elif diff > 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+        if not new_withdraw:
+            money = await db.scalar(
+                select(Account.balance).where(Account.id == account.id)
+            )
+            if not money:
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
-                    detail={"amount": "it needs to be up to {}".format(account.money)},
+                    detail={"message": "the account has no money"},
+                )
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail={"amount": "it needs to be up to {}".format(money)},
+            )
+
+        return new_withdraw
+
+    @staticmethod
+    async def apply_transaction_batch(
+        db: AsyncSession,
+        operations: list[DepositOperationSchema | WithdrawOperationSchema],
+        atomic: bool,
+    ) -> list[dict]:
+        """
+        Applies the operations in order in one transaction. Balances are checked
+        in memory against locked accounts, then rows are written with one
+        multi-row INSERT per table and one UPDATE for all the balances.
+
+        With `atomic` nothing is written if any operation fails, otherwise
+        the failed ones are skipped.
+        """
+        account_ids = sorted({operation.account_id for operation in operations})
+        # locked in id order, so concurrent batches can't deadlock each other
+        stripes = dict(
+            (
+                await db.execute(
+                    select(Account.id, Account.stripes)
+                    .where(Account.id.in_(account_ids))
+                    .order_by(Account.id)
+                    .with_for_update(key_share=True)
                 )
+            ).all()
+        )
+        balances = dict(
+            (
+                await db.execute(
+                    select(Account.id, Account.balance).where(
+                        Account.id.in_(stripes)
+                    )
+                )
+            ).all()
+        )
+
+        results = []
+        applied = {Deposit: [], Withdraw: []}
+        deltas = defaultdict(int)
+        for index, operation in enumerate(operations):
+            balance = balances.get(operation.account_id)
+            if balance is None:
+                error = {
+                    "account_id": f"Account with id {operation.account_id} is not found"
+                }
+            elif operation.kind == "withdraw" and balance < operation.amount:
+                error = {"amount": "it needs to be up to {}".format(balance)}
             else:
-                account.money -= data["amount"]
+                error = None
+
+            if error is not None:
+                results.append({"index": index, "status": "failed", "error": error})
+                continue
+
+            delta = operation.amount if operation.kind == "deposit" else -operation.amount
+            balances[operation.account_id] += delta
+            deltas[operation.account_id] += delta
+            applied[Deposit if operation.kind == "deposit" else Withdraw].append(
+                (index, operation)
+            )
+            results.append({"index": index, "status": "ok", "kind": operation.kind})
+
+        if atomic and any(result["status"] == "failed" for result in results):
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail={
+                    "message": "no operation was applied",
+                    "results": [r for r in results if r["status"] == "failed"],
+                },
+            )
 
-                db.add(new_withdraw)
-                await db.commit()
+        try:
+            ledger_entries = []
+            for model, items in applied.items():
+                if not items:
+                    continue
+                rows = await db.execute(
+                    insert(model).returning(
+                        model.id,
+                        model.amount,
+                        model.account_id,
+                        model.created_at,
+                        sort_by_parameter_order=True,
+                    ),
+                    [
+                        {"amount": operation.amount, "account_id": operation.account_id}
+                        for _, operation in items
+                    ],
+                )
+                for (index, operation), row in zip(items, rows):
+                    results[index]["data"] = dict(row._mapping)
+                    ledger_entries.append(
+                        {
+                            "account_id": row.account_id,
+                            "kind": operation.kind,
+                            "reference_id": row.id,
+                            "amount": row.amount,
+                            "balance_delta": (
+                                row.amount if model is Deposit else -row.amount
+                            ),
+                            "created_at": row.created_at,
+                        }
+                    )
+            if ledger_entries:
+                await db.execute(insert(LedgerEntry), ledger_entries)
 
-                return new_withdraw
+            # a striped account going down has to spill over its stripes,
+            # everything else is one UPDATE ... FROM (VALUES ...)
+            for account_id, delta in deltas.items():
+                if delta < 0 and stripes[account_id]:
+                    if not await AccountCRUD._debit_stripes(db, account_id, -delta):
+                        raise HTTPException(
+                            status_code=status.HTTP_409_CONFLICT,
+                            detail={
+                                "account_id": f"Balance of account {account_id} changed, try again"
+                            },
+                        )
+            plain = [
+                (account_id, delta)
+                for account_id, delta in deltas.items()
+                if delta and not (delta < 0 and stripes[account_id])
+            ]
+            if plain:
+                changes = values(
+                    column("id", Integer), column("delta", Integer), name="changes"
+                ).data(plain)
+                await db.execute(
+                    update(Account)
+                    .where(Account.id == changes.c.id)
+                    .values(money=func.coalesce(Account.money, 0) + changes.c.delta)
+                    .execution_options(synchronize_session=False)
+                )
+
+            await db.commit()
+        except HTTPException:
+            await db.rollback()
+            raise
         except Exception as e:
-            if "check_w_amount_between_range" in str(e).lower():
+            await db.rollback()
+            if "check_d_amount_gt_100k" in str(e).lower():
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
-                    detail={"amount": "it needs to be between 100 000 and 3 000 000"},
+                    detail={"amount": "deposits need to be greater than 100k"},
                 )
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+            elif "check_w_amount_between_range" in str(e).lower():
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail={"amount": "withdraws need to be between 100 000 and 3 000 000"},
+                )
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail={"message": "the operations could not be applied"},
+            )
+
+        return results
+
+    @staticmethod
+    async def _debit_stripes(db: AsyncSession, account_id: int, amount: int) -> bool:
+        """
+        Takes `amount` from the account row first and then from its stripes in
+        stripe order. The account row is locked first, so debits of a striped
+        account run one at a time while deposits keep going to the stripes.
+        """
+        # NO KEY UPDATE, so deposits' foreign key checks on the account aren't blocked
+        money = await db.scalar(
+            select(Account.money)
+            .where(Account.id == account_id)
+            .with_for_update(key_share=True)
+        )
+        stripes = (
+            await db.execute(
+                select(AccountBalanceStripe.stripe, AccountBalanceStripe.money)
+                .where(AccountBalanceStripe.account_id == account_id)
+                .order_by(AccountBalanceStripe.stripe)
+                .with_for_update()
+            )
+        ).all()
+
+        if (money or 0) + sum(s.money for s in stripes) < amount:
+            return False
+
+        taken = min(money or 0, amount)
+        left = amount - taken
+        if taken:
+            await db.execute(
+                update(Account)
+                .where(Account.id == account_id)
+                .values(money=Account.money - taken)
+            )
+        for stripe in stripes:
+            if not left:
+                break
+            taken = min(stripe.money, left)
+            if taken:
+                await db.execute(
+                    update(AccountBalanceStripe)
+                    .where(
+                        and_(
+                            AccountBalanceStripe.account_id == account_id,
+                            AccountBalanceStripe.stripe == stripe.stripe,
+                        )
+                    )
+                    .values(money=AccountBalanceStripe.money - taken)
+                )
+                left -= taken
+
+        return True
+
+    @staticmethod
+    async def set_balance_stripes(db: AsyncSession, account: Account, stripes: int):
+        """
+        Moves the money of the stripes back to the account row and makes sure
+        there are `stripes` of them. Stripe rows are never deleted, so a deposit
+        that picked a stripe before the change still lands on a live row.
+        """
+        await db.execute(
+            select(Account.id)
+            .where(Account.id == account.id)
+            .with_for_update(key_share=True)
+        )
+        stripes_money = sum(
+            await db.scalars(
+                select(AccountBalanceStripe.money)
+                .where(AccountBalanceStripe.account_id == account.id)
+                .with_for_update()
+            )
+        )
+
+        await db.execute(
+            update(AccountBalanceStripe)
+            .where(
+                and_(
+                    AccountBalanceStripe.account_id == account.id,
+                    AccountBalanceStripe.money != 0,
+                )
+            )
+            .values(money=0)
+        )
+        await db.execute(
+            update(Account)
+            .where(Account.id == account.id)
+            .values(
+                money=func.coalesce(Account.money, 0) + stripes_money,
+                stripes=stripes,
+            )
+        )
+        if stripes:
+            await db.execute(
+                pg_insert(AccountBalanceStripe)
+                .values(
+                    [
+                        {"account_id": account.id, "stripe": i, "money": 0}
+                        for i in range(stripes)
+                    ]
+                )
+                .on_conflict_do_nothing()
+            )
+        await db.commit()
+        await resource_cache.invalidate(account_cache_key(account.id))
+        await db.refresh(account)
+
+        return account
+
+    @staticmethod
+    async def stream_statement(db: AsyncSession, account_id: int) -> AsyncIterator[Row]:
+        """
+        Deposits, withdraws and loan compensations of the account merged in
+        time order. Rows come from a server-side cursor `yield_per` at a time,
+        so memory does not grow with the history of the account.
+        """
+        deposits = select(
+            literal("deposit", String).label("kind"),
+            Deposit.id,
+            Deposit.amount,
+            Deposit.created_at,
+        ).where(Deposit.account_id == account_id)
+        withdraws = select(
+            literal("withdraw", String).label("kind"),
+            Withdraw.id,
+            Withdraw.amount,
+            Withdraw.created_at,
+        ).where(Withdraw.account_id == account_id)
+        compensations = (
+            select(
+                literal("loan_compensation", String).label("kind"),
+                LoanCompensation.id,
+                LoanCompensation.amount,
+                LoanCompensation.created_at,
+            )
+            .join(Loan, onclause=Loan.id == LoanCompensation.loan_id)
+            .where(Loan.account_id == account_id)
+        )
+
+        entries = union_all(deposits, withdraws, compensations).subquery("entries")
+        query = (
+            select(entries)
+            .order_by(entries.c.created_at, entries.c.kind, entries.c.id)
+            .execution_options(yield_per=settings.STATEMENT_YIELD_PER)
+        )
+
+        result = await db.stream(query)
+        async for row in result:
+            yield row
+
+    @staticmethod
+    async def balance_as_of(db: AsyncSession, account_id: int, as_of) -> int:
+        """
+        Latest checkpoint at or before `as_of` plus the ledger entries written
+        after it, so the cost is bounded by the checkpoint interval rather than
+        by the age of the account.
+        """
+        checkpoint = (
+            await db.execute(
+                select(BalanceCheckpoint.balance, BalanceCheckpoint.as_of)
+                .where(
+                    and_(
+                        BalanceCheckpoint.account_id == account_id,
+                        BalanceCheckpoint.as_of <= as_of,
+                    )
+                )
+                .order_by(BalanceCheckpoint.as_of.desc())
+                .limit(1)
+            )
+        ).first()
+
+        query = select(func.coalesce(func.sum(LedgerEntry.balance_delta), 0)).where(
+            and_(
+                LedgerEntry.account_id == account_id,
+                LedgerEntry.created_at <= as_of,
+            )
+        )
+        if checkpoint is not None:
+            query = query.where(LedgerEntry.created_at > checkpoint.as_of)
+
+        delta = await db.scalar(query)
+        return (checkpoint.balance if checkpoint else 0) + delta
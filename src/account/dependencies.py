@@ -16,7 +16,7 @@ async def retrieve_account_dependency(
     account_id: int,
     db: AsyncSession = Depends(get_async_session),
 ) -> Account:
-    result = await AccountCRUD.retrieve_account_in_bank(db=db, account_id=account_id)
+    result = await AccountCRUD.retrieve_account_cached(db=db, account_id=account_id)
 
     if not result:
         raise HTTPException(
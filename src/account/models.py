@@ -1,8 +1,17 @@
 from datetime import datetime, timezone
 from typing import Annotated
 
-from sqlalchemy import ForeignKey, CheckConstraint, text, UniqueConstraint
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import (
+    ForeignKey,
+    CheckConstraint,
+    text,
+    UniqueConstraint,
+    Index,
+    String,
+    select,
+    func,
+)
+from sqlalchemy.orm import Mapped, mapped_column, relationship, column_property
 from src.database import Base
 from typing_extensions import TYPE_CHECKING
 
@@ -15,27 +24,36 @@ if TYPE_CHECKING:
 created_at = Annotated[
     datetime,
     mapped_column(
-        default=datetime.now(), server_default=text("TIMEZONE('utc', now())")
+        default=datetime.utcnow, server_default=text("TIMEZONE('utc', now())")
     ),
 ]
 updated_at = Annotated[
     datetime,
     mapped_column(
-        default=datetime.now(),
+        default=datetime.utcnow,
+        server_default=text("TIMEZONE('utc', now())"),
+        onupdate=datetime.utcnow,
+    ),
+]
+# created_at of monthly partitioned tables, it has to be part of the primary key
+partition_key = Annotated[
+    datetime,
+    mapped_column(
+        primary_key=True,
+        default=datetime.utcnow,
         server_default=text("TIMEZONE('utc', now())"),
-        onupdate=datetime.now(),
     ),
 ]
 
 
 class Deposit(Base):
     __tablename__ = "deposit"
-    id: Mapped[int] = mapped_column(primary_key=True)
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     amount: Mapped[int] = mapped_column(nullable=False)
     account_id: Mapped[int] = mapped_column(
         ForeignKey("account.id", ondelete="CASCADE")
     )
-    created_at: Mapped[created_at]
+    created_at: Mapped[partition_key]
     account: Mapped["Account"] = relationship(back_populates="deposits")
 
     def __repr__(self) -> str:
@@ -46,17 +64,19 @@ class Deposit(Base):
             "amount > 100000",
             name="check_d_amount_gt_100k",
         ),
+        Index("ix_deposit_account_id_created_at", "account_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
     )
 
 
 class Withdraw(Base):
     __tablename__ = "withdraw"
-    id: Mapped[int] = mapped_column(primary_key=True)
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     amount: Mapped[int] = mapped_column(nullable=False)
     account_id: Mapped[int] = mapped_column(
         ForeignKey("account.id", ondelete="CASCADE")
     )
-    created_at: Mapped[created_at]
+    created_at: Mapped[partition_key]
 
     account: Mapped["Account"] = relationship(back_populates="withdraws")
 
@@ -68,6 +88,8 @@ class Withdraw(Base):
             "amount BETWEEN 100000 AND 3000000",
             name="check_w_amount_between_range",
         ),
+        Index("ix_withdraw_account_id_created_at", "account_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
     )
 
 
@@ -75,8 +97,12 @@ class Account(Base):
     __tablename__ = "account"
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("user.id", ondelete="CASCADE"))
-    bank_id: Mapped[int] = mapped_column(ForeignKey("bank.id", ondelete="CASCADE"))
+    bank_id: Mapped[int] = mapped_column(
+        ForeignKey("bank.id", ondelete="CASCADE"), index=True
+    )
     money: Mapped[int | None] = mapped_column(default=0)
+    # number of balance stripes deposits are spread over, 0 keeps them on `money`
+    stripes: Mapped[int] = mapped_column(default=0, server_default="0")
     created_at: Mapped[created_at]
 
     user: Mapped["User"] = relationship(back_populates="accounts")
@@ -84,6 +110,9 @@ class Account(Base):
     deposits: Mapped[list["Deposit"]] = relationship(back_populates="account")
     withdraws: Mapped[list["Withdraw"]] = relationship(back_populates="account")
     loans: Mapped[list["Loan"]] = relationship(back_populates="account")
+    ledger_entries: Mapped[list["LedgerEntry"]] = relationship(
+        back_populates="account"
+    )
 
     __table_args__ = (
         UniqueConstraint("user_id", "bank_id", name="unique_account_in_bank"),
@@ -91,3 +120,87 @@ class Account(Base):
 
     def __repr__(self) -> str:
         return f"<Account:{self.id}~Bank:{self.bank_id}>"
+
+
+class AccountBalanceStripe(Base):
+    """
+    Sub-balance of a busy account. Deposits update a random stripe instead of
+    the account row, so they don't queue on a single row lock.
+    """
+
+    __tablename__ = "account_balance_stripe"
+    account_id: Mapped[int] = mapped_column(
+        ForeignKey("account.id", ondelete="CASCADE"), primary_key=True
+    )
+    stripe: Mapped[int] = mapped_column(primary_key=True)
+    money: Mapped[int] = mapped_column(default=0, server_default="0")
+
+    def __repr__(self) -> str:
+        return f"<AccountBalanceStripe:{self.stripe}~Account:{self.account_id}>"
+
+
+# money on the account row plus all of its stripes; deferred, so plain account
+# loads don't pay for the subquery
+Account.balance = column_property(
+    func.coalesce(Account.money, 0)
+    + func.coalesce(
+        select(func.sum(AccountBalanceStripe.money))
+        .where(AccountBalanceStripe.account_id == Account.id)
+        .correlate_except(AccountBalanceStripe)
+        .scalar_subquery(),
+        0,
+    ),
+    deferred=True,
+)
+
+
+class LedgerEntry(Base):
+    """
+    Append-only history of everything that touches an account. `Account.money`
+    is a projection of it: the sum of `balance_delta` of the account's entries.
+    """
+
+    __tablename__ = "ledger_entry"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    account_id: Mapped[int] = mapped_column(
+        ForeignKey("account.id", ondelete="CASCADE")
+    )
+    # opening, deposit, withdraw, loan_disbursal, loan_repayment
+    kind: Mapped[str] = mapped_column(String(20))
+    # id of the deposit / withdraw / loan / loan_compensation row
+    reference_id: Mapped[int | None]
+    amount: Mapped[int]
+    balance_delta: Mapped[int]
+    created_at: Mapped[created_at]
+
+    account: Mapped["Account"] = relationship(back_populates="ledger_entries")
+
+    __table_args__ = (
+        CheckConstraint(
+            "kind IN ('opening', 'deposit', 'withdraw', 'loan_disbursal', 'loan_repayment')",
+            name="check_ledger_entry_kind",
+        ),
+        Index("ix_ledger_entry_account_id_created_at", "account_id", "created_at"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<LedgerEntry:{self.id}~Account:{self.account_id}"
+
+
+class BalanceCheckpoint(Base):
+    """Balance of an account including every ledger entry up to `as_of`."""
+
+    __tablename__ = "balance_checkpoint"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    account_id: Mapped[int] = mapped_column(
+        ForeignKey("account.id", ondelete="CASCADE")
+    )
+    balance: Mapped[int]
+    as_of: Mapped[datetime]
+
+    __table_args__ = (
+        UniqueConstraint("account_id", "as_of", name="unique_checkpoint_as_of"),
+    )
+
+    def __repr__(self) -> str:
+        return f"<BalanceCheckpoint:{self.id}~Account:{self.account_id}"
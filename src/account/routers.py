@@ -1,7 +1,12 @@
+from datetime import datetime, timezone
+from typing import Literal
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, Path, HTTPException, status
+from fastapi import APIRouter, Depends, Path, HTTPException, Query, Request, status
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import ValidationError
 from sqlalchemy import select, and_
 
 from src.account.dependencies import retrieve_account_dependency
@@ -9,6 +14,8 @@ from src.account.models import Deposit, Withdraw
 from src.account.schemas import (
     AccountListSchema,
     AccountCreateSchema,
+    AccountStripesSchema,
+    TransactionBatchAdapter,
     DepositCreateSchema,
     DepositCreatedListSchema,
     WithdrawCreateSchema,
@@ -16,32 +23,46 @@ from src.account.schemas import (
     DepositListSchema,
     WithdrawListSchema,
 )
-from src.auth.models import User
-from src.auth.routers import get_active_auth_user, get_teller_auth_user
+from src.auth.schemas import UserAuthSchema
+from src.auth.routers import (
+    get_active_auth_user,
+    get_teller_auth_user,
+    get_super_user,
+)
 from src.bank.routers import bank_id_that_is_relevant
-from src.database import get_async_session
+from src.account.utils import statement_csv, statement_ndjson
+from src.idempotency import IdempotentRoute, idempotent
+from src.membership import membership_index
+from src.database import (
+    get_async_session,
+    get_async_read_session,
+    read_session_local,
+)
+from src.dependencies import (
+    PageParams,
+    pagination_params,
+    keyset_paginate,
+    next_page,
+    page_response,
+    CursorPage,
+)
 
 from src.account.crud import AccountCRUD
 from src.bank.models import Bank, Account
 from src.bank.dependencies import retrieve_bank_dependency
 
-router = APIRouter(prefix="/account")
+router = APIRouter(prefix="/account", route_class=IdempotentRoute)
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~PERMISSIONS~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
 async def account_that_is_relevant(
     account_id: int,
-    user: User = Depends(get_active_auth_user),
+    user: UserAuthSchema = Depends(get_active_auth_user),
     db: AsyncSession = Depends(get_async_session),
 ) -> Account:
-    query = select(Account).where(
-        and_(
-            Account.user_id == user.id,
-            Account.id == account_id,
-        )
-    )
-
-    result = await db.scalar(query)
+    result = None
+    if await membership_index.is_member(db, "account", user.id, account_id):
+        result = await AccountCRUD.retrieve_account_cached(db=db, account_id=account_id)
 
     if not result:
         raise HTTPException(
@@ -54,7 +75,7 @@ async def account_that_is_relevant(
 
 async def deposit_that_is_relevant(
     deposit_id: int,
-    user: User = Depends(get_active_auth_user),
+    user: UserAuthSchema = Depends(get_active_auth_user),
     db: AsyncSession = Depends(get_async_session),
 ):
     query = (
@@ -76,7 +97,7 @@ async def deposit_that_is_relevant(
 
 async def withdraw_that_is_relevant(
     withdraw_id: int,
-    user: User = Depends(get_active_auth_user),
+    user: UserAuthSchema = Depends(get_active_auth_user),
     db: AsyncSession = Depends(get_async_session),
 ):
     query = (
@@ -97,25 +118,28 @@ async def withdraw_that_is_relevant(
 
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ROUTERS~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
-@router.get("/list/{bank_id}/", tags=["Bank~Account"])
+@router.get(
+    "/list/{bank_id}/",
+    tags=["Bank~Account"],
+    response_model=CursorPage[AccountListSchema],
+)
 async def list_accounts_in_bank(
-    teller: User = Depends(get_teller_auth_user),
+    teller: UserAuthSchema = Depends(get_teller_auth_user),
     bank: Bank = Depends(retrieve_bank_dependency),
-    db: AsyncSession = Depends(get_async_session),
+    db: AsyncSession = Depends(get_async_read_session),
+    params: PageParams = Depends(pagination_params),
 ):
-    result = await AccountCRUD.list_accounts_in_bank(db=db, bank=bank)
-    return {
-        "data": [
-            AccountListSchema.model_validate(i, from_attributes=True) for i in result
-        ],
-    }
+    result, next_cursor = await AccountCRUD.list_accounts_in_bank(
+        db=db, bank=bank, params=params
+    )
+    return page_response(AccountListSchema, result, params, next_cursor)
 
 
 @router.post("/create/{bank_id}/", tags=["Bank~Account"])
 async def create_account_in_bank(
     account_schema: AccountCreateSchema,
     bank_id: UUID,
-    teller: User = Depends(get_teller_auth_user),
+    teller: UserAuthSchema = Depends(get_teller_auth_user),
     db: AsyncSession = Depends(get_async_session),
 ):
     result = await AccountCRUD.create_account_in_bank(
@@ -128,12 +152,65 @@ async def create_account_in_bank(
     }
 
 
+@router.post("/{account_id}/stripes/", tags=["Bank~Account"])
+async def set_balance_stripes_of_account(
+    stripes_schema: AccountStripesSchema,
+    account: Account = Depends(retrieve_account_dependency),
+    db: AsyncSession = Depends(get_async_session),
+    super_user: UserAuthSchema = Depends(get_super_user),
+):
+    result = await AccountCRUD.set_balance_stripes(
+        db=db, account=account, stripes=stripes_schema.stripes
+    )
+
+    return {
+        "message": "Balance stripes updated successfully",
+        "data": {"id": result.id, "stripes": result.stripes, "money": result.money},
+    }
+
+
+@router.post("/transactions/batch/", tags=["Bank~Transaction"])
+@idempotent
+async def create_transaction_batch(
+    request: Request,
+    mode: Literal["atomic", "best_effort"] = Query(default="atomic"),
+    db: AsyncSession = Depends(get_async_session),
+    teller: UserAuthSchema = Depends(get_teller_auth_user),
+):
+    """
+    Body: a JSON list of up to TRANSACTION_BATCH_MAX operations, e.g.
+    `[{"kind": "deposit", "account_id": 1, "amount": 200000},
+    {"kind": "withdraw", "account_id": 2, "amount": 150000}]`
+    """
+    # parsed and validated straight from the raw body, without an
+    # intermediate json.loads and per-item model construction by FastAPI
+    try:
+        operations = TransactionBatchAdapter.validate_json(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError(
+            [
+                {**error, "loc": ("body", *(error["loc"] or ("operations",)))}
+                for error in e.errors()
+            ]
+        )
+
+    results = await AccountCRUD.apply_transaction_batch(
+        db=db, operations=operations, atomic=mode == "atomic"
+    )
+
+    return {
+        "message": "Transactions processed successfully",
+        "data": results,
+    }
+
+
 @router.post("/{account_id}/create/deposit/", tags=["Bank~Deposit"])
+@idempotent
 async def create_deposit_in_account(
     deposit_schema: DepositCreateSchema,
     account: Account = Depends(retrieve_account_dependency),
     db: AsyncSession = Depends(get_async_session),
-    teller: User = Depends(get_teller_auth_user),
+    teller: UserAuthSchema = Depends(get_teller_auth_user),
 ):
     result = await AccountCRUD.create_deposit_in_account(
         db=db,
@@ -148,11 +225,12 @@ async def create_deposit_in_account(
 
 
 @router.post("/{account_id}/create/withdraw/", tags=["Bank~Withdraw"])
+@idempotent
 async def create_withdraw_in_account(
     withdraw_schema: WithdrawCreateSchema,
     account: Account = Depends(retrieve_account_dependency),
     db: AsyncSession = Depends(get_async_session),
-    teller: User = Depends(get_teller_auth_user),
+    teller: UserAuthSchema = Depends(get_teller_auth_user),
 ):
     result = await AccountCRUD.create_withdraw_in_account(
         db=db,
@@ -169,15 +247,18 @@ async def create_withdraw_in_account(
 @router.get("/me/banks/{bank_id}/accounts/list/", tags=["User-Me-Account"])
 async def list_accounts_user_me(
     bank_id: UUID,
-    user: User = Depends(get_active_auth_user),
-    db: AsyncSession = Depends(get_async_session),
-    teller: User = Depends(get_teller_auth_user),
+    user: UserAuthSchema = Depends(get_active_auth_user),
+    db: AsyncSession = Depends(get_async_read_session),
+    teller: UserAuthSchema = Depends(get_teller_auth_user),
 ):
-    query = select(Account).where(
-        and_(Account.bank_id == bank_id, Account.user_id == user.id)
-    )
+    query = select(
+        Account.id,
+        Account.user_id,
+        Account.balance.label("money"),
+        Account.created_at,
+    ).where(and_(Account.bank_id == bank_id, Account.user_id == user.id))
 
-    result = await db.scalar(query)
+    result = (await db.execute(query)).first()
 
     return {"data": AccountListSchema.model_validate(result, from_attributes=True)}
 
@@ -186,9 +267,9 @@ async def list_accounts_user_me(
 async def create_account_user_me(
     money_schema: DepositCreateSchema,
     bank_id: UUID = Depends(bank_id_that_is_relevant),
-    user: User = Depends(get_active_auth_user),
+    user: UserAuthSchema = Depends(get_active_auth_user),
     db: AsyncSession = Depends(get_async_session),
-    teller: User = Depends(get_teller_auth_user),
+    teller: UserAuthSchema = Depends(get_teller_auth_user),
 ):
 
     account_schema = AccountCreateSchema(
@@ -208,11 +289,12 @@ async def create_account_user_me(
 @router.post(
     "/me/accounts/{account_id}/deposits/create/", tags=["User-Me-Account-Deposit"]
 )
+@idempotent
 async def create_deposit_in_account(
     deposit_schema: DepositCreateSchema,
     account: Account = Depends(account_that_is_relevant),
     db: AsyncSession = Depends(get_async_session),
-    teller: User = Depends(get_teller_auth_user),
+    teller: UserAuthSchema = Depends(get_teller_auth_user),
 ):
     result = await AccountCRUD.create_deposit_in_account(
         db=db,
@@ -227,20 +309,26 @@ async def create_deposit_in_account(
 
 
 @router.get(
-    "/me/accounts/{account_id}/deposits/list/", tags=["User-Me-Account-Deposit"]
+    "/me/accounts/{account_id}/deposits/list/",
+    tags=["User-Me-Account-Deposit"],
+    response_model=CursorPage[DepositListSchema],
 )
 async def list_deposit_in_account_user_me(
     account: Account = Depends(account_that_is_relevant),
-    db: AsyncSession = Depends(get_async_session),
+    db: AsyncSession = Depends(get_async_read_session),
+    params: PageParams = Depends(pagination_params),
 ):
-    query = select(Deposit).where(Deposit.account_id == account.id)
-    result = await db.scalars(query)
+    query = select(Deposit.id, Deposit.amount, Deposit.created_at).where(
+        Deposit.account_id == account.id
+    )
+    query = keyset_paginate(
+        query, params, Deposit.created_at, Deposit.id, descending=True
+    )
+    result, next_cursor = next_page(
+        list((await db.execute(query)).all()), params, Deposit.created_at, Deposit.id
+    )
 
-    return {
-        "data": [
-            DepositListSchema.model_validate(i, from_attributes=True) for i in result
-        ]
-    }
+    return page_response(DepositListSchema, result, params, next_cursor)
 
 
 @router.get("/me/deposits/{deposit_id}/detail/", tags=["User-Me-Account-Deposit"])
@@ -254,6 +342,7 @@ async def retrieve_deposit_in_account_user_me(
 @router.post(
     "/me/accounts/{account_id}/withdraws/create/", tags=["User-Me-Account-Withdraw"]
 )
+@idempotent
 async def create_withdraw_in_account(
     withdraw_schema: WithdrawCreateSchema,
     account: Account = Depends(account_that_is_relevant),
@@ -272,21 +361,26 @@ async def create_withdraw_in_account(
 
 
 @router.get(
-    "/me/accounts/{account_id}/withdraws/list/", tags=["User-Me-Account-Withdraw"]
+    "/me/accounts/{account_id}/withdraws/list/",
+    tags=["User-Me-Account-Withdraw"],
+    response_model=CursorPage[WithdrawListSchema],
 )
 async def list_withdraw_in_account(
     account: Account = Depends(account_that_is_relevant),
-    db: AsyncSession = Depends(get_async_session),
+    db: AsyncSession = Depends(get_async_read_session),
+    params: PageParams = Depends(pagination_params),
 ):
-    query = select(Withdraw).where(Withdraw.account_id == account.id)
-    result = await db.scalars(query)
-    print(result)
+    query = select(Withdraw.id, Withdraw.amount, Withdraw.created_at).where(
+        Withdraw.account_id == account.id
+    )
+    query = keyset_paginate(
+        query, params, Withdraw.created_at, Withdraw.id, descending=True
+    )
+    result, next_cursor = next_page(
+        list((await db.execute(query)).all()), params, Withdraw.created_at, Withdraw.id
+    )
 
-    return {
-        "data": [
-            WithdrawListSchema.model_validate(i, from_attributes=True) for i in result
-        ]
-    }
+    return page_response(WithdrawListSchema, result, params, next_cursor)
 
 
 @router.get("/me/withdraws/{withdraw_id}/detail/", tags=["User-Me-Account-Withdraw"])
@@ -295,3 +389,49 @@ async def retrieve_withdraw_in_account(
 ):
 
     return {"data": WithdrawListSchema.model_validate(withdraw, from_attributes=True)}
+
+
+@router.get("/me/accounts/{account_id}/balance/", tags=["User-Me-Account"])
+async def retrieve_balance_user_me(
+    account: Account = Depends(account_that_is_relevant),
+    as_of: datetime | None = Query(default=None),
+    db: AsyncSession = Depends(get_async_read_session),
+):
+    if as_of is None:
+        balance = await db.scalar(
+            select(Account.balance).where(Account.id == account.id)
+        )
+        return {"data": {"balance": balance, "as_of": None}}
+
+    # naive UTC like the stored timestamps
+    if as_of.tzinfo is not None:
+        as_of = as_of.astimezone(timezone.utc).replace(tzinfo=None)
+
+    balance = await AccountCRUD.balance_as_of(db=db, account_id=account.id, as_of=as_of)
+    return {"data": {"balance": balance, "as_of": as_of}}
+
+
+async def _statement_rows(account_id: int):
+    # the request's session is closed before the body is streamed,
+    # so the export holds its own for as long as the client reads
+    async with read_session_local()() as db:
+        async for row in AccountCRUD.stream_statement(db=db, account_id=account_id):
+            yield row
+
+
+@router.get("/me/accounts/{account_id}/statement/", tags=["User-Me-Account"])
+async def export_statement_user_me(
+    account: Account = Depends(account_that_is_relevant),
+    format: Literal["ndjson", "csv"] = Query(default="ndjson"),
+):
+    rows = _statement_rows(account_id=account.id)
+
+    if format == "csv":
+        return StreamingResponse(
+            statement_csv(rows),
+            media_type="text/csv",
+            headers={
+                "Content-Disposition": f'attachment; filename="statement-{account.id}.csv"'
+            },
+        )
+    return StreamingResponse(statement_ndjson(rows), media_type="application/x-ndjson")
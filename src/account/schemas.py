@@ -1,6 +1,9 @@
 from datetime import datetime, timedelta
+from typing import Annotated, Literal, Union
 from uuid import UUID
-from pydantic import BaseModel, Field, ConfigDict, Extra
+from pydantic import BaseModel, Field, ConfigDict, Extra, TypeAdapter
+
+from src.config import settings
 
 
 class AccountCreateSchema(BaseModel):
@@ -18,6 +21,14 @@ class AccountListSchema(BaseModel):
     created_at: datetime | None
 
 
+class AccountStripesSchema(BaseModel):
+    # 0 turns striping off
+    stripes: int = Field(ge=0, le=64)
+
+    class Config:
+        extra = Extra.forbid
+
+
 class DepositCreateSchema(BaseModel):
     amount: int = Field(gt=100_000)
 
@@ -64,3 +75,35 @@ class WithdrawListSchema(BaseModel):
     created_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
+
+
+class DepositOperationSchema(BaseModel):
+    kind: Literal["deposit"]
+    account_id: int = Field(gt=0)
+    amount: int = Field(gt=100_000)
+
+    class Config:
+        extra = Extra.forbid
+
+
+class WithdrawOperationSchema(BaseModel):
+    kind: Literal["withdraw"]
+    account_id: int = Field(gt=0)
+    amount: int = Field(gt=100_000, lt=3_000_000)
+
+    class Config:
+        extra = Extra.forbid
+
+
+TransactionOperationSchema = Annotated[
+    Union[DepositOperationSchema, WithdrawOperationSchema],
+    Field(discriminator="kind"),
+]
+
+# the whole batch is parsed straight from the request body in one pass
+TransactionBatchAdapter = TypeAdapter(
+    Annotated[
+        list[TransactionOperationSchema],
+        Field(min_length=1, max_length=settings.TRANSACTION_BATCH_MAX),
+    ]
+)
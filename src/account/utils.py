@@ -0,0 +1,57 @@
+import csv
+import io
+import json
+from typing import AsyncIterator
+
+from sqlalchemy import Row
+
+STATEMENT_FIELDS = ("kind", "id", "amount", "created_at")
+
+# rows are buffered up to this size so the response is not written row by row
+STATEMENT_CHUNK_SIZE = 64 * 1024
+
+# columns of a cached account; the balance changes with every operation
+ACCOUNT_CACHE_EXCLUDE = ("money",)
+
+
+def account_cache_key(account_id: int) -> str:
+    return f"account:{account_id}"
+
+
+async def statement_ndjson(rows: AsyncIterator[Row]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+
+    async for row in rows:
+        json.dump(
+            {
+                "kind": row.kind,
+                "id": row.id,
+                "amount": row.amount,
+                "created_at": row.created_at.isoformat(),
+            },
+            buffer,
+        )
+        buffer.write("\n")
+
+        if buffer.tell() >= STATEMENT_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
+
+
+async def statement_csv(rows: AsyncIterator[Row]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(STATEMENT_FIELDS)
+    async for row in rows:
+        writer.writerow((row.kind, row.id, row.amount, row.created_at.isoformat()))
+
+        if buffer.tell() >= STATEMENT_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    yield buffer.getvalue()
@@ -6,6 +6,8 @@ from sqlalchemy.orm import aliased
 
 from src.auth.schemas import UserPartialUpdateSchema
 from src.auth.models import User
+from src.auth.utils import invalidate_principal
+from src.dependencies import PageParams, keyset_paginate, next_page
 
 
 class UserCRUD:
@@ -31,10 +33,7 @@ class UserCRUD:
             )
 
     @staticmethod
-    async def list_users(db: AsyncSession, page: int = 1, size: int = 10) -> list:
-        offset = (page - 1) * size
-        limit = size
-
+    async def list_users(db: AsyncSession, params: PageParams) -> tuple[list, str | None]:
         u1 = aliased(User)
         query = (
             select(
@@ -48,14 +47,12 @@ class UserCRUD:
                 u1.updated_at,
             )
             .select_from(u1)
-            .offset(offset)
-            .limit(limit)
-            .order_by(u1.id)
         )
+        query = keyset_paginate(query, params, u1.id)
 
         result = (await db.execute(query)).all()
 
-        return list(result)
+        return next_page(list(result), params, u1.id)
 
     @staticmethod
     async def retrieve_user(db: AsyncSession, user_id: int) -> User | None:
@@ -76,6 +73,7 @@ class UserCRUD:
 
             # db.add(user)
             await db.commit()
+            await invalidate_principal(user.id)
             return user
         except IntegrityError as e:
             await db.rollback()
@@ -89,8 +87,10 @@ class UserCRUD:
 
     @staticmethod
     async def delete_user(db: AsyncSession, user: User) -> None:
+        user_id = user.id
         await db.delete(user)
         await db.commit()
+        await invalidate_principal(user_id)
         return None
 
     # @staticmethod
@@ -4,7 +4,7 @@ from typing import Annotated
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
-from src.auth.utils import validate_password, decode_jwt
+from src.auth.utils import validate_password_async, decode_jwt
 from src.database import get_async_session
 from src.auth.models import User
 from src.auth.crud import UserCRUD
@@ -41,7 +41,7 @@ async def validate_user(
 
     else:
 
-        if not validate_password(password, user.hashed_password):
+        if not await validate_password_async(password, user.hashed_password):
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="incorrect password",
@@ -14,16 +14,16 @@ if TYPE_CHECKING:
 created_at = Annotated[
     datetime,
     mapped_column(
-        default=datetime.now(),
+        default=datetime.utcnow,
         server_default=text("TIMEZONE('utc', now())"),
     ),
 ]
 updated_at = Annotated[
     datetime,
     mapped_column(
-        default=datetime.now(),
+        default=datetime.utcnow,
         server_default=text("TIMEZONE('utc', now())"),
-        onupdate=datetime.now(),
+        onupdate=datetime.utcnow,
     ),
 ]
 
@@ -32,7 +32,7 @@ class User(Base):
     __tablename__ = "user"
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(100), nullable=False)
-    email: Mapped[str] = mapped_column(nullable=False)
+    email: Mapped[str] = mapped_column(nullable=False, index=True)
     phone_number: Mapped[str] = mapped_column(String(13), nullable=False)
     hashed_password: Mapped[str] = mapped_column(LargeBinary)
     accounts_number: Mapped[int | None] = mapped_column(default=0, nullable=True)
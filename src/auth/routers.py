@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from fastapi.security import (
     HTTPBearer,
     HTTPAuthorizationCredentials,
 )
-from jwt.exceptions import ExpiredSignatureError, DecodeError
+from jwt.exceptions import ExpiredSignatureError, InvalidTokenError
 
 
 from src.auth.models import User
@@ -13,23 +14,34 @@ from src.auth.schemas import (
     UserCreateSchema,
     UserListSchema,
     UserPartialUpdateSchema,
+    UserAuthSchema,
     TokenInfo,
 )
 from src.auth.utils import (
-    hash_password,
+    hash_password_async,
     generate_validation_code,
     store_validation_code,
     retrieve_validation_code,
     encode_jwt,
     decode_jwt,
+    decode_jwt_cached,
+    get_cached_principal,
+    cache_principal,
+    invalidate_principal,
+    principal_generation,
+    signing_key_ring,
 )
 from src.auth.crud import UserCRUD
-from src.database import get_async_session
+from src.config import settings
+from src.database import get_async_session, get_async_read_session
+from src.dependencies import CursorPage, PageParams, pagination_params, page_response
 from src.auth.dependencies import retrieve_user_dependency, validate_user
+from src.outbox import enqueue
 
 from src.tasks.tasks import send_email
 
 router = APIRouter(prefix="/user")
+well_known_router = APIRouter(prefix="/.well-known")
 
 http_bearer = HTTPBearer()
 
@@ -61,6 +73,16 @@ async def issue_access_token(
     )
 
 
+@well_known_router.get("/jwks.json", tags=["Tokens"])
+async def jwks():
+    return JSONResponse(
+        content=signing_key_ring.jwks,
+        headers={
+            "Cache-Control": f"public, max-age={settings.AUTH_JWT.jwks_max_age_seconds}"
+        },
+    )
+
+
 @router.post("/refresh_token/", tags=["Tokens"])
 async def issue_refresh_token(
     credentials: HTTPAuthorizationCredentials = Depends(http_bearer),
@@ -89,7 +111,7 @@ async def issue_refresh_token(
 
     except ExpiredSignatureError:
         raise HTTPException(status_code=401, detail=f"refresh token is expired")
-    except DecodeError:
+    except InvalidTokenError:
         raise HTTPException(status_code=401, detail="refresh token invalid")
 
 
@@ -99,21 +121,34 @@ async def issue_refresh_token(
 async def get_curr_auth_user(
     credentials: HTTPAuthorizationCredentials = Depends(http_bearer),
     db: AsyncSession = Depends(get_async_session),
-) -> User | None:
+) -> UserAuthSchema:
     try:
         token = credentials.credentials
-        payload = decode_jwt(token)
+        payload = decode_jwt_cached(token)
         user_id = payload.get("sub")
-        user = await db.get(User, user_id)
-        return user
 
     except ExpiredSignatureError:
         raise HTTPException(status_code=401, detail=f"token is expired")
-    except DecodeError:
+    except InvalidTokenError:
         raise HTTPException(status_code=401, detail="invalid token")
 
+    principal = await get_cached_principal(user_id)
+    if principal is not None:
+        return principal
+
+    generation = await principal_generation(user_id)
+    user = await db.get(User, user_id)
+    if not user:
+        raise HTTPException(status_code=401, detail="user of the token does not exist")
+
+    principal = UserAuthSchema.model_validate(user, from_attributes=True)
+    await cache_principal(principal, generation)
+    return principal
 
-def get_active_auth_user(user: User = Depends(get_curr_auth_user)) -> User:
+
+def get_active_auth_user(
+    user: UserAuthSchema = Depends(get_curr_auth_user),
+) -> UserAuthSchema:
     if user.is_active:
         return user
     raise HTTPException(
@@ -122,7 +157,9 @@ def get_active_auth_user(user: User = Depends(get_curr_auth_user)) -> User:
     )
 
 
-def get_teller_auth_user(user: User = Depends(get_active_auth_user)) -> User:
+def get_teller_auth_user(
+    user: UserAuthSchema = Depends(get_active_auth_user),
+) -> UserAuthSchema:
     if user.is_teller:
         return user
     raise HTTPException(
@@ -131,7 +168,9 @@ def get_teller_auth_user(user: User = Depends(get_active_auth_user)) -> User:
     )
 
 
-def get_super_user(user: User = Depends(get_active_auth_user)) -> User:
+def get_super_user(
+    user: UserAuthSchema = Depends(get_active_auth_user),
+) -> UserAuthSchema:
     if user.is_superuser:
         return user
     raise HTTPException(
@@ -140,6 +179,20 @@ def get_super_user(user: User = Depends(get_active_auth_user)) -> User:
     )
 
 
+async def get_active_auth_user_instance(
+    user: UserAuthSchema = Depends(get_active_auth_user),
+    db: AsyncSession = Depends(get_async_session),
+) -> User:
+    """
+    Loads the authenticated user from the database, for endpoints that
+    modify it or need columns the cached snapshot doesn't carry.
+    """
+    result = await db.get(User, user.id)
+    if not result:
+        raise HTTPException(status_code=401, detail="user of the token does not exist")
+    return result
+
+
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~ROUTERS~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
 @router.post("/create/", status_code=201, tags=["User"])
 async def create_user(
@@ -147,7 +200,7 @@ async def create_user(
 ):
     data = user_schema.model_dump()
     password = data.pop("password")
-    data.update({"hashed_password": hash_password(password)})
+    data.update({"hashed_password": await hash_password_async(password)})
 
     result = await UserCRUD.create_user(user_data=data, db=db)
 
@@ -157,27 +210,20 @@ async def create_user(
     }
 
 
-@router.get("/list/", tags=["User"])
+@router.get("/list/", tags=["User"], response_model=CursorPage[UserListSchema])
 async def list_users(
-    teller: User = Depends(get_teller_auth_user),
-    db: AsyncSession = Depends(get_async_session),
-    page: int = Query(1, ge=1),
-    size: int = Query(10, ge=1),
+    teller: UserAuthSchema = Depends(get_teller_auth_user),
+    db: AsyncSession = Depends(get_async_read_session),
+    params: PageParams = Depends(pagination_params),
 ):
-    result = await UserCRUD.list_users(db=db, page=page, size=size)
+    result, next_cursor = await UserCRUD.list_users(db=db, params=params)
 
-    return {
-        "page": page,
-        "size": size,
-        "data": [
-            UserListSchema.model_validate(user, from_attributes=True) for user in result
-        ],
-    }
+    return page_response(UserListSchema, result, params, next_cursor)
 
 
 @router.get("/retrieve/{user_id}/", tags=["User"])
 async def retrieve_user(
-    teller: User = Depends(get_teller_auth_user),
+    teller: UserAuthSchema = Depends(get_teller_auth_user),
     user: User = Depends(retrieve_user_dependency),
 ):
     return {
@@ -190,7 +236,7 @@ async def partial_update_user(
     user_schema: UserPartialUpdateSchema,
     db: AsyncSession = Depends(get_async_session),
     user: User = Depends(retrieve_user_dependency),
-    teller: User = Depends(get_teller_auth_user),
+    teller: UserAuthSchema = Depends(get_teller_auth_user),
 ):
     result = await UserCRUD.partial_update_user(
         db=db, user_schema=user_schema, user=user
@@ -204,7 +250,7 @@ async def partial_update_user(
 async def delete_user(
     user: User = Depends(retrieve_user_dependency),
     db: AsyncSession = Depends(get_async_session),
-    teller: User = Depends(get_teller_auth_user),
+    teller: UserAuthSchema = Depends(get_teller_auth_user),
 ):
     await UserCRUD.delete_user(db=db, user=user)
     return None
@@ -212,7 +258,7 @@ async def delete_user(
 
 @router.get("/me/", tags=["User-Me"])
 async def retrieve_user_me(
-    user: User = Depends(get_active_auth_user),
+    user: User = Depends(get_active_auth_user_instance),
 ):
     return {"data": UserListSchema.model_validate(user, from_attributes=True)}
 
@@ -221,7 +267,7 @@ async def retrieve_user_me(
 async def update_user_me(
     user_schema: UserPartialUpdateSchema,
     db: AsyncSession = Depends(get_async_session),
-    user: User = Depends(get_active_auth_user),
+    user: User = Depends(get_active_auth_user_instance),
 ):
     result = await UserCRUD.partial_update_user(
         db=db, user_schema=user_schema, user=user
@@ -231,7 +277,7 @@ async def update_user_me(
 
 @router.delete("/me/delete/", status_code=201, tags=["User-Me"])
 async def delete_user_me(
-    user: User = Depends(get_active_auth_user),
+    user: User = Depends(get_active_auth_user_instance),
     db: AsyncSession = Depends(get_async_session),
 ):
     await UserCRUD.delete_user(db=db, user=user)
@@ -240,49 +286,49 @@ async def delete_user_me(
 
 @router.get("/me/loans/{loan_id}/", tags=["User-Me-Loan"])
 async def retrieve_loan_user_me(
-    user: User = Depends(get_active_auth_user),
+    user: UserAuthSchema = Depends(get_active_auth_user),
 ):
     pass
 
 
 @router.get("/me/loans/{loan_id}/compensations/list/", tags=["User-Me-Loan"])
 async def list_loan_compensations_user_me(
-    user: User = Depends(get_active_auth_user),
+    user: UserAuthSchema = Depends(get_active_auth_user),
 ):
     pass
 
 
 @router.post("/me/loans/{loan_id}/compensations/create/", tags=["User-Me-Loan"])
 async def create_loan_compensation_user_me(
-    user: User = Depends(get_active_auth_user),
+    user: UserAuthSchema = Depends(get_active_auth_user),
 ):
     pass
 
 
 @router.get("/me/compensations/{compensation_id}/detail/", tags=["User-Me-Loan"])
 async def retrieve_compensations_user_me(
-    user: User = Depends(get_active_auth_user),
+    user: UserAuthSchema = Depends(get_active_auth_user),
 ):
     pass
 
 
 @router.get("/me/{bank_id}/loan_types/list/", tags=["User-Me-Loan-Type"])
 async def list_loan_types_user_me(
-    user: User = Depends(get_active_auth_user),
+    user: UserAuthSchema = Depends(get_active_auth_user),
 ):
     pass
 
 
 @router.get("/me//loan_types/{loan_type_id}/detail/", tags=["User-Me-Loan-Type"])
 async def retrieve_loan_types_user_me(
-    user: User = Depends(get_active_auth_user),
+    user: UserAuthSchema = Depends(get_active_auth_user),
 ):
     pass
 
 
 @router.post("/activate/", tags=["User"])
 async def activate_user(
-    user_in: User = Depends(get_curr_auth_user),
+    user_in: UserAuthSchema = Depends(get_curr_auth_user),
     db: AsyncSession = Depends(get_async_session),
 ):
     email_in = user_in.email
@@ -291,10 +337,11 @@ async def activate_user(
     if not user.is_active:
 
         validation_code = generate_validation_code()
-        store_validation_code(
+        await store_validation_code(
             email_in, validation_code, expiration_time=600
         )  # Set expiration time (in seconds)
-        send_email.delay(email_in, validation_code, name=user.name)
+        enqueue(db, send_email.name, email_in, validation_code, name=user.name)
+        await db.commit()
 
         return {"message": f"Verification code has been sent to {email_in}"}
 
@@ -309,7 +356,7 @@ async def activate_user(
 @router.post("/validate/activation_code/", tags=["User"])
 async def validate_activation_code(
     code: str,
-    user_in: User = Depends(get_curr_auth_user),
+    user_in: UserAuthSchema = Depends(get_curr_auth_user),
     db: AsyncSession = Depends(get_async_session),
 ):
     email_in = user_in.email
@@ -322,10 +369,11 @@ async def validate_activation_code(
         )
 
     if not user.is_active:
-        stored_code = retrieve_validation_code(email_in)
+        stored_code = await retrieve_validation_code(email_in)
         if stored_code.decode("utf-8") == code:
             user.is_active = True
             await db.commit()
+            await invalidate_principal(user.id)
             return {"message": "User is activated!"}
         else:
             raise HTTPException(
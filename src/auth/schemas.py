@@ -63,6 +63,22 @@ class UserListSchema(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
+class UserAuthSchema(BaseModel):
+    """
+    Slim snapshot of the authenticated user used by permission dependencies.
+    It is cached per worker and in Redis, so it never carries hashed_password.
+    """
+
+    id: int
+    name: str
+    email: str
+    is_active: bool | None = False
+    is_superuser: bool | None = False
+    is_teller: bool | None = False
+
+    model_config = ConfigDict(from_attributes=True)
+
+
 class UserPartialUpdateSchema(BaseModel):
 
     name: str | None = Field(max_length=100, default=None)
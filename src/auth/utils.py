@@ -1,14 +1,28 @@
+import asyncio
+import hashlib
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any
+
 import bcrypt
-from src.config import settings
+from cryptography.hazmat.primitives.serialization import (
+    load_pem_private_key,
+    load_pem_public_key,
+)
+from fastapi import HTTPException, status
+from redis.exceptions import RedisError, WatchError
+
+from src.auth.schemas import UserAuthSchema
+from src.cache import LRUCache
+from src.config import settings, SigningKey
+from src.redis_client import get_redis
 import datetime
 import jwt
-
+from jwt.algorithms import get_default_algorithms
+from jwt.exceptions import DecodeError
 
 import random
 import string
-import redis
-
-redis_client = redis.StrictRedis(host=f"{settings.REDIS_HOST}", port=6379, db=0)
 
 
 # hashing password
@@ -31,10 +45,121 @@ def validate_password(
     )
 
 
+def create_hashing_executor() -> Executor:
+    config = settings.PASSWORD_HASHING
+    if config.executor == "process":
+        return ProcessPoolExecutor(max_workers=config.max_workers)
+    return ThreadPoolExecutor(
+        max_workers=config.max_workers,
+        thread_name_prefix="bcrypt",
+    )
+
+
+hashing_executor = create_hashing_executor()
+
+# jobs submitted to the executor and not finished yet (running + waiting)
+_hashing_jobs_in_flight = 0
+
+
+async def _run_in_hashing_executor(func, *args):
+    global _hashing_jobs_in_flight
+
+    config = settings.PASSWORD_HASHING
+    if _hashing_jobs_in_flight >= config.max_workers + config.max_queue_depth:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy. Try again later",
+            headers={"Retry-After": "1"},
+        )
+
+    loop = asyncio.get_running_loop()
+    job = hashing_executor.submit(func, *args)
+    _hashing_jobs_in_flight += 1
+    # counted until the job itself is done: a cancelled caller doesn't stop it.
+    # The callback runs on an executor thread, so it hands over to the loop
+    job.add_done_callback(lambda _: loop.call_soon_threadsafe(_hashing_job_done))
+    return await asyncio.wrap_future(job)
+
+
+def _hashing_job_done() -> None:
+    global _hashing_jobs_in_flight
+    _hashing_jobs_in_flight -= 1
+
+
+# hashing password without blocking the event loop
+async def hash_password_async(password: str) -> bytes:
+    return await _run_in_hashing_executor(hash_password, password)
+
+
+# validating password without blocking the event loop
+async def validate_password_async(
+    password: str,
+    hashed_password: bytes,
+) -> bool:
+    return await _run_in_hashing_executor(validate_password, password, hashed_password)
+
+
+class SigningKeyRing:
+    """
+    Keys are parsed once at startup and looked up by the `kid` header,
+    so rotating is: add the new key, switch `active_kid`, then drop the
+    old private key once the tokens it signed have expired.
+    """
+
+    def __init__(self, keys: list[SigningKey], active_kid: str) -> None:
+        self._keys: dict[str, tuple[str, Any, Any]] = {}
+
+        for key in keys:
+            private_key = None
+            if key.private_key_path is not None:
+                private_key = load_pem_private_key(
+                    key.private_key_path.read_bytes(), password=None
+                )
+            public_key = load_pem_public_key(key.public_key_path.read_bytes())
+            self._keys[key.kid] = (key.algorithm, private_key, public_key)
+
+        if active_kid not in self._keys or self._keys[active_kid][1] is None:
+            raise ValueError(f"signing key '{active_kid}' has no private key")
+
+        self.active_kid = active_kid
+        self.fallback_kid = keys[0].kid
+        self.jwks = {"keys": [self._to_jwk(kid) for kid in self._keys]}
+
+    def _to_jwk(self, kid: str) -> dict:
+        algorithm, _, public_key = self._keys[kid]
+        jwk = get_default_algorithms()[algorithm].to_jwk(public_key, as_dict=True)
+        jwk.update(kid=kid, alg=algorithm, use="sig")
+        return jwk
+
+    def sign(self, payload: dict) -> str:
+        algorithm, private_key, _ = self._keys[self.active_kid]
+        return jwt.encode(
+            payload,
+            private_key,
+            algorithm=algorithm,
+            headers={"kid": self.active_kid},
+        )
+
+    def verify(self, jwt_token: str | bytes) -> dict:
+        kid = jwt.get_unverified_header(jwt_token).get("kid", self.fallback_kid)
+        if kid not in self._keys:
+            raise DecodeError(f"unknown signing key '{kid}'")
+
+        algorithm, _, public_key = self._keys[kid]
+        # cached verifications expire with the token, so it has to have one
+        return jwt.decode(
+            jwt_token, public_key, algorithms=[algorithm], options={"require": ["exp"]}
+        )
+
+
+signing_key_ring = SigningKeyRing(
+    keys=settings.AUTH_JWT.signing_keys,
+    active_kid=settings.AUTH_JWT.active_kid,
+)
+
+
 def encode_jwt(
     payload: dict,
-    private_key: str = settings.AUTH_JWT.private_key_path.read_text(),
-    algorith: str = settings.AUTH_JWT.algorith,
     expire_minutes: int = settings.AUTH_JWT.access_token_exp_minutes,
 ):
     now = datetime.datetime.now(datetime.timezone.utc)
@@ -48,23 +173,134 @@ def encode_jwt(
         iat=now,
     )
 
-    encoded = jwt.encode(
-        to_encode,
-        private_key,
-        algorithm=algorith,
+    return signing_key_ring.sign(to_encode)
+
+
+def decode_jwt(jwt_token: str | bytes) -> dict:
+    return signing_key_ring.verify(jwt_token)
+
+
+verified_token_cache = LRUCache(
+    name="verified_token",
+    maxsize=settings.AUTH_JWT.token_cache_size,
+)
+
+
+# decoding jwt, skipping signature verification for tokens verified before
+def decode_jwt_cached(jwt_token: str) -> dict:
+    key = hashlib.sha256(jwt_token.encode()).digest()
+
+    payload = verified_token_cache.get(key)
+    if payload is None:
+        payload = decode_jwt(jwt_token)
+        verified_token_cache.set(key, payload, expires_at=payload["exp"])
+
+    return payload
+
+
+principal_cache = LRUCache(
+    name="principal",
+    maxsize=settings.AUTH_JWT.principal_cache_size,
+)
+
+
+def _principal_key(user_id: int) -> str:
+    return f"principal:{user_id}"
+
+
+def _principal_generation_key(user_id: int) -> str:
+    return f"principal:{user_id}:generation"
+
+
+# bumped by invalidate_principal; a snapshot loaded across it isn't kept locally
+_principal_invalidations = 0
+# the Redis generation couldn't be read, so the snapshot isn't stored there
+_UNREAD = object()
+
+
+# Retrieve auth snapshot of a user: worker memory first, then Redis
+async def get_cached_principal(user_id: int) -> UserAuthSchema | None:
+    principal = principal_cache.get(user_id)
+    if principal is not None:
+        return principal
+
+    try:
+        raw = await get_redis().get(_principal_key(user_id))
+    except RedisError:
+        return None
+
+    if raw is None:
+        return None
+
+    principal = UserAuthSchema.model_validate_json(raw)
+    principal_cache.set(
+        user_id,
+        principal,
+        expires_at=time.time() + settings.AUTH_JWT.principal_cache_local_ttl_seconds,
     )
+    return principal
 
-    return encoded
 
+# Read before loading a user from the database, then pass it to cache_principal
+async def principal_generation(user_id: int) -> tuple[int, Any]:
+    try:
+        generation = await get_redis().get(_principal_generation_key(user_id))
+    except (RedisError, RuntimeError):
+        generation = _UNREAD
+    return _principal_invalidations, generation
 
-def decode_jwt(
-    jwt_token: str | bytes,
-    public_key: str = settings.AUTH_JWT.public_key_path.read_text(),
-    algorith: str = settings.AUTH_JWT.algorith,
-):
-    decoded = jwt.decode(jwt_token, public_key, algorithms=[algorith])
 
-    return decoded
+# Store auth snapshot of a user in both cache levels, unless it was
+# invalidated since `generation` was read
+async def cache_principal(
+    principal: UserAuthSchema, generation: tuple[int, Any]
+) -> None:
+    invalidations, redis_generation = generation
+    generation_key = _principal_generation_key(principal.id)
+
+    if redis_generation is not _UNREAD:
+        try:
+            async with get_redis().pipeline() as pipe:
+                await pipe.watch(generation_key)
+                if await pipe.get(generation_key) != redis_generation:
+                    return
+                pipe.multi()
+                pipe.set(
+                    _principal_key(principal.id),
+                    principal.model_dump_json(),
+                    ex=settings.AUTH_JWT.principal_cache_ttl_seconds,
+                )
+                await pipe.execute()
+        except WatchError:
+            return
+        except RedisError:
+            pass
+
+    if invalidations == _principal_invalidations:
+        principal_cache.set(
+            principal.id,
+            principal,
+            expires_at=time.time() + settings.AUTH_JWT.principal_cache_local_ttl_seconds,
+        )
+
+
+# Drop auth snapshot of a user after its permissions or identity change
+async def invalidate_principal(user_id: int) -> None:
+    global _principal_invalidations
+
+    _principal_invalidations += 1
+    principal_cache.delete(user_id)
+    try:
+        async with get_redis().pipeline(transaction=False) as pipe:
+            pipe.incr(_principal_generation_key(user_id))
+            pipe.expire(
+                _principal_generation_key(user_id),
+                settings.AUTH_JWT.principal_cache_ttl_seconds,
+            )
+            pipe.delete(_principal_key(user_id))
+            await pipe.execute()
+    except RedisError:
+        pass
 
 
 def generate_validation_code():
@@ -72,10 +308,10 @@ def generate_validation_code():
 
 
 # Store validation code in Redis with expiration time
-def store_validation_code(email, validation_code, expiration_time):
-    redis_client.setex(email, expiration_time, validation_code)
+async def store_validation_code(email, validation_code, expiration_time):
+    await get_redis().setex(email, expiration_time, validation_code)
 
 
 # Retrieve validation code from Redis
-def retrieve_validation_code(email):
-    return redis_client.get(email)
+async def retrieve_validation_code(email):
+    return await get_redis().get(email)
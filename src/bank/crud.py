@@ -5,12 +5,17 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy import select
 from sqlalchemy.orm import selectinload, joinedload
+from sqlalchemy.orm.attributes import set_committed_value
 
 from src.auth.models import User
+from src.loan.models import LoanType
+from src.dependencies import PageParams, keyset_paginate, next_page
 from src.bank.schemas import (
     BankCreateSchema,
     BankPartialUpdateSchema,
 )
+from src.bank.utils import bank_tag, invalidate_bank
+from src.cache import orm_restore, orm_snapshot, resource_cache
 from src.bank.models import (
     Bank,
     BankUserAssociation,
@@ -27,6 +32,8 @@ class BankCRUD:
 
             db.add(new_bank)
             await db.commit()
+            # also drops a cached "not found" of the id
+            await invalidate_bank(new_bank.id)
 
             return new_bank
         except IntegrityError:
@@ -38,34 +45,19 @@ class BankCRUD:
     @staticmethod
     async def list_banks(
         db: AsyncSession,
-        page: int = 1,
-        size: int = 10,
+        params: PageParams,
         name_i_contains: str | None = None,
-    ) -> list:
-        offset = (page - 1) * size
-        limit = size
-
-        if name_i_contains is None:
-            query = (
-                select(Bank)
-                .options(joinedload(Bank.loan_types))
-                .order_by(Bank.id)
-                .offset(offset)
-                .limit(limit)
-            )
-        else:
-            query = (
-                select(Bank)
-                .options(joinedload(Bank.loan_types))
-                .where(Bank.name.icontains(f"%{name_i_contains}%"))
-                .order_by(Bank.id)
-                .offset(offset)
-                .limit(limit)
-            )
+    ) -> tuple[list, str | None]:
+        query = select(Bank).options(joinedload(Bank.loan_types))
+
+        if name_i_contains is not None:
+            query = query.where(Bank.name.icontains(f"%{name_i_contains}%"))
+
+        query = keyset_paginate(query, params, Bank.id)
 
         result = (await db.execute(query)).unique().scalars().all()
 
-        return list(result)
+        return next_page(list(result), params, Bank.id)
 
     @staticmethod
     async def retrieve_bank(db: AsyncSession, bank_id: UUID) -> Bank | None:
@@ -77,6 +69,34 @@ class BankCRUD:
 
         return result
 
+    @staticmethod
+    async def retrieve_bank_cached(db: AsyncSession, bank_id: UUID) -> Bank | None:
+        """
+        `retrieve_bank` served from the resource cache. The bank and its loan
+        types are merged into `db` without a query, so they can be updated.
+        """
+
+        async def load():
+            bank = await BankCRUD.retrieve_bank(db=db, bank_id=bank_id)
+            if bank is None:
+                return None
+            return {
+                **orm_snapshot(bank),
+                "loan_types": [orm_snapshot(i) for i in bank.loan_types],
+            }
+
+        snapshot = await resource_cache.get_or_load(bank_tag(bank_id), load)
+        if snapshot is None:
+            return None
+
+        bank = orm_restore(Bank, snapshot)
+        set_committed_value(
+            bank,
+            "loan_types",
+            [orm_restore(LoanType, i) for i in snapshot["loan_types"]],
+        )
+        return await db.merge(bank, load=False)
+
     @staticmethod
     async def retrieve_bank_with_users(db: AsyncSession, bank_id: UUID) -> Bank | None:
         query = select(Bank).options(selectinload(Bank.users)).where(Bank.id == bank_id)
@@ -96,6 +116,7 @@ class BankCRUD:
 
             # db.add(bank)
             await db.commit()
+            await invalidate_bank(bank.id)
             return bank
         except IntegrityError as e:
             await db.rollback()
@@ -109,12 +130,16 @@ class BankCRUD:
 
     @staticmethod
     async def delete_bank(db: AsyncSession, bank: Bank) -> None:
+        bank_id = bank.id
         await db.delete(bank)
         await db.commit()
+        await invalidate_bank(bank_id)
         return None
 
     @staticmethod
-    async def list_users_of_bank(db: AsyncSession, bank: Bank) -> list:
+    async def list_users_of_bank(
+        db: AsyncSession, bank: Bank, params: PageParams
+    ) -> tuple[list, str | None]:
         query = (
             select(
                 User.id,
@@ -128,9 +153,9 @@ class BankCRUD:
             )
             .select_from(User)
             .join(BankUserAssociation, BankUserAssociation.user_id == User.id)
-            .join(Bank, BankUserAssociation.bank_id == bank.id)
+            .where(BankUserAssociation.bank_id == bank.id)
         )
+        query = keyset_paginate(query, params, User.id)
 
-        result = await db.execute(query)
-        objs = result.unique().all()
-        return list(objs)
+        result = (await db.execute(query)).all()
+        return next_page(list(result), params, User.id)
@@ -15,7 +15,10 @@ async def retrieve_bank_with_users_dependency(
     bank_id: UUID,
     db: AsyncSession = Depends(get_async_session),
 ) -> Bank:
-    result = await BankCRUD.retrieve_bank_with_users(db=db, bank_id=bank_id)
+    # the members change too often to be cached, but a missing bank is
+    result = None
+    if await BankCRUD.retrieve_bank_cached(db=db, bank_id=bank_id) is not None:
+        result = await BankCRUD.retrieve_bank_with_users(db=db, bank_id=bank_id)
     if not result:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -28,7 +31,7 @@ async def retrieve_bank_dependency(
     bank_id: UUID,
     db: AsyncSession = Depends(get_async_session),
 ) -> Bank:
-    result = await BankCRUD.retrieve_bank(db=db, bank_id=bank_id)
+    result = await BankCRUD.retrieve_bank_cached(db=db, bank_id=bank_id)
     if not result:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -18,15 +18,15 @@ if TYPE_CHECKING:
 created_at = Annotated[
     datetime,
     mapped_column(
-        default=datetime.now(), server_default=text("TIMEZONE('utc', now())")
+        default=datetime.utcnow, server_default=text("TIMEZONE('utc', now())")
     ),
 ]
 updated_at = Annotated[
     datetime,
     mapped_column(
-        default=datetime.now(),
+        default=datetime.utcnow,
         server_default=text("TIMEZONE('utc', now())"),
-        onupdate=datetime.now(),
+        onupdate=datetime.utcnow,
     ),
 ]
 
@@ -52,7 +52,7 @@ class BankUserAssociation(Base):
     __tablename__ = "bank_user_association"
     id: Mapped[int] = mapped_column(primary_key=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
-    bank_id: Mapped[int] = mapped_column(ForeignKey("bank.id"))
+    bank_id: Mapped[int] = mapped_column(ForeignKey("bank.id"), index=True)
 
     __table_args__ = (
         UniqueConstraint("user_id", "bank_id", name="unique_user_bank_combination"),
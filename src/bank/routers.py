@@ -1,17 +1,23 @@
-import time
+import json
 from uuid import UUID
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, Request, status, Query
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 from sqlalchemy import select, and_
 from sqlalchemy.orm import joinedload
-from fastapi_cache.decorator import cache
 
 
 from src.auth.models import User
-from src.auth.schemas import UserListSchema
-from src.database import get_async_session
+from src.auth.schemas import UserListSchema, UserAuthSchema
+from src.database import get_async_session, get_async_read_session
+from src.membership import membership_index
+from src.dependencies import (
+    PageParams,
+    pagination_params,
+    keyset_paginate,
+    next_page,
+)
 
 from src.bank.schemas import (
     BankCreateSchema,
@@ -20,6 +26,7 @@ from src.bank.schemas import (
     BankPartialUpdateSchema,
 )
 from src.bank.crud import BankCRUD
+from src.bank.utils import BANK_LIST_TAG, bank_cache, bank_tag
 from src.bank.models import Bank, BankUserAssociation
 from src.bank.dependencies import (
     retrieve_bank_with_users_dependency,
@@ -28,6 +35,7 @@ from src.bank.dependencies import (
 from src.auth.routers import (
     retrieve_user_dependency,
     get_active_auth_user,
+    get_active_auth_user_instance,
     get_teller_auth_user,
     get_super_user
 )
@@ -38,17 +46,10 @@ router = APIRouter(prefix="/bank")
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~PERMISSIONS~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~#
 async def bank_id_that_is_relevant(
     bank_id: UUID,
-    user: User = Depends(get_active_auth_user),
+    user: UserAuthSchema = Depends(get_active_auth_user),
     db: AsyncSession = Depends(get_async_session),
 ) -> UUID:
-    query = select(BankUserAssociation).where(
-        and_(
-            BankUserAssociation.user_id == user.id,
-            BankUserAssociation.bank_id == bank_id,
-        ),
-    )
-    result = await db.scalar(query)
-    if result:
+    if await membership_index.is_member(db, "bank", user.id, bank_id):
         return bank_id
     raise HTTPException(
         status_code=404,
@@ -61,7 +62,7 @@ async def bank_id_that_is_relevant(
 async def create_bank(
     bank_schema: BankCreateSchema,
     db: AsyncSession = Depends(get_async_session),
-    super_user: User = Depends(get_super_user),
+    super_user: UserAuthSchema = Depends(get_super_user),
 ):
     result = await BankCRUD.create_bank(db=db, bank_schema=bank_schema)
     return {
@@ -71,25 +72,50 @@ async def create_bank(
 
 
 @router.get("/list/", tags=["Bank"])
-@cache(expire=180)
 async def list_banks(
-    page: int = Query(default=1, ge=1),
-    size: int = Query(default=10, ge=1),
+    request: Request,
+    params: PageParams = Depends(pagination_params),
     name_i_contains: str | None = Query(default=None),
+    # cache fills read the primary: a lagging replica would cache a pre-write page
     db: AsyncSession = Depends(get_async_session),
 ):
-    result = await BankCRUD.list_banks(
-        db=db, page=page, size=size, name_i_contains=name_i_contains
+    async def compute():
+        result, next_cursor = await BankCRUD.list_banks(
+            db=db, params=params, name_i_contains=name_i_contains
+        )
+        return {
+            "size": params.size,
+            "next_cursor": next_cursor,
+            "data": [
+                BankListSchema.model_validate(i, from_attributes=True) for i in result
+            ],
+        }
+
+    return await bank_cache.get_or_render(
+        request=request,
+        key="list:"
+        + json.dumps([params.after, params.size, name_i_contains], default=str),
+        tags=[BANK_LIST_TAG],
+        compute=compute,
     )
-    time.sleep(2)
-    return {
-        "data": [BankListSchema.model_validate(i, from_attributes=True) for i in result]
-    }
 
 
 @router.get("/retrieve/{bank_id}/", tags=["Bank"])
-async def retrieve_bank(bank: Bank = Depends(retrieve_bank_dependency)):
-    return {"data": BankListSchema.model_validate(bank, from_attributes=True)}
+async def retrieve_bank(
+    request: Request,
+    bank_id: UUID,
+    db: AsyncSession = Depends(get_async_session),
+):
+    async def compute():
+        bank = await retrieve_bank_dependency(bank_id=bank_id, db=db)
+        return {"data": BankListSchema.model_validate(bank, from_attributes=True)}
+
+    return await bank_cache.get_or_render(
+        request=request,
+        key=f"retrieve:{bank_id}",
+        tags=[bank_tag(bank_id)],
+        compute=compute,
+    )
 
 
 @router.patch("/update/{bank_id}/", tags=["Bank"])
@@ -97,7 +123,7 @@ async def partial_update_bank(
     bank_schema: BankPartialUpdateSchema,
     bank: Bank = Depends(retrieve_bank_dependency),
     db: AsyncSession = Depends(get_async_session),
-    teller: User = Depends(get_teller_auth_user),
+    teller: UserAuthSchema = Depends(get_teller_auth_user),
 ):
     result = await BankCRUD.partial_update_bank(
         db=db,
@@ -112,12 +138,13 @@ async def add_user_to_bank(
     bank: Bank = Depends(retrieve_bank_with_users_dependency),
     user: User = Depends(retrieve_user_dependency),
     db: AsyncSession = Depends(get_async_session),
-    teller: User = Depends(get_teller_auth_user),
+    teller: UserAuthSchema = Depends(get_teller_auth_user),
 ):
     try:
         if user.is_active:
             bank.users.append(user)
             await db.commit()
+            await membership_index.add("bank", user.id, bank.id)
         else:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -138,12 +165,16 @@ async def add_user_to_bank(
 @router.get("/{bank_id}/user/list/", tags=["Bank~User"])
 async def list_users_in_bank(
     bank: Bank = Depends(retrieve_bank_dependency),
-    db: AsyncSession = Depends(get_async_session),
-    teller: User = Depends(get_teller_auth_user),
+    db: AsyncSession = Depends(get_async_read_session),
+    teller: UserAuthSchema = Depends(get_teller_auth_user),
+    params: PageParams = Depends(pagination_params),
 ):
-    result = await BankCRUD.list_users_of_bank(db=db, bank=bank)
-    print(result)
+    result, next_cursor = await BankCRUD.list_users_of_bank(
+        db=db, bank=bank, params=params
+    )
     return {
+        "size": params.size,
+        "next_cursor": next_cursor,
         "data": [UserListSchema.model_validate(i, from_attributes=True) for i in result]
     }
 
@@ -157,11 +188,12 @@ async def delete_user_from_bank(
     bank: Bank = Depends(retrieve_bank_with_users_dependency),
     user: User = Depends(retrieve_user_dependency),
     db: AsyncSession = Depends(get_async_session),
-    teller: User = Depends(get_teller_auth_user),
+    teller: UserAuthSchema = Depends(get_teller_auth_user),
 ):
     try:
         bank.users.remove(user)
         await db.commit()
+        await membership_index.remove("bank", user.id)
     except Exception:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -173,19 +205,25 @@ async def delete_user_from_bank(
 
 @router.get("/me/banks/list/", tags=["User-Me-Bank"])
 async def list_banks_user_me(
-    user: User = Depends(get_active_auth_user),
-    db: AsyncSession = Depends(get_async_session),
+    user: UserAuthSchema = Depends(get_active_auth_user),
+    db: AsyncSession = Depends(get_async_read_session),
+    params: PageParams = Depends(pagination_params),
 ):
     query = (
         select(Bank.id, Bank.name, Bank.location)
         .select_from(Bank)
         .join(BankUserAssociation, onclause=Bank.id == BankUserAssociation.bank_id)
-        .join(User, onclause=User.id == user.id)
+        .where(BankUserAssociation.user_id == user.id)
     )
+    query = keyset_paginate(query, params, Bank.id)
 
-    banks = (await db.execute(query)).all()
+    banks, next_cursor = next_page(
+        list((await db.execute(query)).all()), params, Bank.id
+    )
 
     return {
+        "size": params.size,
+        "next_cursor": next_cursor,
         "data": [
             BankCreatedRetrieve.model_validate(bank, from_attributes=True)
             for bank in banks
@@ -196,8 +234,8 @@ async def list_banks_user_me(
 @router.get("/me/banks/{bank_id}/detail/", tags=["User-Me-Bank"])
 async def detail_bank_user_me(
     bank_id: UUID = Depends(bank_id_that_is_relevant),
-    user: User = Depends(get_active_auth_user),
-    db: AsyncSession = Depends(get_async_session),
+    user: UserAuthSchema = Depends(get_active_auth_user),
+    db: AsyncSession = Depends(get_async_read_session),
 ):
     bank = (
         await db.execute(
@@ -211,7 +249,7 @@ async def detail_bank_user_me(
 @router.post("/me/banks/{bank_id}/register/", tags=["User-Me-Bank"])
 async def register_bank_user_me(
     bank: Bank = Depends(retrieve_bank_with_users_dependency),
-    user: User = Depends(get_active_auth_user),
+    user: User = Depends(get_active_auth_user_instance),
     db: AsyncSession = Depends(get_async_session),
 ):
     try:
@@ -222,6 +260,7 @@ async def register_bank_user_me(
             status_code=status.HTTP_409_CONFLICT,
             detail="You are  already registered to this bank",
         )
+    await membership_index.add("bank", user.id, bank.id)
 
     return {
         "message": "User added successfully",
@@ -232,12 +271,13 @@ async def register_bank_user_me(
 @router.delete("/me/banks/{bank_id}/delete/", status_code=201, tags=["User-Me-Bank"])
 async def delete_bank_user_me(
     bank: Bank = Depends(retrieve_bank_with_users_dependency),
-    user: User = Depends(get_active_auth_user),
+    user: User = Depends(get_active_auth_user_instance),
     db: AsyncSession = Depends(get_async_session),
 ):
     try:
         bank.users.remove(user)
         await db.commit()
+        await membership_index.remove("bank", user.id)
     except Exception:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
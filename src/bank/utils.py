@@ -0,0 +1,19 @@
+from uuid import UUID
+
+from src.cache import TaggedCache, resource_cache
+from src.config import settings
+
+# entries listing banks; bumped whenever a bank is added or changes
+BANK_LIST_TAG = "banks"
+
+bank_cache = TaggedCache(prefix="cache:bank", ttl=settings.BANK_CACHE_TTL_SECONDS)
+
+
+def bank_tag(bank_id: UUID) -> str:
+    return f"bank:{bank_id}"
+
+
+async def invalidate_bank(bank_id: UUID) -> None:
+    """Evicts the bank, with its loan types, from every cache. Call it after commit."""
+    await resource_cache.invalidate(bank_tag(bank_id))
+    await bank_cache.invalidate(bank_tag(bank_id), BANK_LIST_TAG)
@@ -0,0 +1,458 @@
+import asyncio
+import json
+import logging
+import time
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Hashable
+from uuid import UUID
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from prometheus_client import Counter
+from redis.exceptions import RedisError, WatchError
+from sqlalchemy.orm import make_transient_to_detached
+
+from src.config import settings
+from src.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+CACHE_STATUS_HEADER = "X-Cache"
+
+# channel every worker listens on to drop its local copies of a key
+INVALIDATION_CHANNEL = "cache:invalidations"
+
+CACHE_HITS = Counter("cache_hits_total", "In-process cache hits", ["cache"])
+CACHE_MISSES = Counter("cache_misses_total", "In-process cache misses", ["cache"])
+TAGGED_CACHE_HITS = Counter("tagged_cache_hits_total", "Redis cache hits", ["tag"])
+TAGGED_CACHE_MISSES = Counter(
+    "tagged_cache_misses_total", "Redis cache misses", ["tag"]
+)
+
+
+class LRUCache:
+    """
+    Bounded per-worker LRU. Every entry may carry its own expiry
+    (unix timestamp); expired entries are dropped on access. With `max_bytes`
+    the entries are also bounded by the `size` they were set with.
+    """
+
+    def __init__(self, name: str, maxsize: int, max_bytes: int | None = None) -> None:
+        self.name = name
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, tuple[Any, float | None, int]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Any | None:
+        entry = self._data.get(key)
+
+        if entry is not None:
+            value, expires_at, _ = entry
+            if expires_at is None or expires_at > time.time():
+                self._data.move_to_end(key)
+                self.hits += 1
+                CACHE_HITS.labels(self.name).inc()
+                return value
+            self.delete(key)
+
+        self.misses += 1
+        CACHE_MISSES.labels(self.name).inc()
+        return None
+
+    def set(
+        self, key: Hashable, value: Any, expires_at: float | None = None, size: int = 0
+    ) -> None:
+        if self.maxsize <= 0:
+            return
+        self.delete(key)
+        self._data[key] = (value, expires_at, size)
+        self.bytes += size
+        while len(self._data) > self.maxsize or (
+            self.max_bytes is not None and self.bytes > self.max_bytes
+        ):
+            _, (_, _, evicted) = self._data.popitem(last=False)
+            self.bytes -= evicted
+
+    def delete(self, key: Hashable) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.bytes -= entry[2]
+
+    def clear(self) -> None:
+        self._data.clear()
+        self.bytes = 0
+
+
+def render_json(value: Any) -> bytes:
+    # the same bytes JSONResponse would send
+    return json.dumps(
+        jsonable_encoder(value), ensure_ascii=False, separators=(",", ":")
+    ).encode()
+
+
+def _tag_family(tag: str) -> str:
+    # "bank:<uuid>" is counted as "bank", so the metric stays small
+    return tag.split(":", 1)[0]
+
+
+class TaggedCache:
+    """
+    Redis cache whose entries carry tags, e.g. "banks" or "bank:<id>".
+    Every tag has a version counter; an entry remembers the versions its tags
+    had when it was computed and is a miss as soon as one of them moved, so
+    `invalidate("bank:<id>")` evicts every entry tagged with it at once.
+
+    Tag versions are read before the value is computed, so a write that lands
+    while an entry is being computed invalidates that entry as well.
+    """
+
+    def __init__(self, prefix: str, ttl: int) -> None:
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _entry_key(self, key: str) -> str:
+        return f"{self.prefix}:entry:{key}"
+
+    def _tag_key(self, tag: str) -> str:
+        return f"{self.prefix}:tag:{tag}"
+
+    async def _lookup(
+        self, key: str, tags: list[str]
+    ) -> tuple[dict | None, bytes, list[int]]:
+        # one round trip for the entry and the current versions of its tags
+        async with get_redis().pipeline(transaction=False) as pipe:
+            pipe.get(self._entry_key(key))
+            pipe.mget([self._tag_key(tag) for tag in tags])
+            stored, versions = await pipe.execute()
+        versions = [int(version or 0) for version in versions]
+
+        if stored is not None:
+            # a JSON header line, then the body as it is sent
+            header, _, body = stored.partition(b"\n")
+            header = json.loads(header)
+            if header["versions"] == versions:
+                self._count(tags, TAGGED_CACHE_HITS)
+                return header, body, versions
+
+        self._count(tags, TAGGED_CACHE_MISSES)
+        return None, b"", versions
+
+    async def _store(
+        self, key: str, versions: list[int], body: bytes, deflate: bool, ttl: int | None
+    ) -> None:
+        header = json.dumps({"versions": versions, "deflate": deflate}).encode()
+        try:
+            await get_redis().set(
+                self._entry_key(key), header + b"\n" + body, ex=ttl or self.ttl
+            )
+        except RedisError:
+            pass
+
+    async def get_or_set(
+        self,
+        key: str,
+        tags: list[str],
+        compute: Callable[[], Awaitable[Any]],
+        ttl: int | None = None,
+    ) -> Any:
+        """
+        Returns the cached value of `key` or computes, stores and returns it.
+        The value has to be JSON encodable. While Redis is down every call
+        computes.
+        """
+        try:
+            header, body, versions = await self._lookup(key, tags)
+        except (RedisError, RuntimeError):
+            return await compute()
+
+        if header is not None:
+            return json.loads(body)
+
+        value = jsonable_encoder(await compute())
+        await self._store(key, versions, json.dumps(value).encode(), False, ttl)
+        return value
+
+    async def get_or_render(
+        self,
+        request: Request,
+        key: str,
+        tags: list[str],
+        compute: Callable[[], Awaitable[Any]],
+        ttl: int | None = None,
+    ) -> Response:
+        """
+        `get_or_set` for endpoints: the rendered JSON body is cached, and a hit
+        is sent as is, without building models or running the JSON encoder.
+        Bodies of RESPONSE_CACHE_COMPRESS_MIN_BYTES and more are stored
+        deflated and sent that way to clients that accept it.
+        """
+        headers = {"Vary": "Accept-Encoding"}
+        try:
+            header, body, versions = await self._lookup(key, tags)
+        except (RedisError, RuntimeError):
+            return Response(
+                render_json(await compute()),
+                media_type="application/json",
+                headers=headers,
+            )
+
+        if header is None:
+            body = render_json(await compute())
+            deflate = (
+                settings.RESPONSE_CACHE_COMPRESS
+                and len(body) >= settings.RESPONSE_CACHE_COMPRESS_MIN_BYTES
+            )
+            await self._store(
+                key, versions, zlib.compress(body) if deflate else body, deflate, ttl
+            )
+            return Response(
+                body,
+                media_type="application/json",
+                headers={**headers, CACHE_STATUS_HEADER: "miss"},
+            )
+
+        headers[CACHE_STATUS_HEADER] = "hit"
+        if header["deflate"]:
+            if "deflate" in request.headers.get("accept-encoding", ""):
+                headers["Content-Encoding"] = "deflate"
+            else:
+                body = zlib.decompress(body)
+        return Response(body, media_type="application/json", headers=headers)
+
+    async def invalidate(self, *tags: str) -> None:
+        """Evicts every entry tagged with one of `tags`. Call it after commit."""
+        try:
+            async with get_redis().pipeline(transaction=False) as pipe:
+                for tag in tags:
+                    pipe.incr(self._tag_key(tag))
+                await pipe.execute()
+        except (RedisError, RuntimeError):
+            # entries written before the outage may be served until their TTL
+            pass
+
+    @staticmethod
+    def _count(tags: list[str], counter: Counter) -> None:
+        for tag in tags:
+            counter.labels(_tag_family(tag)).inc()
+
+
+# handed to the waiters of a single-flight load that failed, so they load themselves
+_LOAD_FAILED = object()
+
+_two_tier_caches: dict[str, "TwoTierCache"] = {}
+
+
+class TwoTierCache:
+    """
+    Per-worker LRU, bounded by `max_bytes` of JSON, in front of Redis.
+
+    - Only one coroutine per worker loads a missing key; concurrent callers
+      wait for its result instead of all hitting the database.
+    - A `None` (not found) result is cached as well, for `negative_ttl`.
+    - `invalidate()` publishes the key, and `listen_for_invalidations()`
+      drops it from the local LRU of every worker. Local entries still live
+      at most `local_ttl`, which bounds staleness if a message is lost.
+    - `invalidate()` also bumps a generation of the key in Redis, which a
+      load reads before it runs; a load that saw it move, on any worker,
+      doesn't fill either tier.
+
+    Values have to be JSON encodable and must not be mutated by callers.
+    """
+
+    def __init__(
+        self, name: str, max_bytes: int, ttl: int, local_ttl: int, negative_ttl: int
+    ) -> None:
+        self.name = name
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self.negative_ttl = negative_ttl
+        # an entry takes at least a byte, so the byte budget is what binds
+        self.local = LRUCache(name, maxsize=max_bytes, max_bytes=max_bytes)
+        self._inflight: dict[str, asyncio.Future] = {}
+        # bumped on every invalidation this worker sees; a load that saw it
+        # move doesn't fill the local LRU, as it may have read the row before
+        # the write
+        self._invalidations = 0
+        _two_tier_caches[name] = self
+
+    def _redis_key(self, key: str) -> str:
+        return f"cache:{self.name}:{key}"
+
+    def _generation_key(self, key: str) -> str:
+        return f"cache:{self.name}:{key}:generation"
+
+    async def get_or_load(self, key: str, load: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self.local.get(key)
+        if entry is not None:
+            return entry[0]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            # shielded, so a cancelled waiter doesn't cancel everyone's load
+            value = await asyncio.shield(inflight)
+            return await load() if value is _LOAD_FAILED else value
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await self._load(key, load)
+        except BaseException:
+            future.set_result(_LOAD_FAILED)
+            raise
+        else:
+            future.set_result(value)
+        finally:
+            self._inflight.pop(key, None)
+        return value
+
+    async def _load(self, key: str, load: Callable[[], Awaitable[Any]]) -> Any:
+        invalidations = self._invalidations
+        try:
+            # one round trip for the entry and the generation it is fenced by
+            async with get_redis().pipeline(transaction=False) as pipe:
+                pipe.get(self._redis_key(key))
+                pipe.get(self._generation_key(key))
+                stored, generation = await pipe.execute()
+        except (RedisError, RuntimeError):
+            # invalidations can't reach the other workers either, keep nothing
+            return await load()
+
+        if stored is None:
+            value = await load()
+            stored = json.dumps(value)
+            if not await self._fill(key, generation, stored, value is None):
+                return value
+        else:
+            value = json.loads(stored)
+
+        if invalidations == self._invalidations:
+            local_ttl = self.local_ttl if value is not None else self.negative_ttl
+            self.local.set(
+                key, (value,), expires_at=time.time() + local_ttl, size=len(stored)
+            )
+        return value
+
+    async def _fill(
+        self, key: str, generation: bytes | None, stored: str, negative: bool
+    ) -> bool:
+        """
+        Stores a loaded value in Redis unless the key was invalidated since
+        `generation` was read; returns whether it wasn't.
+        """
+        generation_key = self._generation_key(key)
+        try:
+            async with get_redis().pipeline() as pipe:
+                await pipe.watch(generation_key)
+                if await pipe.get(generation_key) != generation:
+                    return False
+                pipe.multi()
+                pipe.set(
+                    self._redis_key(key),
+                    stored,
+                    ex=self.negative_ttl if negative else self.ttl,
+                )
+                await pipe.execute()
+        except WatchError:
+            return False
+        except RedisError:
+            pass
+        return True
+
+    async def invalidate(self, *keys: str) -> None:
+        """Drops `keys` from Redis and from every worker. Call it after commit."""
+        self._drop_local(*keys)
+        try:
+            async with get_redis().pipeline(transaction=False) as pipe:
+                for key in keys:
+                    # outlives any load that read the previous one
+                    pipe.incr(self._generation_key(key))
+                    pipe.expire(self._generation_key(key), self.ttl)
+                pipe.delete(*(self._redis_key(key) for key in keys))
+                pipe.publish(INVALIDATION_CHANNEL, json.dumps([self.name, keys]))
+                await pipe.execute()
+        except (RedisError, RuntimeError):
+            # the Redis copies expire after `ttl`
+            pass
+
+    def _drop_local(self, *keys: str) -> None:
+        self._invalidations += 1
+        for key in keys:
+            self.local.delete(key)
+
+    def _clear_local(self) -> None:
+        self._invalidations += 1
+        self.local.clear()
+
+
+async def listen_for_invalidations() -> None:
+    """Runs for the life of a worker, applying invalidations published by others."""
+    while True:
+        pubsub = get_redis().pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            # anything published before the subscription was missed
+            for cache in _two_tier_caches.values():
+                cache._clear_local()
+
+            async for message in pubsub.listen():
+                if message["type"] != "message":
+                    continue
+                name, keys = json.loads(message["data"])
+                if name in _two_tier_caches:
+                    _two_tier_caches[name]._drop_local(*keys)
+        except (RedisError, RuntimeError):
+            logger.warning("cache invalidation listener disconnected, reconnecting")
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.reset()
+
+
+def orm_snapshot(instance, exclude: tuple[str, ...] = ()) -> dict:
+    """Column values of `instance` that `orm_restore` can rebuild it from."""
+    return jsonable_encoder(
+        {
+            column.key: getattr(instance, column.key)
+            for column in type(instance).__table__.columns
+            if column.key not in exclude
+        }
+    )
+
+
+def orm_restore(model, snapshot: dict):
+    """
+    Rebuilds a `model` instance from `orm_snapshot` as if it was loaded by a
+    query, so once merged into a session (`merge(..., load=False)`) its
+    changes are flushed as UPDATEs. Columns left out of the snapshot are
+    expired and need a refresh before they are read.
+    """
+    values = {}
+    for column in model.__table__.columns:
+        if column.key not in snapshot:
+            continue
+        value = snapshot[column.key]
+        if value is not None and column.type.python_type is UUID:
+            value = UUID(value)
+        elif value is not None and column.type.python_type is datetime:
+            value = datetime.fromisoformat(value)
+        values[column.key] = value
+
+    instance = model(**values)
+    make_transient_to_detached(instance)
+    return instance
+
+
+resource_cache = TwoTierCache(
+    name="resources",
+    max_bytes=settings.RESOURCE_CACHE_MAX_BYTES,
+    ttl=settings.RESOURCE_CACHE_TTL_SECONDS,
+    local_ttl=settings.RESOURCE_CACHE_LOCAL_TTL_SECONDS,
+    negative_ttl=settings.RESOURCE_CACHE_NEGATIVE_TTL_SECONDS,
+)
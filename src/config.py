@@ -5,11 +5,42 @@ from pathlib import Path
 BASE_DIR = Path(__file__).parent
 
 
+class SigningKey(BaseModel):
+    kid: str
+    # RS256, ES256 or EdDSA
+    algorithm: str = "RS256"
+    # retired keys keep only the public part, so issued tokens stay verifiable
+    private_key_path: Path | None = None
+    public_key_path: Path
+
+
 class AuthJWT(BaseModel):
-    private_key_path: Path = BASE_DIR / "certs" / "jwt-private.pem"
-    public_key_path: Path = BASE_DIR / "certs" / "jwt-public.pem"
-    algorith: str = "RS256"
+    signing_keys: list[SigningKey] = [
+        SigningKey(
+            kid="default",
+            algorithm="RS256",
+            private_key_path=BASE_DIR / "certs" / "jwt-private.pem",
+            public_key_path=BASE_DIR / "certs" / "jwt-public.pem",
+        )
+    ]
+    # key new tokens are signed with; tokens without a kid are checked against the first key
+    active_kid: str = "default"
+    jwks_max_age_seconds: int = 3600
     access_token_exp_minutes: int = 30
+    # verified access tokens kept per worker; 0 disables the cache
+    token_cache_size: int = 10_000
+    # authenticated user snapshots: per-worker LRU in front of Redis
+    principal_cache_size: int = 10_000
+    principal_cache_local_ttl_seconds: int = 5
+    principal_cache_ttl_seconds: int = 300
+
+
+class PasswordHashing(BaseModel):
+    # "thread" or "process"; bcrypt releases the GIL, so threads are usually enough
+    executor: str = "thread"
+    max_workers: int = 4
+    # hashing jobs allowed to wait for a worker before new ones are rejected
+    max_queue_depth: int = 32
 
 
 class Settings(BaseSettings):
@@ -18,24 +49,95 @@ class Settings(BaseSettings):
     DB_PASSWORD: str
     DB_HOST: str
     DB_PORT: int
+    DB_ECHO: bool = False
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: int = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    # PgBouncer in transaction pooling mode can't keep prepared statements per connection
+    DB_PGBOUNCER: bool = False
+    # "host:port" of streaming replicas serving read-only endpoints
+    DB_REPLICA_HOSTS: list[str] = []
+    # reads carrying a timestamp token younger than this go to the primary
+    DB_REPLICA_MAX_LAG_SECONDS: int = 5
     EMAIL_USER: str
     EMAIL_PASS: str
     POSTGRES_DB: str
     POSTGRES_USER: str
     POSTGRES_PASSWORD: str
     REDIS_HOST: str
-    REDIS_PORT: str
+    REDIS_PORT: int
+    REDIS_DB: int = 0
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT: int = 5
+    PAGE_SIZE_MAX: int = 100
+    STATEMENT_YIELD_PER: int = 1000
+    TRANSACTION_BATCH_MAX: int = 1000
+    # deposits/withdraws arriving within the window share one commit
+    GROUP_COMMIT_ENABLED: bool = False
+    GROUP_COMMIT_WINDOW_MS: float = 2
+    GROUP_COMMIT_MAX_OPS: int = 64
+    # responses of Idempotency-Key requests are replayed for this long
+    IDEMPOTENCY_TTL_SECONDS: int = 86400
+    # a request holding a key for longer is considered dead
+    IDEMPOTENCY_LOCK_SECONDS: int = 60
+    # how long a duplicate waits for the first request to finish
+    IDEMPOTENCY_WAIT_SECONDS: float = 10
+    IDEMPOTENCY_POLL_SECONDS: float = 0.05
+    # bank entries are evicted by the write paths, the TTL only bounds memory
+    BANK_CACHE_TTL_SECONDS: int = 86400
+    # cached response bodies from this size on are stored and sent deflated
+    RESPONSE_CACHE_COMPRESS: bool = True
+    RESPONSE_CACHE_COMPRESS_MIN_BYTES: int = 1024
+    # banks, accounts and loans looked up by id; the local copy is per worker
+    RESOURCE_CACHE_MAX_BYTES: int = 16 * 1024 * 1024
+    RESOURCE_CACHE_TTL_SECONDS: int = 3600
+    RESOURCE_CACHE_LOCAL_TTL_SECONDS: int = 60
+    RESOURCE_CACHE_NEGATIVE_TTL_SECONDS: int = 30
+    # user -> banks / accounts sets in Redis, and the per-worker bloom filter
+    MEMBERSHIP_TTL_SECONDS: int = 86400
+    MEMBERSHIP_BLOOM_ENABLED: bool = True
+    MEMBERSHIP_BLOOM_CAPACITY: int = 1_000_000
+    MEMBERSHIP_BLOOM_ERROR_RATE: float = 0.01
+    # how often filters check whether an addition went unpublished
+    MEMBERSHIP_BLOOM_CHECK_SECONDS: float = 1
+    # messages published per outbox relay transaction, and the wait when idle
+    OUTBOX_BATCH_SIZE: int = 100
+    OUTBOX_POLL_SECONDS: float = 0.5
+    # shared by the web and celery containers
+    PAYROLL_UPLOAD_DIR: Path = Path("uploads/payroll")
+    PAYROLL_COPY_CHUNK: int = 5000
+    # monthly partitions of deposit/withdraw/loan_compensation kept ahead of now
+    PARTITION_MONTHS_AHEAD: int = 3
+    # partitions older than this are detached; None keeps all of them attached
+    PARTITION_RETENTION_MONTHS: int | None = None
+    # balance checkpoints include ledger entries older than this only
+    LEDGER_CHECKPOINT_LAG_SECONDS: int = 300
     AUTH_JWT: AuthJWT = AuthJWT()
+    PASSWORD_HASHING: PasswordHashing = PasswordHashing()
 
     @property
     def DATABASE_URL_asyncpg(self):
         return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
+    @property
+    def DATABASE_URLS_asyncpg_replicas(self):
+        return [
+            f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASSWORD}@{host}/{self.DB_NAME}"
+            for host in self.DB_REPLICA_HOSTS
+        ]
+
+    @property
+    def REDIS_URL(self):
+        return f"redis://{self.REDIS_HOST}:{self.REDIS_PORT}/{self.REDIS_DB}"
+
     # @property
     # def DATABASE_URL_psycopg(self):
     #     return f'postgresql+psycopg://{self.DB_USER}:{self.DB_PASSWORD}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}'
 
-    model_config = SettingsConfigDict(env_file=".env")
+    model_config = SettingsConfigDict(env_file=".env", env_nested_delimiter="__")
 
 
 settings = Settings()
@@ -1,16 +1,102 @@
-from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine, AsyncSession
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from uuid import uuid4
+
+from fastapi import Request
+
+from prometheus_client import Gauge, Histogram
+from sqlalchemy.ext.asyncio import (
+    async_sessionmaker,
+    create_async_engine,
+    AsyncEngine,
+    AsyncSession,
+)
 from sqlalchemy.orm import DeclarativeBase, Session, sessionmaker
-from sqlalchemy import create_engine
-from typing import AsyncGenerator, Generator
+from sqlalchemy.pool import AsyncAdaptedQueuePool, NullPool
+from sqlalchemy import create_engine, event, text
+from typing import AsyncGenerator, Generator, Iterator
 
 from src.config import settings
 
-# asynchronous engine
-async_engine = create_async_engine(
-    url=settings.DATABASE_URL_asyncpg,
-    echo=True,
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_connections_checked_out", "Connections checked out of the pool", ["pool"]
+)
+DB_POOL_OVERFLOW = Gauge(
+    "db_pool_connections_overflow", "Connections opened above pool_size", ["pool"]
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a pooled connection", ["pool"]
 )
 
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    metrics_label = "primary"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT.labels(self.metrics_label).observe(time.perf_counter() - start)
+
+
+def _connect_args() -> dict:
+    if settings.DB_PGBOUNCER:
+        # nothing is cached per connection and every prepared statement gets a
+        # unique name, so server connections swapped by PgBouncer never collide
+        return {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+        }
+    return {
+        "statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+        "prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE,
+    }
+
+
+def create_task_engine() -> AsyncEngine:
+    # celery runs every task in a fresh event loop, so its connections can't be pooled
+    return create_async_engine(
+        url=settings.DATABASE_URL_asyncpg,
+        echo=settings.DB_ECHO,
+        poolclass=NullPool,
+        connect_args=_connect_args(),
+    )
+
+
+def create_engine_from_settings(url: str, metrics_label: str = "primary") -> AsyncEngine:
+    engine = create_async_engine(
+        url=url,
+        echo=settings.DB_ECHO,
+        poolclass=InstrumentedAsyncQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        connect_args=_connect_args(),
+    )
+
+    pool = engine.pool
+    pool.metrics_label = metrics_label
+    DB_POOL_CHECKED_OUT.labels(metrics_label).set_function(pool.checkedout)
+    DB_POOL_OVERFLOW.labels(metrics_label).set_function(lambda: max(pool.overflow(), 0))
+
+    return engine
+
+
+# asynchronous engine
+async_engine = create_engine_from_settings(url=settings.DATABASE_URL_asyncpg)
+
+# asynchronous read-only replica engines
+replica_engines = [
+    create_engine_from_settings(url=url, metrics_label=f"replica{i}")
+    for i, url in enumerate(settings.DATABASE_URLS_asyncpg_replicas)
+]
+
 # synchronous engine
 # sync_engine = create_engine(
 #     url=settings.DATABASE_URL_psycopg,
@@ -33,11 +119,109 @@ AsyncSessionLocal = async_sessionmaker(
 #                                 expire_on_commit=False)
 
 
+# asynchronous local sessions of replicas
+ReplicaSessionLocals = [
+    async_sessionmaker(
+        bind=engine,
+        autocommit=False,
+        autoflush=False,
+        expire_on_commit=False,
+    )
+    for engine in replica_engines
+]
+
+# returned after writes; clients send it back so their next reads see the write
+READ_AFTER_HEADER = "X-Read-After"
+
+
+def read_session_local() -> async_sessionmaker[AsyncSession]:
+    """Random replica, or the primary when no replicas are configured."""
+    if ReplicaSessionLocals:
+        return random.choice(ReplicaSessionLocals)
+    return AsyncSessionLocal
+
+
 async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
     async with AsyncSessionLocal() as session:
         yield session
 
 
+async def current_wal_lsn() -> str:
+    async with async_engine.connect() as connection:
+        return await connection.scalar(text("SELECT pg_current_wal_lsn()::text"))
+
+
+async def _replica_has_replayed(session: AsyncSession, lsn: str) -> bool:
+    query = text("SELECT pg_last_wal_replay_lsn() >= CAST(:lsn AS pg_lsn)")
+    try:
+        return bool(await session.scalar(query, {"lsn": lsn}))
+    except Exception:
+        return False
+
+
+async def get_async_read_session(
+    request: Request,
+) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Session for read-only handlers. It is bound to a random replica unless the
+    client's X-Read-After token (a WAL LSN like "0/16B3748", or a unix
+    timestamp in milliseconds) says the replica may not have its last write yet.
+    """
+    token = request.headers.get(READ_AFTER_HEADER)
+    session_local = AsyncSessionLocal
+
+    if ReplicaSessionLocals:
+        replica_session_local = read_session_local()
+
+        if token is None:
+            session_local = replica_session_local
+        elif "/" in token:
+            async with replica_session_local() as session:
+                if await _replica_has_replayed(session, token):
+                    yield session
+                    return
+        elif not token.isdigit() or (
+            time.time() - int(token) / 1000 >= settings.DB_REPLICA_MAX_LAG_SECONDS
+        ):
+            session_local = replica_session_local
+
+    async with session_local() as session:
+        yield session
+
+
+class CommitTracker:
+    """Set by `track_commits`; tells whether any session committed meanwhile."""
+
+    def __init__(self) -> None:
+        self.committed = False
+
+
+_commit_tracker: ContextVar[CommitTracker | None] = ContextVar(
+    "commit_tracker", default=None
+)
+
+
+@contextmanager
+def track_commits() -> Iterator[CommitTracker]:
+    tracker = CommitTracker()
+    reset_token = _commit_tracker.set(tracker)
+    try:
+        yield tracker
+    finally:
+        _commit_tracker.reset(reset_token)
+
+
+def current_commit_tracker() -> CommitTracker | None:
+    return _commit_tracker.get()
+
+
+@event.listens_for(Session, "after_commit")
+def _mark_committed(session: Session) -> None:
+    tracker = _commit_tracker.get()
+    if tracker is not None:
+        tracker.committed = True
+
+
 # async def get_sync_session() -> Generator[Session, None]:
 #     async with SyncSessionLocal() as session:
 #         yield session
@@ -0,0 +1,127 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from functools import cache
+from typing import Generic, TypeVar
+from uuid import UUID
+
+from fastapi import HTTPException, Query, Response, status
+from pydantic import BaseModel, TypeAdapter
+from sqlalchemy import DateTime, Select, Uuid, literal, tuple_
+
+from src.config import settings
+
+
+class PageParams(BaseModel):
+    after: list | None = None
+    size: int
+
+
+def encode_cursor(values: list) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        values = None
+
+    if not isinstance(values, list):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"cursor": "cursor is invalid"},
+        )
+    return values
+
+
+def pagination_params(
+    cursor: str | None = Query(default=None),
+    size: int = Query(default=10, ge=1, le=settings.PAGE_SIZE_MAX),
+) -> PageParams:
+    return PageParams(
+        after=decode_cursor(cursor) if cursor is not None else None,
+        size=size,
+    )
+
+
+def _cursor_value(column, value):
+    if isinstance(column.type, DateTime):
+        value = datetime.fromisoformat(value)
+    elif isinstance(column.type, Uuid):
+        value = UUID(value)
+    return literal(value, column.type)
+
+
+def keyset_paginate(
+    query: Select,
+    params: PageParams,
+    *columns,
+    descending: bool = False,
+) -> Select:
+    """
+    Orders the query by `columns` and seeks past the cursor instead of using
+    OFFSET, so every page costs the same as the first one. One extra row is
+    fetched to know whether there is a next page.
+    """
+    if params.after is not None:
+        if len(params.after) != len(columns):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail={"cursor": "cursor is invalid"},
+            )
+        try:
+            after = tuple_(
+                *(_cursor_value(c, v) for c, v in zip(columns, params.after))
+            )
+        except (TypeError, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail={"cursor": "cursor is invalid"},
+            )
+        key = tuple_(*columns)
+        query = query.where(key < after if descending else key > after)
+
+    order_by = [c.desc() if descending else c for c in columns]
+    return query.order_by(*order_by).limit(params.size + 1)
+
+
+def next_page(rows: list, params: PageParams, *columns) -> tuple[list, str | None]:
+    if len(rows) <= params.size:
+        return rows, None
+
+    rows = rows[: params.size]
+    last = rows[-1]
+    return rows, encode_cursor([getattr(last, c.key) for c in columns])
+
+
+T = TypeVar("T")
+
+
+class CursorPage(BaseModel, Generic[T]):
+    size: int
+    next_cursor: str | None
+    data: list[T]
+
+
+@cache
+def page_adapter(schema: type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(CursorPage[schema])
+
+
+def page_response(
+    schema: type[BaseModel], rows: list, params: PageParams, next_cursor: str | None
+) -> Response:
+    """
+    Renders a page of Core rows straight to JSON bytes: the rows are validated
+    as `schema` in one pass and dumped by pydantic, without building a model
+    per row in Python or going through jsonable_encoder. Select only the
+    columns `schema` needs.
+    """
+    adapter = page_adapter(schema)
+    page = adapter.validate_python(
+        {"size": params.size, "next_cursor": next_cursor, "data": rows},
+        from_attributes=True,
+    )
+    return Response(adapter.dump_json(page), media_type="application/json")
@@ -0,0 +1,354 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Callable
+from uuid import UUID, uuid4
+
+from fastapi import HTTPException, Request, Response, status
+from fastapi.routing import APIRoute
+from jwt import InvalidTokenError
+from redis.exceptions import RedisError
+from sqlalchemy import LargeBinary, String, and_, delete, false, update
+from sqlalchemy.dialects.postgresql import JSONB, insert
+from sqlalchemy.orm import Mapped, mapped_column
+
+from src.auth.utils import decode_jwt_cached
+from src.config import settings
+from src.database import AsyncSessionLocal, Base, track_commits
+from src.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+# headers that are recomputed when a stored response is replayed
+_SKIPPED_HEADERS = {"content-length", "date", "server"}
+
+
+class IdempotencyRecord(Base):
+    """Idempotency keys; settled ones are also cached in Redis."""
+
+    __tablename__ = "idempotency_record"
+    # sha256 of the user, the path and the Idempotency-Key
+    key: Mapped[str] = mapped_column(String(80), primary_key=True)
+    fingerprint: Mapped[str] = mapped_column(String(64))
+    # the request holding the key; NULL once it is settled
+    token: Mapped[UUID | None]
+    # NULL while the first request is still running
+    status_code: Mapped[int | None]
+    headers: Mapped[list | None] = mapped_column(JSONB)
+    body: Mapped[bytes | None] = mapped_column(LargeBinary)
+    # the endpoint committed but its response was lost
+    applied: Mapped[bool] = mapped_column(server_default=false())
+    expires_at: Mapped[datetime] = mapped_column(index=True)
+
+
+def idempotent(endpoint: Callable) -> Callable:
+    """Marks a path operation of an `IdempotentRoute` router as idempotent."""
+    endpoint.__idempotent__ = True
+    return endpoint
+
+
+class IdempotencyStore:
+    """
+    Postgres holds every key, so a key claimed once is seen by every retry.
+    Redis only caches settled records in front of it.
+    """
+
+    @staticmethod
+    async def cached(key: str) -> dict | None:
+        try:
+            stored = await get_redis().get(key)
+        except (RedisError, RuntimeError):
+            return None
+        return json.loads(stored) if stored else None
+
+    @staticmethod
+    async def cache(key: str, record: dict) -> None:
+        try:
+            await get_redis().set(
+                key, json.dumps(record), ex=settings.IDEMPOTENCY_TTL_SECONDS
+            )
+        except (RedisError, RuntimeError):
+            pass
+
+    @staticmethod
+    async def acquire(key: str, fingerprint: str, token: UUID) -> dict | None:
+        stored = await IdempotencyStore.cached(key)
+        if stored is not None:
+            return stored
+
+        now = datetime.utcnow()
+        lock_expires_at = now + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+        query = (
+            insert(IdempotencyRecord)
+            .values(
+                key=key,
+                fingerprint=fingerprint,
+                token=token,
+                expires_at=lock_expires_at,
+            )
+            # an expired record is taken over as if it didn't exist
+            .on_conflict_do_update(
+                index_elements=[IdempotencyRecord.key],
+                set_={
+                    "fingerprint": fingerprint,
+                    "token": token,
+                    "status_code": None,
+                    "headers": None,
+                    "body": None,
+                    "applied": False,
+                    "expires_at": lock_expires_at,
+                },
+                where=IdempotencyRecord.expires_at < now,
+            )
+            .returning(IdempotencyRecord.key)
+        )
+
+        async with AsyncSessionLocal() as db:
+            acquired = await db.scalar(query)
+            await db.commit()
+            if acquired:
+                return None
+
+            record = await db.get(IdempotencyRecord, key)
+
+        if record is None:
+            # expired and purged in between, the next poll takes it over
+            return {"fingerprint": fingerprint}
+        stored = {"fingerprint": record.fingerprint}
+        if record.status_code is not None:
+            stored.update(
+                status_code=record.status_code,
+                headers=record.headers,
+                body=base64.b64encode(record.body).decode(),
+            )
+        elif record.applied:
+            stored["applied"] = True
+        return stored
+
+    @staticmethod
+    async def renew(key: str, token: UUID) -> bool:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(IdempotencyRecord)
+                .where(
+                    and_(IdempotencyRecord.key == key, IdempotencyRecord.token == token)
+                )
+                .values(
+                    expires_at=datetime.utcnow()
+                    + timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+                )
+            )
+            await db.commit()
+        return result.rowcount == 1
+
+    @staticmethod
+    async def settle(key: str, token: UUID, record: dict) -> None:
+        """Stores the outcome, unless the key was taken over meanwhile."""
+        values = {
+            "token": None,
+            "expires_at": datetime.utcnow()
+            + timedelta(seconds=settings.IDEMPOTENCY_TTL_SECONDS),
+        }
+        if "status_code" in record:
+            values.update(
+                status_code=record["status_code"],
+                headers=record["headers"],
+                body=base64.b64decode(record["body"]),
+            )
+        else:
+            values["applied"] = True
+
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(IdempotencyRecord)
+                    .where(
+                        and_(
+                            IdempotencyRecord.key == key,
+                            IdempotencyRecord.token == token,
+                        )
+                    )
+                    .values(**values)
+                )
+                await db.commit()
+        finally:
+            # retries check Redis first, so this still holds if Postgres failed
+            await IdempotencyStore.cache(key, record)
+
+    @staticmethod
+    async def release(key: str, token: UUID) -> None:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                delete(IdempotencyRecord).where(
+                    and_(IdempotencyRecord.key == key, IdempotencyRecord.token == token)
+                )
+            )
+            await db.commit()
+
+
+async def _hold(key: str, token: UUID) -> None:
+    """Keeps the lock of a running request from expiring."""
+    while True:
+        await asyncio.sleep(settings.IDEMPOTENCY_LOCK_SECONDS / 3)
+        try:
+            if not await IdempotencyStore.renew(key, token):
+                logger.warning("idempotency key %s was taken over while running", key)
+                return
+        except Exception:
+            logger.exception("idempotency key %s could not be renewed", key)
+
+
+async def _settle_failed(
+    key: str, token: UUID, fingerprint: str, committed: bool
+) -> None:
+    """
+    A request that failed before committing frees its key for a retry; one
+    that committed keeps it, so a retry can't apply it a second time.
+    """
+    try:
+        if committed:
+            await IdempotencyStore.settle(
+                key, token, {"fingerprint": fingerprint, "applied": True}
+            )
+        else:
+            await IdempotencyStore.release(key, token)
+    except Exception:
+        logger.exception("idempotency key %s could not be settled", key)
+
+
+def _stored_record(fingerprint: str, response: Response) -> dict:
+    return {
+        "fingerprint": fingerprint,
+        "status_code": response.status_code,
+        "headers": _stored_headers(response),
+        "body": base64.b64encode(response.body).decode(),
+    }
+
+
+def _stored_headers(response: Response) -> list[list[str]]:
+    return [
+        [name.decode("latin-1"), value.decode("latin-1")]
+        for name, value in response.raw_headers
+        if name.decode("latin-1").lower() not in _SKIPPED_HEADERS
+    ]
+
+
+def _replay(stored: dict) -> Response:
+    response = Response(
+        content=base64.b64decode(stored["body"]), status_code=stored["status_code"]
+    )
+    for name, value in stored["headers"]:
+        response.headers.append(name, value)
+    response.headers[REPLAYED_HEADER] = "true"
+    return response
+
+
+def _scope(request: Request) -> str:
+    # keys are per user, so clients can't collide with or read each other's
+    authorization = request.headers.get("authorization", "")
+    try:
+        return f"user:{decode_jwt_cached(authorization.removeprefix('Bearer '))['sub']}"
+    except (InvalidTokenError, KeyError):
+        return "token:" + hashlib.sha256(authorization.encode()).hexdigest()
+
+
+class IdempotentRoute(APIRoute):
+    """
+    Route class that makes `@idempotent` endpoints honour an Idempotency-Key
+    header. The first request with a key runs and its response is stored for
+    IDEMPOTENCY_TTL_SECONDS; a retry with the same key waits for it while it
+    is still running and then gets the stored bytes back without the endpoint
+    (or the database) being touched. Errors are not stored, so a failed
+    request can be retried with the same key.
+
+    Keys are claimed in Postgres with a token that only the holder can
+    renew, settle or release; the lock is renewed while the endpoint runs.
+    A request that fails (or is cancelled) after its endpoint committed keeps
+    the key, and retries get a 409 instead of running it again.
+    """
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+        if not getattr(self.endpoint, "__idempotent__", False):
+            return handler
+
+        async def idempotent_handler(request: Request) -> Response:
+            idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+            if idempotency_key is None:
+                return await handler(request)
+            if len(idempotency_key) > 128:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail={IDEMPOTENCY_HEADER: "it needs to be up to 128 characters"},
+                )
+
+            key = "idempotency:" + hashlib.sha256(
+                f"{_scope(request)} {request.url.path} {idempotency_key}".encode()
+            ).hexdigest()
+            fingerprint = hashlib.sha256(
+                request.method.encode() + b" " + await request.body()
+            ).hexdigest()
+
+            token = uuid4()
+            deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+            while True:
+                stored = await IdempotencyStore.acquire(key, fingerprint, token)
+
+                if stored is None:
+                    break
+                if stored["fingerprint"] != fingerprint:
+                    raise HTTPException(
+                        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                        detail={
+                            IDEMPOTENCY_HEADER: "it was already used with a different request"
+                        },
+                    )
+                if "status_code" in stored:
+                    return _replay(stored)
+                if stored.get("applied"):
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail={
+                            IDEMPOTENCY_HEADER: "a request with this key was already applied"
+                        },
+                    )
+                if time.monotonic() >= deadline:
+                    raise HTTPException(
+                        status_code=status.HTTP_409_CONFLICT,
+                        detail={
+                            IDEMPOTENCY_HEADER: "a request with this key is still in progress"
+                        },
+                        headers={"Retry-After": "1"},
+                    )
+                await asyncio.sleep(settings.IDEMPOTENCY_POLL_SECONDS)
+
+            holder = asyncio.create_task(_hold(key, token))
+            try:
+                with track_commits() as tracker:
+                    response = await handler(request)
+            except BaseException:
+                holder.cancel()
+                await _settle_failed(key, token, fingerprint, tracker.committed)
+                raise
+            holder.cancel()
+
+            try:
+                if response.status_code < 400:
+                    await IdempotencyStore.settle(
+                        key, token, _stored_record(fingerprint, response)
+                    )
+                else:
+                    await _settle_failed(key, token, fingerprint, tracker.committed)
+            except Exception:
+                # the operation is done, the client gets its result either way
+                logger.exception("response of idempotency key %s was not stored", key)
+            return response
+
+        return idempotent_handler
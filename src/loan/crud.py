@@ -1,11 +1,29 @@
 from fastapi import Depends, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
+from sqlalchemy import (
+    select,
+    update,
+    insert,
+    literal,
+    cast,
+    func,
+    and_,
+    true,
+    false,
+    Integer,
+    Float,
+    DateTime,
+)
 from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.attributes import set_committed_value
 
+from src.account.crud import ledger_entry_cte
 from src.account.models import Account
 
+from src.bank.utils import invalidate_bank
+from src.cache import orm_restore, orm_snapshot, resource_cache
 from src.loan.models import LoanType, Loan, LoanCompensation
+from src.loan.utils import loan_cache_key
 
 from src.loan.schemas import (
     LoanTypeCreateSchema,
@@ -25,7 +43,6 @@ class LoanCRUD:
             new_loan_type = LoanType(**data)
             db.add(new_loan_type)
             await db.commit()
-            return new_loan_type
         except Exception as e:
             if "unique constraint" in str(e).lower():
                 raise HTTPException(
@@ -37,54 +54,141 @@ class LoanCRUD:
                 status_code=400, detail={"bank_id": "bank_id is invalid"}
             )
 
+        # banks are listed and retrieved with their loan types
+        await invalidate_bank(new_loan_type.bank_id)
+        return new_loan_type
+
     @staticmethod
     async def create_loan_in_account(
         db: AsyncSession, loan_schema: LoanCreateSchema, account_id: int
     ):
         data = loan_schema.model_dump()
-        data["account_id"] = account_id
-        try:
-            loan_type = await db.scalar(
-                select(LoanType).where(LoanType.id == data["loan_type_id"])
-            )
-            data["amount_expected"] = (loan_type.interest / 100 + 1) * data[
-                "amount_out"
-            ]
-            new_loan = Loan(**data)
-
-            db.add(new_loan)
-            await db.commit()
-
-            account = await db.scalar(select(Account).where(Account.id == account_id))
-
-            account.money += data["amount_out"]
+        amount_out = data["amount_out"]
 
-            await db.commit()
+        # loan type lookup, disbursal, loan insert and ledger entry in one
+        # statement: the loan row and the money it puts on the account commit
+        # or fail together
+        loan_type = (
+            select(LoanType.id, LoanType.interest)
+            .where(LoanType.id == data["loan_type_id"])
+            .cte("found_loan_type")
+        )
+        disbursed = (
+            update(Account)
+            .where(Account.id == account_id)
+            .where(select(loan_type.c.id).exists())
+            .values(money=func.coalesce(Account.money, 0) + amount_out)
+            .returning(Account.id)
+            .cte("disbursed")
+        )
+        amount_expected = (
+            cast(func.coalesce(loan_type.c.interest, 0), Float) / literal(100, Float) + 1
+        ) * amount_out
+        issued = (
+            insert(Loan)
+            .from_select(
+                [
+                    "account_id",
+                    "loan_type_id",
+                    "amount_out",
+                    "amount_in",
+                    "amount_expected",
+                    "is_covered",
+                    "is_expired",
+                    "expired_at",
+                ],
+                select(
+                    disbursed.c.id,
+                    loan_type.c.id,
+                    literal(amount_out, Integer),
+                    literal(0, Integer),
+                    amount_expected,
+                    false(),
+                    false(),
+                    literal(data["expired_at"], DateTime),
+                ).select_from(disbursed.join(loan_type, true())),
+                include_defaults=False,
+            )
+            .returning(
+                Loan.id,
+                Loan.account_id,
+                Loan.loan_type_id,
+                Loan.amount_out,
+                Loan.amount_expected,
+                Loan.expired_at,
+                Loan.amount_in,
+                Loan.is_expired,
+                Loan.is_covered,
+                Loan.created_at,
+            )
+            .cte("issued")
+        )
+        recorded = ledger_entry_cte(
+            "recorded",
+            "loan_disbursal",
+            account_id=issued.c.account_id,
+            reference_id=issued.c.id,
+            amount=issued.c.amount_out,
+            balance_delta=issued.c.amount_out,
+            created_at=issued.c.created_at,
+        )
+        query = select(
+            issued.c.id,
+            issued.c.account_id,
+            issued.c.loan_type_id,
+            issued.c.amount_out,
+            issued.c.amount_expected,
+            issued.c.expired_at,
+            issued.c.amount_in,
+            issued.c.is_expired,
+            issued.c.is_covered,
+        ).add_cte(recorded)
 
-            return new_loan
+        try:
+            new_loan = (await db.execute(query)).first()
+            if new_loan is None:
+                await db.rollback()
+            else:
+                await db.commit()
         except Exception as e:
+            await db.rollback()
             if "loan_user_id_fkey" in str(e).lower():
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
-                    detail={"user_id": f"user_id is invalid"},
+                    detail={"user_id": "user_id is invalid"},
                 )
             elif "loan_loan_type_id_fkey" in str(e).lower():
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
-                    detail={"user_id": f"loan_type_id is invalid"},
+                    detail={"loan_type_id": "loan_type_id is invalid"},
                 )
             elif "loan_account_id_fkey" in str(e).lower():
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
-                    detail={"user_id": "account_id is invalid"},
+                    detail={"account_id": "account_id is invalid"},
                 )
             raise HTTPException(
                 status_code=400,
                 detail={
-                    "message": f"{e} Invalid data. Check against (user_id, account_id, loan_type_id)."
+                    "message": "Invalid data. Check against (user_id, account_id, loan_type_id)."
                 },
             )
 
+        if not new_loan:
+            if not await db.get(LoanType, data["loan_type_id"]):
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail={"loan_type_id": "loan_type_id is invalid"},
+                )
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail={"account_id": "account_id is invalid"},
+            )
+
+        # drops a cached "not found" of the id
+        await resource_cache.invalidate(loan_cache_key(new_loan.id))
+        return new_loan
+
     @staticmethod
     async def retrieve_loan(db: AsyncSession, loan_id: int) -> Loan | None:
         query = (
@@ -94,45 +198,144 @@ class LoanCRUD:
 
         return result
 
+    @staticmethod
+    async def retrieve_loan_cached(db: AsyncSession, loan_id: int) -> Loan | None:
+        """`retrieve_loan` served from the resource cache, merged into `db`."""
+
+        async def load():
+            loan = await LoanCRUD.retrieve_loan(db=db, loan_id=loan_id)
+            if loan is None:
+                return None
+            return {**orm_snapshot(loan), "loan_type": orm_snapshot(loan.loan_type)}
+
+        snapshot = await resource_cache.get_or_load(loan_cache_key(loan_id), load)
+        if snapshot is None:
+            return None
+
+        loan = orm_restore(Loan, snapshot)
+        set_committed_value(
+            loan, "loan_type", orm_restore(LoanType, snapshot["loan_type"])
+        )
+        return await db.merge(loan, load=False)
+
     @staticmethod
     async def create_loan_compensation(
         db: AsyncSession,
         loan: Loan,
         loan_compensation_schema: LoanCompensationCreateSchema,
     ):
-        if loan.is_covered:
+        amount = loan_compensation_schema.model_dump()["amount"]
+
+        # guarded by the remaining amount, so concurrent repayments can't overpay
+        repaid = (
+            update(Loan)
+            .where(
+                and_(
+                    Loan.id == loan.id,
+                    func.coalesce(Loan.is_covered, False).is_(False),
+                    Loan.amount_expected >= amount,
+                )
+            )
+            .values(
+                amount_expected=Loan.amount_expected - amount,
+                amount_in=func.coalesce(Loan.amount_in, 0) + amount,
+                is_covered=(Loan.amount_expected - amount) == 0,
+            )
+            .returning(
+                Loan.id,
+                Loan.account_id,
+                Loan.amount_expected,
+                Loan.amount_in,
+                Loan.is_covered,
+            )
+            .cte("repaid")
+        )
+        compensation = (
+            insert(LoanCompensation)
+            .from_select(
+                ["amount", "loan_id"],
+                select(literal(amount, Integer), repaid.c.id),
+                include_defaults=False,
+            )
+            .returning(
+                LoanCompensation.id,
+                LoanCompensation.amount,
+                LoanCompensation.loan_id,
+                LoanCompensation.created_at,
+            )
+            .cte("compensation")
+        )
+        # repayments aren't paid from the account, so they don't move its balance;
+        # both CTEs hold at most the one row of this loan
+        recorded = ledger_entry_cte(
+            "recorded",
+            "loan_repayment",
+            account_id=repaid.c.account_id,
+            reference_id=compensation.c.id,
+            amount=compensation.c.amount,
+            balance_delta=literal(0, Integer),
+            created_at=compensation.c.created_at,
+        )
+        query = (
+            select(
+                compensation.c.id,
+                compensation.c.amount,
+                compensation.c.loan_id,
+                repaid.c.amount_expected,
+                repaid.c.amount_in,
+                repaid.c.is_covered,
+            )
+            .select_from(
+                compensation.join(repaid, compensation.c.loan_id == repaid.c.id)
+            )
+            .add_cte(recorded)
+        )
+
+        try:
+            new_compensation = (await db.execute(query)).first()
+            if new_compensation is None:
+                await db.rollback()
+            else:
+                await db.commit()
+        except Exception as e:
+            await db.rollback()
+            if "check_d_amount_gt_0" in str(e).lower():
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail={"amount": "it needs to be greater than 0"},
+                )
+            elif "loan_compensation_loan_id_fkey" in str(e).lower():
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail={"loan_id": "loan_id is invalid"},
+                )
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail={"message": "loan is totally covered"},
+                detail={"message": "Invalid data. Check against (loan_id, amount)."},
             )
 
-        data: dict = loan_compensation_schema.model_dump()
-        diff = loan.amount_expected - data.get("amount")
-        if diff > 0:
-            data["loan_id"] = loan.id
-            loan.amount_expected -= data.get("amount")
-            loan.amount_in += data.get("amount")
-        elif diff == 0:
-            data["loan_id"] = loan.id
-            loan.amount_expected -= data.get("amount")
-            loan.amount_in += data.get("amount")
-            loan.is_covered = True
-        else:
+        if not new_compensation:
+            current = (
+                await db.execute(
+                    select(Loan.amount_expected, Loan.is_covered).where(
+                        Loan.id == loan.id
+                    )
+                )
+            ).first()
+            if current.is_covered:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail={"message": "loan is totally covered"},
+                )
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail={
-                    "amount": f"The amount is over by {abs(diff)} ; expected up to {loan.amount_expected}"
+                    "amount": f"The amount is over by {abs(current.amount_expected - amount)} ; expected up to {current.amount_expected}"
                 },
             )
-        try:
-            new_compensation = LoanCompensation(**data)
-            db.add(new_compensation)
-            await db.commit()
 
-            return new_compensation
+        for key in ("amount_expected", "amount_in", "is_covered"):
+            set_committed_value(loan, key, getattr(new_compensation, key))
+        await resource_cache.invalidate(loan_cache_key(loan.id))
 
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail=str(e),
-            )
+        return new_compensation
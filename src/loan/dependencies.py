@@ -10,7 +10,7 @@ async def retrieve_loan_dependency(
     loan_id: int,
     db: AsyncSession = Depends(get_async_session),
 ) -> Loan:
-    result = await LoanCRUD.retrieve_loan(db=db, loan_id=loan_id)
+    result = await LoanCRUD.retrieve_loan_cached(db=db, loan_id=loan_id)
     if not result:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
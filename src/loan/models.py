@@ -1,7 +1,7 @@
 from datetime import datetime
 from typing import Annotated
 
-from sqlalchemy import String, ForeignKey, CheckConstraint, text
+from sqlalchemy import String, ForeignKey, CheckConstraint, text, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 
@@ -15,15 +15,24 @@ if TYPE_CHECKING:
 created_at = Annotated[
     datetime,
     mapped_column(
-        default=datetime.now(), server_default=text("TIMEZONE('utc', now())")
+        default=datetime.utcnow, server_default=text("TIMEZONE('utc', now())")
     ),
 ]
 updated_at = Annotated[
     datetime,
     mapped_column(
-        default=datetime.now(),
+        default=datetime.utcnow,
+        server_default=text("TIMEZONE('utc', now())"),
+        onupdate=datetime.utcnow,
+    ),
+]
+# created_at of monthly partitioned tables, it has to be part of the primary key
+partition_key = Annotated[
+    datetime,
+    mapped_column(
+        primary_key=True,
+        default=datetime.utcnow,
         server_default=text("TIMEZONE('utc', now())"),
-        onupdate=datetime.now(),
     ),
 ]
 
@@ -34,7 +43,9 @@ class LoanType(Base):
     name: Mapped[str] = mapped_column(String(100), unique=True)
     interest: Mapped[int | None] = mapped_column(default=0)
     days: Mapped[int] = mapped_column(default=5)
-    bank_id: Mapped[int] = mapped_column(ForeignKey("bank.id", ondelete="CASCADE"))
+    bank_id: Mapped[int] = mapped_column(
+        ForeignKey("bank.id", ondelete="CASCADE"), index=True
+    )
     created_at: Mapped[created_at]
 
     bank: Mapped["Bank"] = relationship(back_populates="loan_types")
@@ -59,10 +70,10 @@ class Loan(Base):
     __tablename__ = "loan"
     id: Mapped[int] = mapped_column(primary_key=True)
     account_id: Mapped[int] = mapped_column(
-        ForeignKey("account.id", ondelete="RESTRICT")
+        ForeignKey("account.id", ondelete="RESTRICT"), index=True
     )
     loan_type_id: Mapped[int] = mapped_column(
-        ForeignKey("loan_type.id", ondelete="RESTRICT")
+        ForeignKey("loan_type.id", ondelete="RESTRICT"), index=True
     )
 
     amount_out: Mapped[int]
@@ -94,10 +105,10 @@ class Loan(Base):
 
 class LoanCompensation(Base):
     __tablename__ = "loan_compensation"
-    id: Mapped[int] = mapped_column(primary_key=True)
+    id: Mapped[int] = mapped_column(primary_key=True, autoincrement=True)
     amount: Mapped[int] = mapped_column(nullable=False)
     loan_id: Mapped[int] = mapped_column(ForeignKey("loan.id", ondelete="RESTRICT"))
-    created_at: Mapped[created_at]
+    created_at: Mapped[partition_key]
 
     loan: Mapped["Loan"] = relationship(back_populates="compensations")
 
@@ -106,6 +117,8 @@ class LoanCompensation(Base):
             "amount > 0",
             name="check_d_amount_gt_0",
         ),
+        Index("ix_loan_compensation_loan_id_created_at", "loan_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
     )
 
     def __repr__(self) -> str:
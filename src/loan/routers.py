@@ -5,8 +5,15 @@ from sqlalchemy import select
 from src.account.routers import account_that_is_relevant
 from src.account.models import Account
 from src.auth.routers import get_active_auth_user, get_teller_auth_user, get_super_user
-from src.auth.models import User
-from src.database import get_async_session
+from src.auth.schemas import UserAuthSchema
+from src.database import get_async_session, get_async_read_session
+from src.idempotency import IdempotentRoute, idempotent
+from src.dependencies import (
+    PageParams,
+    pagination_params,
+    keyset_paginate,
+    next_page,
+)
 
 from src.loan.crud import LoanCRUD
 from src.loan.dependencies import retrieve_loan_dependency
@@ -21,14 +28,14 @@ from src.loan.schemas import (
     LoanCompensationListSchema,
 )
 
-router = APIRouter(prefix="/bank")
+router = APIRouter(prefix="/bank", route_class=IdempotentRoute)
 
 
 @router.post("/loan_type/create/", tags=["Bank~Loan"])
 async def create_loan_type_in_bank(
     loan_type_schema: LoanTypeCreateSchema,
     db: AsyncSession = Depends(get_async_session),
-    super_user: User = Depends(get_super_user),
+    super_user: UserAuthSchema = Depends(get_super_user),
 ):
     result = await LoanCRUD.create_loan_type_in_bank(
         db=db, loan_schema=loan_type_schema
@@ -41,11 +48,12 @@ async def create_loan_type_in_bank(
 
 
 @router.post("/{account_id}/loan/create/", tags=["Bank~Loan"])
+@idempotent
 async def create_loan_in_account(
     account_id: int,
     loan_schema: LoanCreateSchema,
     db: AsyncSession = Depends(get_async_session),
-    teller: User = Depends(get_teller_auth_user),
+    teller: UserAuthSchema = Depends(get_teller_auth_user),
 ):
     result = await LoanCRUD.create_loan_in_account(
         db=db, loan_schema=loan_schema, account_id=account_id
@@ -58,11 +66,12 @@ async def create_loan_in_account(
 
 
 @router.post("/{loan_id}/create/compensation/", tags=["Bank~Loan"])
+@idempotent
 async def create_loan_compensation(
     compensation_schema: LoanCompensationCreateSchema,
     loan: Loan = Depends(retrieve_loan_dependency),
     db: AsyncSession = Depends(get_async_session),
-    teller: User = Depends(get_teller_auth_user),
+    teller: UserAuthSchema = Depends(get_teller_auth_user),
 ):
     result = await LoanCRUD.create_loan_compensation(
         db=db,
@@ -72,13 +81,15 @@ async def create_loan_compensation(
     return {
         "message": "Loan compensation created successfully",
         "data": LoanCompensationListSchema.model_validate(result, from_attributes=True),
+        "loan": LoanListSchema.model_validate(loan, from_attributes=True),
     }
 
 
 @router.get("/me/loans/", tags=["User-Me-Loan"])
 async def list_loans_user_me(
-    user: User = Depends(get_active_auth_user),
-    db: AsyncSession = Depends(get_async_session),
+    user: UserAuthSchema = Depends(get_active_auth_user),
+    db: AsyncSession = Depends(get_async_read_session),
+    params: PageParams = Depends(pagination_params),
 ):
     query = (
         select(Loan)
@@ -91,10 +102,12 @@ async def list_loans_user_me(
             )
         )
     )
-    result = await db.scalars(query)
-    print(result)
+    query = keyset_paginate(query, params, Loan.id, descending=True)
+    result, next_cursor = next_page(list(await db.scalars(query)), params, Loan.id)
 
     return {
+        "size": params.size,
+        "next_cursor": next_cursor,
         "data": [LoanListSchema.model_validate(i, from_attributes=True) for i in result]
     }
 
@@ -102,18 +115,23 @@ async def list_loans_user_me(
 @router.get("/me/{account_id}/loans/list/", tags=["User-Me-Loan"])
 async def list_loans_in_account_user_me(
     account: Account = Depends(account_that_is_relevant),
-    db: AsyncSession = Depends(get_async_session),
+    db: AsyncSession = Depends(get_async_read_session),
+    params: PageParams = Depends(pagination_params),
 ):
     query = select(Loan).where(Loan.account_id == account.id)
+    query = keyset_paginate(query, params, Loan.id, descending=True)
 
-    result = await db.scalars(query)
+    result, next_cursor = next_page(list(await db.scalars(query)), params, Loan.id)
 
     return {
+        "size": params.size,
+        "next_cursor": next_cursor,
         "data": [LoanListSchema.model_validate(i, from_attributes=True) for i in result]
     }
 
 
 @router.post("/me/{account_id}/loans/apply/", tags=["User-Me-Loan"])
+@idempotent
 async def apply_for_loan_in_account_user_me(
     loan_schema: LoanCreateSchema,
     account: Account = Depends(account_that_is_relevant),
@@ -0,0 +1,2 @@
+def loan_cache_key(loan_id: int) -> str:
+    return f"loan:{loan_id}"
@@ -1,3 +1,6 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
+
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
@@ -7,29 +10,72 @@ from src.bank import routers as bank_routers
 from src.account import routers as account_routers
 from src.teller import routers as teller_routers
 from src.loan import routers as loan_routers
+from src.payroll import routers as payroll_routers
 
 from fastapi import FastAPI
 from starlette.requests import Request
 
-from fastapi_cache import FastAPICache
-from fastapi_cache.backends.redis import RedisBackend
+from prometheus_client import make_asgi_app
 
-from redis import asyncio as aioredis
+from src.account.batching import money_batcher
+from src.auth.utils import hashing_executor
+from src.cache import listen_for_invalidations
 from src.config import settings
+from src.database import (
+    async_engine,
+    replica_engines,
+    current_wal_lsn,
+    READ_AFTER_HEADER,
+)
+from src.membership import membership_index
+from src.redis_client import redis_manager
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    redis_manager.connect()
+    listeners = [asyncio.create_task(listen_for_invalidations())]
+    if settings.MEMBERSHIP_BLOOM_ENABLED:
+        listeners.append(asyncio.create_task(membership_index.listen()))
+
+    yield
 
-app = FastAPI()
+    for listener in listeners:
+        listener.cancel()
+        with suppress(asyncio.CancelledError):
+            await listener
+    # commit whatever the group commit batcher still holds before the pool goes
+    await money_batcher.close()
+    await redis_manager.close()
+    await async_engine.dispose()
+    for engine in replica_engines:
+        await engine.dispose()
+    hashing_executor.shutdown(wait=False, cancel_futures=True)
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(auth_routers.router)
+app.include_router(auth_routers.well_known_router)
 app.include_router(bank_routers.router)
 app.include_router(account_routers.router)
 app.include_router(teller_routers.router)
 app.include_router(loan_routers.router)
+app.include_router(payroll_routers.router)
+
+app.mount("/metrics", make_asgi_app())
 
 
-@app.on_event("startup")
-async def startup():
-    redis = aioredis.from_url(f"redis://{settings.REDIS_HOST}")
-    FastAPICache.init(RedisBackend(redis), prefix="fastapi-cache")
+@app.middleware("http")
+async def read_after_write_token(request: Request, call_next):
+    response = await call_next(request)
+    if (
+        replica_engines
+        and request.method not in ("GET", "HEAD", "OPTIONS")
+        and response.status_code < 400
+    ):
+        response.headers[READ_AFTER_HEADER] = await current_wal_lsn()
+    return response
 
 
 @app.exception_handler(RequestValidationError)
@@ -0,0 +1,253 @@
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import time
+from typing import Literal
+from uuid import UUID
+
+from prometheus_client import Counter
+from redis.exceptions import RedisError, WatchError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.account.models import Account
+from src.bank.models import BankUserAssociation
+from src.config import settings
+from src.database import AsyncSessionLocal
+from src.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+Kind = Literal["bank", "account"]
+
+MEMBERSHIP_CHANNEL = "membership:added"
+# bumped when an addition couldn't be published; every filter is then rebuilt
+BLOOM_GENERATION_KEY = "membership:bloom:generation"
+# member of every loaded set, so an empty set can be told from a cold key
+_LOADED = "-"
+
+MEMBERSHIP_CHECKS = Counter(
+    "membership_checks_total", "Membership checks by where they were answered", ["source"]
+)
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float) -> None:
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str) -> list[int]:
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8]), int.from_bytes(digest[8:]) | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self._bits[position // 8] |= 1 << position % 8
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self._bits[position // 8] & 1 << position % 8
+            for position in self._positions(item)
+        )
+
+
+def _item(kind: Kind, user_id: int, member_id) -> str:
+    return f"{kind}:{user_id}:{member_id}"
+
+
+class MembershipIndex:
+    """
+    Which banks a user is registered to and which accounts they own.
+
+    Each user has a Redis set per kind, loaded from Postgres the first time
+    it is needed and kept up to date by the write paths. In front of it every
+    worker keeps a bloom filter of all memberships. A miss there is a
+    definite "no" without a round trip. The filter is rebuilt whenever the
+    worker (re)subscribes to the channel where additions are published, and
+    when the shared generation moves because an addition couldn't be
+    published. Removals aren't applied to the filter; Redis still answers those.
+
+    While Redis is down every check goes to Postgres.
+    """
+
+    def __init__(self) -> None:
+        self.bloom: BloomFilter | None = None
+        self._building: BloomFilter | None = None
+        self._missed_publish = False
+
+    @staticmethod
+    def _key(kind: Kind, user_id: int) -> str:
+        return f"membership:{kind}:{user_id}"
+
+    @staticmethod
+    def _generation_key(kind: Kind, user_id: int) -> str:
+        return f"membership:{kind}:{user_id}:generation"
+
+    @staticmethod
+    def _member_query(kind: Kind, user_id: int, member_id=None):
+        if kind == "bank":
+            query = select(BankUserAssociation.bank_id).where(
+                BankUserAssociation.user_id == user_id
+            )
+            if member_id is not None:
+                query = query.where(BankUserAssociation.bank_id == member_id)
+        else:
+            query = select(Account.id).where(Account.user_id == user_id)
+            if member_id is not None:
+                query = query.where(Account.id == member_id)
+        return query
+
+    async def is_member(
+        self, db: AsyncSession, kind: Kind, user_id: int, member_id: UUID | int
+    ) -> bool:
+        if self.bloom is not None and _item(kind, user_id, member_id) not in self.bloom:
+            MEMBERSHIP_CHECKS.labels("bloom").inc()
+            return False
+
+        try:
+            is_member, loaded = await get_redis().smismember(
+                self._key(kind, user_id), [str(member_id), _LOADED]
+            )
+            if loaded:
+                MEMBERSHIP_CHECKS.labels("redis").inc()
+                return bool(is_member)
+            MEMBERSHIP_CHECKS.labels("load").inc()
+            return str(member_id) in await self._load(db, kind, user_id)
+        except (RedisError, RuntimeError):
+            MEMBERSHIP_CHECKS.labels("postgres").inc()
+            return await db.scalar(
+                select(self._member_query(kind, user_id, member_id).exists())
+            )
+
+    async def _load(self, db: AsyncSession, kind: Kind, user_id: int) -> set[str]:
+        redis = get_redis()
+        generation = await redis.get(self._generation_key(kind, user_id))
+        members = {str(i) for i in await db.scalars(self._member_query(kind, user_id))}
+
+        # not stored if a membership was added or removed since it was read
+        async with redis.pipeline() as pipe:
+            try:
+                await pipe.watch(self._generation_key(kind, user_id))
+                if await pipe.get(self._generation_key(kind, user_id)) == generation:
+                    pipe.multi()
+                    pipe.delete(self._key(kind, user_id))
+                    pipe.sadd(self._key(kind, user_id), _LOADED, *members)
+                    pipe.expire(
+                        self._key(kind, user_id), settings.MEMBERSHIP_TTL_SECONDS
+                    )
+                    await pipe.execute()
+            except WatchError:
+                pass
+        return members
+
+    async def add(self, kind: Kind, user_id: int, member_id: UUID | int) -> None:
+        """Records a new membership. Call it after commit."""
+        self._bloom_add(_item(kind, user_id, member_id))
+        try:
+            async with get_redis().pipeline(transaction=False) as pipe:
+                # a load running now may have read the members before this
+                # one, so it mustn't store them
+                pipe.incr(self._generation_key(kind, user_id))
+                pipe.expire(
+                    self._generation_key(kind, user_id), settings.MEMBERSHIP_TTL_SECONDS
+                )
+                # a cold key stays cold: without the marker it is loaded in full
+                pipe.sadd(self._key(kind, user_id), str(member_id))
+                pipe.expire(self._key(kind, user_id), settings.MEMBERSHIP_TTL_SECONDS)
+                pipe.publish(
+                    MEMBERSHIP_CHANNEL,
+                    json.dumps(_item(kind, user_id, member_id)),
+                )
+                await pipe.execute()
+        except (RedisError, RuntimeError):
+            # the listener bumps the generation as soon as Redis answers
+            self._missed_publish = True
+            logger.warning("membership addition of user %s was not published", user_id)
+
+    async def remove(self, kind: Kind, user_id: int) -> None:
+        """
+        Drops the user's set after one of their memberships was removed, so it
+        is loaded again. Call it after commit.
+        """
+        try:
+            async with get_redis().pipeline(transaction=False) as pipe:
+                pipe.incr(self._generation_key(kind, user_id))
+                pipe.expire(
+                    self._generation_key(kind, user_id), settings.MEMBERSHIP_TTL_SECONDS
+                )
+                pipe.delete(self._key(kind, user_id))
+                await pipe.execute()
+        except (RedisError, RuntimeError):
+            logger.warning("membership of user %s could not be dropped", user_id)
+
+    def _bloom_add(self, item: str) -> None:
+        for bloom in (self.bloom, self._building):
+            if bloom is not None:
+                bloom.add(item)
+
+    async def _rebuild_bloom(self) -> None:
+        self.bloom = None
+        self._building = BloomFilter(
+            settings.MEMBERSHIP_BLOOM_CAPACITY, settings.MEMBERSHIP_BLOOM_ERROR_RATE
+        )
+        # from the primary: a lagging replica could miss memberships added
+        # before the rebuild, and they would never be published again
+        async with AsyncSessionLocal() as db:
+            for kind, query in (
+                ("bank", select(BankUserAssociation.user_id, BankUserAssociation.bank_id)),
+                ("account", select(Account.user_id, Account.id)),
+            ):
+                rows = await db.stream(
+                    query.execution_options(yield_per=settings.STATEMENT_YIELD_PER)
+                )
+                async for user_id, member_id in rows:
+                    self._building.add(_item(kind, user_id, member_id))
+
+        self.bloom, self._building = self._building, None
+
+    async def _generation(self) -> bytes | None:
+        redis = get_redis()
+        if self._missed_publish:
+            await redis.incr(BLOOM_GENERATION_KEY)
+            self._missed_publish = False
+        return await redis.get(BLOOM_GENERATION_KEY)
+
+    async def listen(self) -> None:
+        """Runs for the life of a worker, keeping its bloom filter complete."""
+        interval = settings.MEMBERSHIP_BLOOM_CHECK_SECONDS
+        while True:
+            pubsub = get_redis().pubsub()
+            try:
+                await pubsub.subscribe(MEMBERSHIP_CHANNEL)
+                generation = await self._generation()
+                # additions published from here on reach the filter being built
+                await self._rebuild_bloom()
+
+                checked_at = time.monotonic()
+                while True:
+                    message = await pubsub.get_message(
+                        ignore_subscribe_messages=True, timeout=interval
+                    )
+                    if message is not None:
+                        self._bloom_add(json.loads(message["data"]))
+                    if time.monotonic() - checked_at < interval:
+                        continue
+                    checked_at = time.monotonic()
+                    if await self._generation() != generation:
+                        logger.warning("membership additions were missed, rebuilding")
+                        self.bloom = None
+                        break
+            except Exception:
+                # a filter that missed additions would give wrong negatives
+                self.bloom = self._building = None
+                logger.exception("membership filter listener failed, rebuilding")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.reset()
+
+
+membership_index = MembershipIndex()
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from sqlalchemy import BigInteger, String, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Mapped, mapped_column
+
+from src.database import Base
+
+
+class OutboxMessage(Base):
+    """A celery task waiting to be published by the outbox relay."""
+
+    __tablename__ = "outbox_message"
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    task: Mapped[str] = mapped_column(String(255))
+    args: Mapped[list] = mapped_column(JSONB)
+    kwargs: Mapped[dict] = mapped_column(JSONB)
+    created_at: Mapped[datetime] = mapped_column(
+        default=datetime.utcnow, server_default=text("TIMEZONE('utc', now())")
+    )
+
+
+def enqueue(db: AsyncSession, task: str, *args, **kwargs) -> None:
+    """
+    Queues the celery task named `task` in the caller's transaction, so it is
+    published only if the transaction commits and the request never talks to
+    the broker. Arguments need to be JSON serializable.
+    """
+    db.add(OutboxMessage(task=task, args=list(args), kwargs=kwargs))
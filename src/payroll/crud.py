@@ -0,0 +1,43 @@
+import shutil
+
+from fastapi import HTTPException, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import settings
+from src.outbox import enqueue
+from src.payroll.models import PayrollJob
+
+
+def payroll_file_path(job_id: int):
+    return settings.PAYROLL_UPLOAD_DIR / f"{job_id}.csv"
+
+
+class PayrollCRUD:
+
+    @staticmethod
+    async def create_job(db: AsyncSession, file: UploadFile, user_id: int) -> PayrollJob:
+        new_job = PayrollJob(file_name=file.filename or "payroll.csv", created_by=user_id)
+        db.add(new_job)
+        await db.flush()
+
+        # the upload is already spooled to disk, copy it over in chunks
+        path = payroll_file_path(new_job.id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(path, "wb") as out:
+                await run_in_threadpool(shutil.copyfileobj, file.file, out)
+        except OSError as e:
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail={"file": f"could not store the file: {e.strerror}"},
+            )
+
+        enqueue(db, "src.tasks.tasks.ingest_payroll", new_job.id)
+        await db.commit()
+        return new_job
+
+    @staticmethod
+    async def retrieve_job(db: AsyncSession, job_id: int) -> PayrollJob | None:
+        return await db.get(PayrollJob, job_id)
@@ -0,0 +1,64 @@
+from datetime import datetime
+from typing import Annotated
+
+from sqlalchemy import BigInteger, ForeignKey, String, Text, text, Index
+from sqlalchemy.orm import Mapped, mapped_column
+
+from src.database import Base
+
+created_at = Annotated[
+    datetime,
+    mapped_column(
+        default=datetime.utcnow, server_default=text("TIMEZONE('utc', now())")
+    ),
+]
+updated_at = Annotated[
+    datetime,
+    mapped_column(
+        default=datetime.utcnow,
+        server_default=text("TIMEZONE('utc', now())"),
+        onupdate=datetime.utcnow,
+    ),
+]
+
+
+class PayrollJob(Base):
+    __tablename__ = "payroll_job"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    created_by: Mapped[int | None] = mapped_column(
+        ForeignKey("user.id", ondelete="SET NULL")
+    )
+    file_name: Mapped[str] = mapped_column(String(255))
+    # pending -> loading -> applying -> done | failed
+    status: Mapped[str] = mapped_column(String(20), default="pending")
+    loaded_rows: Mapped[int] = mapped_column(default=0)
+    invalid_rows: Mapped[int] = mapped_column(default=0)
+    applied_rows: Mapped[int] = mapped_column(default=0)
+    applied_amount: Mapped[int] = mapped_column(BigInteger, default=0)
+    error: Mapped[str | None] = mapped_column(Text)
+    created_at: Mapped[created_at]
+    updated_at: Mapped[updated_at]
+
+    def __repr__(self) -> str:
+        return f"<PayrollJob:{self.id}~{self.status}>"
+
+
+class PayrollStaging(Base):
+    """
+    Rows of payroll files COPY'd in before they are applied. Unlogged: it is
+    scratch space, so its writes skip the WAL and it is emptied on a crash.
+    """
+
+    __tablename__ = "payroll_staging"
+    id: Mapped[int] = mapped_column(primary_key=True)
+    job_id: Mapped[int] = mapped_column(
+        ForeignKey("payroll_job.id", ondelete="CASCADE")
+    )
+    line: Mapped[int]
+    account_id: Mapped[int]
+    amount: Mapped[int]
+
+    __table_args__ = (
+        Index("ix_payroll_staging_job_id", "job_id"),
+        {"prefixes": ["UNLOGGED"]},
+    )
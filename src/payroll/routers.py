@@ -0,0 +1,44 @@
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.auth.routers import get_teller_auth_user
+from src.auth.schemas import UserAuthSchema
+from src.database import get_async_session
+from src.payroll.crud import PayrollCRUD
+from src.payroll.schemas import PayrollJobListSchema
+
+router = APIRouter(prefix="/payroll")
+
+
+@router.post("/upload/", tags=["Bank~Payroll"])
+async def upload_payroll(
+    file: UploadFile,
+    db: AsyncSession = Depends(get_async_session),
+    teller: UserAuthSchema = Depends(get_teller_auth_user),
+):
+    """
+    CSV with an `account_id,amount` header, one credit per line. It is applied
+    in the background; poll the job for its progress.
+    """
+    job = await PayrollCRUD.create_job(db=db, file=file, user_id=teller.id)
+
+    return {
+        "message": "Payroll accepted",
+        "data": PayrollJobListSchema.model_validate(job),
+    }
+
+
+@router.get("/{job_id}/", tags=["Bank~Payroll"])
+async def retrieve_payroll_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_async_session),
+    teller: UserAuthSchema = Depends(get_teller_auth_user),
+):
+    job = await PayrollCRUD.retrieve_job(db=db, job_id=job_id)
+
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail={"job_id": f"Payroll job with id {job_id} is not found"},
+        )
+    return {"data": PayrollJobListSchema.model_validate(job)}
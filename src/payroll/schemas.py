@@ -0,0 +1,18 @@
+from datetime import datetime
+
+from pydantic import BaseModel, ConfigDict
+
+
+class PayrollJobListSchema(BaseModel):
+    id: int
+    file_name: str
+    status: str
+    loaded_rows: int
+    invalid_rows: int
+    applied_rows: int
+    applied_amount: int
+    error: str | None
+    created_at: datetime
+    updated_at: datetime
+
+    model_config = ConfigDict(from_attributes=True)
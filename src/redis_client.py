@@ -0,0 +1,84 @@
+import time
+
+from prometheus_client import Gauge, Histogram
+from redis import asyncio as aioredis
+from redis.asyncio.connection import BlockingConnectionPool
+
+from src.config import settings
+
+REDIS_POOL_IN_USE = Gauge(
+    "redis_pool_connections_in_use", "Redis connections checked out of the pool"
+)
+REDIS_POOL_CREATED = Gauge(
+    "redis_pool_connections_created", "Redis connections opened by the pool"
+)
+REDIS_POOL_WAIT = Histogram(
+    "redis_pool_wait_seconds", "Time spent waiting for a free Redis connection"
+)
+
+
+class InstrumentedConnectionPool(BlockingConnectionPool):
+    """
+    Blocking pool: once `max_connections` are checked out, callers wait up
+    to `timeout` seconds for one to be released instead of opening more.
+    """
+
+    in_use = 0
+
+    async def get_connection(self, command_name, *keys, **options):
+        start = time.perf_counter()
+        connection = await super().get_connection(command_name, *keys, **options)
+        REDIS_POOL_WAIT.observe(time.perf_counter() - start)
+
+        self.in_use += 1
+        return connection
+
+    async def release(self, connection):
+        self.in_use -= 1
+        await super().release(connection)
+
+
+class RedisManager:
+    def __init__(self, url: str, max_connections: int, timeout: int) -> None:
+        self.url = url
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.pool: InstrumentedConnectionPool | None = None
+        self._client: aioredis.Redis | None = None
+
+        REDIS_POOL_IN_USE.set_function(lambda: self.pool.in_use if self.pool else 0)
+        REDIS_POOL_CREATED.set_function(
+            lambda: len(self.pool._connections) if self.pool else 0
+        )
+
+    @property
+    def client(self) -> aioredis.Redis:
+        if self._client is None:
+            raise RuntimeError("Redis is not connected, call connect() first")
+        return self._client
+
+    def connect(self) -> None:
+        self.pool = InstrumentedConnectionPool.from_url(
+            self.url,
+            max_connections=self.max_connections,
+            timeout=self.timeout,
+        )
+        self._client = aioredis.Redis(connection_pool=self.pool)
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+            await self.pool.disconnect()
+        self._client = None
+        self.pool = None
+
+
+redis_manager = RedisManager(
+    url=settings.REDIS_URL,
+    max_connections=settings.REDIS_MAX_CONNECTIONS,
+    timeout=settings.REDIS_POOL_TIMEOUT,
+)
+
+
+def get_redis() -> aioredis.Redis:
+    return redis_manager.client
@@ -0,0 +1,21 @@
+from datetime import datetime
+
+from sqlalchemy import delete
+
+from src.database import create_task_engine
+from src.idempotency import IdempotencyRecord
+
+
+async def purge_idempotency_records() -> int:
+    engine = create_task_engine()
+    try:
+        async with engine.begin() as connection:
+            result = await connection.execute(
+                delete(IdempotencyRecord).where(
+                    IdempotencyRecord.expires_at < datetime.utcnow()
+                )
+            )
+    finally:
+        await engine.dispose()
+
+    return result.rowcount
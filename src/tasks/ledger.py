@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import DateTime, and_, func, insert, literal, or_, select
+
+from src.account.models import BalanceCheckpoint, LedgerEntry
+from src.config import settings
+from src.database import create_task_engine
+
+
+async def create_balance_checkpoints() -> int:
+    """
+    Checkpoints every account with ledger entries since its last checkpoint.
+    `as_of` lags behind now, so entries of transactions still in flight
+    (their created_at is the transaction start) aren't skipped.
+    """
+    as_of = datetime.utcnow() - timedelta(
+        seconds=settings.LEDGER_CHECKPOINT_LAG_SECONDS
+    )
+
+    previous = (
+        select(
+            BalanceCheckpoint.account_id,
+            BalanceCheckpoint.balance,
+            BalanceCheckpoint.as_of,
+        )
+        .distinct(BalanceCheckpoint.account_id)
+        .order_by(BalanceCheckpoint.account_id, BalanceCheckpoint.as_of.desc())
+        .cte("previous")
+    )
+    deltas = (
+        select(
+            LedgerEntry.account_id,
+            func.sum(LedgerEntry.balance_delta).label("delta"),
+        )
+        .outerjoin(previous, previous.c.account_id == LedgerEntry.account_id)
+        .where(
+            and_(
+                LedgerEntry.created_at <= as_of,
+                or_(
+                    previous.c.as_of.is_(None),
+                    LedgerEntry.created_at > previous.c.as_of,
+                ),
+            )
+        )
+        .group_by(LedgerEntry.account_id)
+        .subquery("deltas")
+    )
+    query = insert(BalanceCheckpoint).from_select(
+        ["account_id", "balance", "as_of"],
+        select(
+            deltas.c.account_id,
+            func.coalesce(previous.c.balance, 0) + deltas.c.delta,
+            literal(as_of, DateTime),
+        ).outerjoin(previous, previous.c.account_id == deltas.c.account_id),
+    )
+
+    engine = create_task_engine()
+    try:
+        async with engine.begin() as connection:
+            result = await connection.execute(query)
+    finally:
+        await engine.dispose()
+
+    return result.rowcount
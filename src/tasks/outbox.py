@@ -0,0 +1,82 @@
+import asyncio
+import logging
+
+from celery import Celery
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.config import settings
+from src.database import create_task_engine
+from src.outbox import OutboxMessage
+
+logger = logging.getLogger(__name__)
+
+
+async def relay_outbox_batch(engine: AsyncEngine, app: Celery, batch_size: int) -> int:
+    """
+    Publishes up to `batch_size` outbox messages and deletes them in the
+    same transaction. Locked rows are skipped, so several relays can run side
+    by side. Delivery is at least once: if the commit fails after publishing,
+    the batch is published again.
+    """
+    async with engine.begin() as connection:
+        messages = (
+            await connection.execute(
+                select(
+                    OutboxMessage.id,
+                    OutboxMessage.task,
+                    OutboxMessage.args,
+                    OutboxMessage.kwargs,
+                )
+                .order_by(OutboxMessage.id)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+        ).all()
+        if not messages:
+            return 0
+
+        # one broker connection for the whole batch
+        with app.producer_or_acquire() as producer:
+            for message in messages:
+                app.send_task(
+                    message.task,
+                    args=message.args,
+                    kwargs=message.kwargs,
+                    producer=producer,
+                )
+
+        await connection.execute(
+            delete(OutboxMessage).where(
+                OutboxMessage.id.in_([message.id for message in messages])
+            )
+        )
+
+    return len(messages)
+
+
+async def run_relay(app: Celery) -> None:
+    engine = create_task_engine()
+
+    try:
+        while True:
+            try:
+                relayed = await relay_outbox_batch(
+                    engine, app, settings.OUTBOX_BATCH_SIZE
+                )
+            except Exception:
+                logger.exception("outbox relay failed, retrying")
+                relayed = 0
+
+            # a full batch means there is likely more waiting
+            if relayed < settings.OUTBOX_BATCH_SIZE:
+                await asyncio.sleep(settings.OUTBOX_POLL_SECONDS)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    from src.tasks.tasks import app
+
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_relay(app))
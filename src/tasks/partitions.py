@@ -0,0 +1,149 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from src.config import settings
+from src.database import create_task_engine
+
+logger = logging.getLogger(__name__)
+
+# tables partitioned by month on created_at, see the partition_history_tables migration
+PARTITIONED_TABLES = ("deposit", "withdraw", "loan_compensation")
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+async def create_partitions(
+    connection: AsyncConnection, table: str, months_ahead: int
+) -> list[str]:
+    """
+    Makes sure there is a partition for the current month and the
+    `months_ahead` following ones, so new rows never land in the default one.
+
+    Rows that landed in the default partition while a month had no partition
+    of its own (a late run) are moved into the new one in the same
+    transaction. Otherwise Postgres refuses to create the partition.
+    """
+    current = add_months(datetime.utcnow(), 0)
+    created = []
+
+    for i in range(months_ahead + 1):
+        month = add_months(current, i)
+        name = partition_name(table, month)
+
+        exists = await connection.scalar(
+            text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name}
+        )
+        if exists:
+            continue
+
+        bounds = (
+            f"FOR VALUES FROM ('{month.isoformat()}') "
+            f"TO ('{add_months(month, 1).isoformat()}')"
+        )
+        in_range = (
+            f"created_at >= '{month.isoformat()}' "
+            f"AND created_at < '{add_months(month, 1).isoformat()}'"
+        )
+        stray_rows = await connection.scalar(
+            text(f"SELECT EXISTS (SELECT 1 FROM {table}_default WHERE {in_range})")
+        )
+
+        if stray_rows:
+            await connection.execute(
+                text(
+                    f"CREATE TABLE {name} "
+                    f"(LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"
+                )
+            )
+            await connection.execute(
+                text(
+                    f"WITH moved AS (DELETE FROM {table}_default "
+                    f"WHERE {in_range} RETURNING *) "
+                    f"INSERT INTO {name} SELECT * FROM moved"
+                )
+            )
+            await connection.execute(
+                text(f"ALTER TABLE {table} ATTACH PARTITION {name} {bounds}")
+            )
+        else:
+            await connection.execute(
+                text(f"CREATE TABLE {name} PARTITION OF {table} {bounds}")
+            )
+        created.append(name)
+
+    return created
+
+
+async def detach_partitions(
+    connection: AsyncConnection, table: str, retention_months: int
+) -> list[str]:
+    """
+    Detaches monthly partitions older than `retention_months`. They stay as
+    plain tables to be archived or dropped, and stop being scanned, vacuumed
+    or indexed as part of `table`.
+
+    DETACH ... CONCURRENTLY isn't allowed while a default partition exists,
+    so this takes a short ACCESS EXCLUSIVE lock on `table` per partition.
+    """
+    cutoff = add_months(datetime.utcnow(), -retention_months)
+    partitions = await connection.scalars(
+        text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = :table"
+        ),
+        {"table": table},
+    )
+
+    detached = []
+    for name in sorted(partitions):
+        try:
+            month = datetime.strptime(name.removeprefix(f"{table}_p"), "%Y_%m")
+        except ValueError:
+            # the default partition
+            continue
+
+        if add_months(month, 1) <= cutoff:
+            await connection.execute(text(f"ALTER TABLE {table} DETACH PARTITION {name}"))
+            detached.append(name)
+
+    return detached
+
+
+async def maintain_partitions() -> dict[str, dict]:
+    engine = create_task_engine()
+    result = {}
+
+    try:
+        for table in PARTITIONED_TABLES:
+            # one table failing doesn't keep the others from being maintained
+            try:
+                async with engine.begin() as connection:
+                    result[table] = {
+                        "created": await create_partitions(
+                            connection, table, settings.PARTITION_MONTHS_AHEAD
+                        ),
+                        "detached": [],
+                    }
+                    if settings.PARTITION_RETENTION_MONTHS is not None:
+                        result[table]["detached"] = await detach_partitions(
+                            connection, table, settings.PARTITION_RETENTION_MONTHS
+                        )
+            except Exception:
+                logger.exception("partitions of %s could not be maintained", table)
+                result[table] = {"created": [], "detached": [], "failed": True}
+    finally:
+        await engine.dispose()
+
+    return result
@@ -0,0 +1,204 @@
+import csv
+from typing import Iterator
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.account.crud import ledger_entry_cte
+from src.account.models import Account, Deposit
+from src.config import settings
+from src.database import create_task_engine
+from src.payroll.crud import payroll_file_path
+from src.payroll.models import PayrollJob, PayrollStaging
+
+STAGING_COLUMNS = ["job_id", "line", "account_id", "amount"]
+
+
+def read_payroll(path, job_id: int, invalid: list[int]) -> Iterator[tuple]:
+    """
+    Yields staging records from the CSV without reading it whole. Lines that
+    aren't a valid credit are counted in `invalid` and skipped.
+    """
+    with open(path, newline="") as file:
+        for line, row in enumerate(csv.DictReader(file), start=2):
+            try:
+                account_id, amount = int(row["account_id"]), int(row["amount"])
+            except (KeyError, TypeError, ValueError):
+                invalid[0] += 1
+                continue
+            # same rule as the deposit table's check constraint
+            if account_id <= 0 or amount <= 100_000:
+                invalid[0] += 1
+                continue
+            yield job_id, line, account_id, amount
+
+
+async def _set_job(engine: AsyncEngine, job_id: int, **values) -> None:
+    async with engine.begin() as connection:
+        await connection.execute(
+            update(PayrollJob).where(PayrollJob.id == job_id).values(**values)
+        )
+
+
+async def _copy_to_staging(engine: AsyncEngine, job_id: int) -> None:
+    invalid = [0]
+    records = read_payroll(payroll_file_path(job_id), job_id, invalid)
+
+    async with engine.connect() as connection:
+        raw = (await connection.get_raw_connection()).driver_connection
+        loaded = 0
+        while True:
+            chunk = [r for _, r in zip(range(settings.PAYROLL_COPY_CHUNK), records)]
+            if not chunk:
+                break
+            # every chunk is its own COPY, so progress is visible while loading
+            await raw.copy_records_to_table(
+                PayrollStaging.__tablename__, records=chunk, columns=STAGING_COLUMNS
+            )
+            loaded += len(chunk)
+            await _set_job(
+                engine, job_id, loaded_rows=loaded, invalid_rows=invalid[0]
+            )
+
+    await _set_job(engine, job_id, invalid_rows=invalid[0])
+
+
+async def _apply_staging(engine: AsyncEngine, job_id: int) -> None:
+    # rows of existing accounts only; the join is the validation
+    valid = (
+        select(PayrollStaging.account_id, PayrollStaging.amount)
+        .join(Account, Account.id == PayrollStaging.account_id)
+        .where(PayrollStaging.job_id == job_id)
+        .cte("valid")
+    )
+    deposited = (
+        insert(Deposit)
+        .from_select(
+            ["amount", "account_id"],
+            select(valid.c.amount, valid.c.account_id),
+            include_defaults=False,
+        )
+        .returning(Deposit.id, Deposit.amount, Deposit.account_id, Deposit.created_at)
+        .cte("deposited")
+    )
+    recorded = ledger_entry_cte(
+        "recorded",
+        "deposit",
+        account_id=deposited.c.account_id,
+        reference_id=deposited.c.id,
+        amount=deposited.c.amount,
+        balance_delta=deposited.c.amount,
+        created_at=deposited.c.created_at,
+    )
+    totals = (
+        select(deposited.c.account_id, func.sum(deposited.c.amount).label("total"))
+        .group_by(deposited.c.account_id)
+        .subquery("totals")
+    )
+    credited = (
+        update(Account)
+        .where(Account.id == totals.c.account_id)
+        .values(money=func.coalesce(Account.money, 0) + totals.c.total)
+        .returning(Account.id)
+        .cte("credited")
+    )
+    query = select(
+        func.count(deposited.c.id), func.coalesce(func.sum(deposited.c.amount), 0)
+    ).add_cte(recorded, credited)
+
+    async with engine.begin() as connection:
+        # the job row is locked first, so deliveries of the same job apply one
+        # after the other and the later ones find it done
+        job_status = await connection.scalar(
+            select(PayrollJob.status)
+            .where(PayrollJob.id == job_id)
+            .with_for_update()
+        )
+        if job_status == "done":
+            await connection.execute(
+                delete(PayrollStaging).where(PayrollStaging.job_id == job_id)
+            )
+            return
+
+        # accounts locked in id order, so this can't deadlock with other writers
+        await connection.execute(
+            select(Account.id)
+            .where(
+                Account.id.in_(
+                    select(PayrollStaging.account_id).where(
+                        PayrollStaging.job_id == job_id
+                    )
+                )
+            )
+            .order_by(Account.id)
+            .with_for_update(key_share=True)
+        )
+        applied_rows, applied_amount = (await connection.execute(query)).one()
+        loaded_rows = await connection.scalar(
+            select(PayrollJob.loaded_rows).where(PayrollJob.id == job_id)
+        )
+
+        await connection.execute(
+            delete(PayrollStaging).where(PayrollStaging.job_id == job_id)
+        )
+        # set together with the credits, under the job's lock
+        await connection.execute(
+            update(PayrollJob)
+            .where(PayrollJob.id == job_id)
+            .values(
+                status="done",
+                applied_rows=applied_rows,
+                applied_amount=applied_amount,
+                invalid_rows=PayrollJob.invalid_rows + loaded_rows - applied_rows,
+            )
+        )
+
+
+async def ingest_payroll_file(job_id: int) -> str:
+    engine = create_task_engine()
+
+    try:
+        # claimed in one statement, so of concurrent deliveries of a job only
+        # one loads it; the others find it taken and return its status
+        async with engine.begin() as connection:
+            claimed = await connection.scalar(
+                update(PayrollJob)
+                .where(PayrollJob.id == job_id, PayrollJob.status == "pending")
+                .values(status="loading", loaded_rows=0, invalid_rows=0)
+                .returning(PayrollJob.id)
+            )
+            if claimed is None:
+                return await connection.scalar(
+                    select(PayrollJob.status).where(PayrollJob.id == job_id)
+                )
+            await connection.execute(
+                delete(PayrollStaging).where(PayrollStaging.job_id == job_id)
+            )
+
+        await _copy_to_staging(engine, job_id)
+
+        await _set_job(engine, job_id, status="applying")
+        await _apply_staging(engine, job_id)
+    except OSError:
+        # handed back for the task to retry; "done" is set in the same
+        # transaction as the credits, so anything short of it can be started
+        # over from the file
+        async with engine.begin() as connection:
+            await connection.execute(
+                update(PayrollJob)
+                .where(PayrollJob.id == job_id, PayrollJob.status != "done")
+                .values(status="pending")
+            )
+        raise
+    except Exception as e:
+        await _set_job(engine, job_id, status="failed", error=str(e))
+        async with engine.begin() as connection:
+            await connection.execute(
+                delete(PayrollStaging).where(PayrollStaging.job_id == job_id)
+            )
+        raise
+    finally:
+        await engine.dispose()
+
+    payroll_file_path(job_id).unlink(missing_ok=True)
+    return "done"
@@ -1,3 +1,4 @@
+import asyncio
 import smtplib
 import ssl
 from email.mime.multipart import MIMEMultipart
@@ -5,9 +6,53 @@ from email.mime.text import MIMEText
 from fastapi import HTTPException
 
 from celery import Celery
+from celery.schedules import crontab
 from src.config import settings
+from src.tasks.idempotency import purge_idempotency_records
+from src.tasks.ledger import create_balance_checkpoints
+from src.tasks.partitions import maintain_partitions
+from src.tasks.payroll import ingest_payroll_file
 
-app = Celery("tasks", broker=f"redis://{settings.REDIS_HOST}:{settings.REDIS_PORT}")
+app = Celery("tasks", broker=settings.REDIS_URL)
+app.conf.broker_pool_limit = settings.REDIS_MAX_CONNECTIONS
+app.conf.beat_schedule = {
+    "maintain-partitions": {
+        "task": "src.tasks.tasks.maintain_history_partitions",
+        "schedule": crontab(minute=0, hour=3),
+    },
+    "balance-checkpoints": {
+        "task": "src.tasks.tasks.checkpoint_balances",
+        "schedule": crontab(minute=30),
+    },
+    "purge-idempotency-records": {
+        "task": "src.tasks.tasks.purge_expired_idempotency_records",
+        "schedule": crontab(minute=45),
+    },
+}
+
+
+@app.task
+def maintain_history_partitions():
+    return asyncio.run(maintain_partitions())
+
+
+@app.task
+def checkpoint_balances():
+    return asyncio.run(create_balance_checkpoints())
+
+
+@app.task
+def purge_expired_idempotency_records():
+    return asyncio.run(purge_idempotency_records())
+
+
+@app.task(bind=True, max_retries=3, default_retry_delay=30)
+def ingest_payroll(self, job_id):
+    try:
+        return asyncio.run(ingest_payroll_file(job_id))
+    except OSError as e:
+        # e.g. the upload isn't visible on the shared volume yet
+        raise self.retry(exc=e)
 
 
 @app.task
@@ -2,6 +2,8 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 
 from src.auth.models import User
+from src.auth.utils import invalidate_principal
+from src.dependencies import PageParams, keyset_paginate, next_page
 
 from src.bank.models import Bank
 from src.teller.models import Teller
@@ -10,7 +12,9 @@ from src.teller.models import Teller
 class TellerCRUD:
 
     @staticmethod
-    async def list_tellers_of_bank(db: AsyncSession, bank: Bank) -> list:
+    async def list_tellers_of_bank(
+        db: AsyncSession, bank: Bank, params: PageParams
+    ) -> tuple[list, str | None]:
         query = (
             select(
                 User.id,
@@ -24,12 +28,12 @@ class TellerCRUD:
             )
             .select_from(User)
             .join(Teller, Teller.user_id == User.id)
-            .join(Bank, Teller.bank_id == bank.id)
+            .where(Teller.bank_id == bank.id)
         )
+        query = keyset_paginate(query, params, User.id)
 
-        result = await db.execute(query)
-        objs = result.unique().all()
-        return list(objs)
+        result = (await db.execute(query)).all()
+        return next_page(list(result), params, User.id)
 
     @staticmethod
     async def add_teller_to_bank(db: AsyncSession, bank: Bank, user: User) -> User:
@@ -37,4 +41,5 @@ class TellerCRUD:
         user.is_teller = True
         db.add(new_teller)
         await db.commit()
+        await invalidate_principal(user.id)
         return new_teller.user
@@ -17,7 +17,7 @@ updated_at = Annotated[
     datetime,
     mapped_column(
         server_default=text("TIMEZONE('utc', now())"),
-        onupdate=datetime.now(tz=timezone.utc),
+        onupdate=datetime.utcnow,
     ),
 ]
 
@@ -25,7 +25,7 @@ updated_at = Annotated[
 class Teller(Base):
     __tablename__ = "teller"
     id: Mapped[int] = mapped_column(primary_key=True)
-    bank_id: Mapped[int] = mapped_column(ForeignKey("bank.id"))
+    bank_id: Mapped[int] = mapped_column(ForeignKey("bank.id"), index=True)
     user_id: Mapped[int] = mapped_column(ForeignKey("user.id"), unique=True)
 
     bank: Mapped["Bank"] = relationship(back_populates="tellers")
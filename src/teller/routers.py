@@ -4,9 +4,10 @@ from sqlalchemy.exc import IntegrityError
 
 from src.auth.models import User
 from src.auth.routers import get_super_user
-from src.auth.schemas import UserListSchema
+from src.auth.schemas import UserListSchema, UserAuthSchema
 from src.bank.dependencies import retrieve_bank_dependency
-from src.database import get_async_session
+from src.database import get_async_session, get_async_read_session
+from src.dependencies import PageParams, pagination_params
 
 from src.teller.crud import TellerCRUD
 from src.bank.models import Bank
@@ -19,12 +20,16 @@ router = APIRouter(prefix="/teller")
 @router.get("/list/{bank_id}/", tags=["Bank~Teller"])
 async def list_tellers_in_bank(
     bank: Bank = Depends(retrieve_bank_dependency),
-    db: AsyncSession = Depends(get_async_session),
-    super_user: User = Depends(get_super_user),
+    db: AsyncSession = Depends(get_async_read_session),
+    super_user: UserAuthSchema = Depends(get_super_user),
+    params: PageParams = Depends(pagination_params),
 ):
-    result = await TellerCRUD.list_tellers_of_bank(db=db, bank=bank)
-    print(result)
+    result, next_cursor = await TellerCRUD.list_tellers_of_bank(
+        db=db, bank=bank, params=params
+    )
     return {
+        "size": params.size,
+        "next_cursor": next_cursor,
         "data": [UserListSchema.model_validate(i, from_attributes=True) for i in result]
     }
 
@@ -34,7 +39,7 @@ async def add_teller_to_bank(
     bank: Bank = Depends(retrieve_bank_dependency),
     user: User = Depends(retrieve_user_dependency),
     db: AsyncSession = Depends(get_async_session),
-    super_user: User = Depends(get_super_user),
+    super_user: UserAuthSchema = Depends(get_super_user),
 ):
     try:
         result = await TellerCRUD.add_teller_to_bank(db=db, bank=bank, user=user)
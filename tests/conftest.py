@@ -0,0 +1,29 @@
+import asyncio
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+# registers every model, so relationships between the domains resolve
+import src.main  # noqa: F401
+from src.database import create_task_engine
+
+
+async def _ping(engine) -> None:
+    async with engine.connect() as connection:
+        await connection.execute(text("SELECT 1"))
+
+
+@pytest.fixture(scope="session")
+def engine():
+    """
+    Engine of the database from the environment, migrated to head. Tests run
+    their coroutines with asyncio.run, so the engine doesn't pool connections.
+    """
+    engine = create_task_engine()
+    try:
+        asyncio.run(_ping(engine))
+    except (OSError, SQLAlchemyError) as e:
+        pytest.skip(f"database is not reachable: {e}")
+    yield engine
+    asyncio.run(engine.dispose())
@@ -0,0 +1,47 @@
+from uuid import uuid4
+
+from sqlalchemy import delete, insert
+
+from src.account.models import (
+    Account,
+    AccountBalanceStripe,
+    Deposit,
+    LedgerEntry,
+    Withdraw,
+)
+from src.auth.models import User
+from src.bank.models import Bank
+
+
+async def create_account(session_local, money: int | None = 0, stripes: int = 0) -> Account:
+    """An account of a fresh user in a fresh bank; drop it with `drop_account`."""
+    async with session_local() as db:
+        user = User(
+            name="test",
+            email=f"{uuid4()}@example.com",
+            phone_number="+998900000000",
+            hashed_password=b"-",
+        )
+        bank = Bank(name=f"test-{uuid4()}")
+        db.add_all([user, bank])
+        await db.flush()
+        account = Account(user_id=user.id, bank_id=bank.id, money=money, stripes=stripes)
+        db.add(account)
+        await db.flush()
+        if stripes:
+            await db.execute(
+                insert(AccountBalanceStripe),
+                [{"account_id": account.id, "stripe": i} for i in range(stripes)],
+            )
+        await db.commit()
+        return account
+
+
+async def drop_account(session_local, account: Account) -> None:
+    async with session_local() as db:
+        for model in (LedgerEntry, Deposit, Withdraw):
+            await db.execute(delete(model).where(model.account_id == account.id))
+        await db.execute(delete(Account).where(Account.id == account.id))
+        await db.execute(delete(Bank).where(Bank.id == account.bank_id))
+        await db.execute(delete(User).where(User.id == account.user_id))
+        await db.commit()
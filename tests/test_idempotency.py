@@ -0,0 +1,120 @@
+import asyncio
+import json
+from uuid import uuid4
+
+from fastapi import APIRouter, FastAPI
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from factories import create_account, drop_account
+from src.account.crud import AccountCRUD
+from src.account.models import Account
+from src.account.schemas import DepositCreateSchema, WithdrawCreateSchema
+from src.database import async_engine
+from src.idempotency import (
+    IDEMPOTENCY_HEADER,
+    REPLAYED_HEADER,
+    IdempotentRoute,
+    idempotent,
+)
+
+
+def _app(session_local, account: Account) -> FastAPI:
+    router = APIRouter(route_class=IdempotentRoute)
+
+    @router.post("/withdraw/")
+    @idempotent
+    async def withdraw(withdraw_schema: WithdrawCreateSchema):
+        async with session_local() as db:
+            result = await AccountCRUD.create_withdraw_in_account(
+                db=db, account=account, withdraw_schema=withdraw_schema
+            )
+        return {"id": result.id}
+
+    app = FastAPI()
+    app.include_router(router)
+    return app
+
+
+async def _post(app: FastAPI, path: str, body: dict, idempotency_key: str):
+    """Calls the app over ASGI; returns the status, headers and JSON body."""
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "POST",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [
+            (b"content-type", b"application/json"),
+            (IDEMPOTENCY_HEADER.lower().encode(), idempotency_key.encode()),
+        ],
+        "client": ("127.0.0.1", 1),
+        "server": ("test", 80),
+    }
+    requests = [
+        {"type": "http.request", "body": json.dumps(body).encode(), "more_body": False}
+    ]
+    messages = []
+
+    async def receive():
+        if requests:
+            return requests.pop()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    start = next(m for m in messages if m["type"] == "http.response.start")
+    content = b"".join(
+        m.get("body", b"") for m in messages if m["type"] == "http.response.body"
+    )
+    headers = {name.decode().lower(): value.decode() for name, value in start["headers"]}
+    return start["status"], headers, json.loads(content)
+
+
+async def _run(engine) -> None:
+    session_local = async_sessionmaker(bind=engine, expire_on_commit=False)
+    account = await create_account(session_local, money=0)
+    app = _app(session_local, account)
+    key = str(uuid4())
+    try:
+        # refused for lack of money: nothing was written, so the key is free
+        status, _, _ = await _post(app, "/withdraw/", {"amount": 200_000}, key)
+        assert status == 400
+
+        async with session_local() as db:
+            await AccountCRUD.create_deposit_in_account(
+                db=db,
+                account=account,
+                deposit_schema=DepositCreateSchema(amount=500_000),
+            )
+
+        status, headers, body = await _post(app, "/withdraw/", {"amount": 200_000}, key)
+        assert status == 200
+        assert REPLAYED_HEADER.lower() not in headers
+
+        status, headers, replayed = await _post(
+            app, "/withdraw/", {"amount": 200_000}, key
+        )
+        assert status == 200
+        assert headers[REPLAYED_HEADER.lower()] == "true"
+        assert replayed == body
+
+        async with session_local() as db:
+            balance = await db.scalar(
+                select(Account.balance).where(Account.id == account.id)
+            )
+        assert balance == 300_000
+    finally:
+        await drop_account(session_local, account)
+        # the key store uses the app's pooled engine, bound to this event loop
+        await async_engine.dispose()
+
+
+def test_refused_withdraw_can_be_retried_with_its_key(engine):
+    asyncio.run(_run(engine))
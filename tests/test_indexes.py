@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+import pytest
+from sqlalchemy import Uuid, cast, literal, select, text
+from sqlalchemy.dialects import postgresql
+
+from src.account.models import Account, Deposit, Withdraw
+from src.auth.models import User
+from src.bank.models import BankUserAssociation
+from src.loan.models import Loan, LoanCompensation, LoanType
+from src.teller.models import Teller
+
+# bank ids are UUIDs in the database
+BANK_ID = cast(literal("00000000-0000-0000-0000-000000000000"), Uuid)
+
+# lookups of the hot paths, and the table whose index each of them has to use
+HOT_PATH_QUERIES = [
+    (
+        "deposit",
+        select(Deposit)
+        .where(Deposit.account_id == 1)
+        .order_by(Deposit.created_at.desc(), Deposit.id.desc())
+        .limit(20),
+    ),
+    (
+        "withdraw",
+        select(Withdraw)
+        .where(Withdraw.account_id == 1)
+        .order_by(Withdraw.created_at.desc(), Withdraw.id.desc())
+        .limit(20),
+    ),
+    (
+        "loan_compensation",
+        select(LoanCompensation)
+        .where(LoanCompensation.loan_id == 1)
+        .order_by(LoanCompensation.created_at),
+    ),
+    ("loan", select(Loan).where(Loan.account_id == 1)),
+    ("loan", select(Loan).where(Loan.loan_type_id == 1)),
+    ("loan_type", select(LoanType).where(LoanType.bank_id == BANK_ID)),
+    ("account", select(Account).where(Account.bank_id == BANK_ID)),
+    ("teller", select(Teller).where(Teller.bank_id == BANK_ID)),
+    (
+        "bank_user_association",
+        select(BankUserAssociation).where(BankUserAssociation.bank_id == BANK_ID),
+    ),
+    ("user", select(User).where(User.email == "someone@example.com")),
+]
+
+
+def _scans(plan: dict) -> list[tuple[str, str]]:
+    scans = []
+    if "Relation Name" in plan:
+        scans.append((plan["Relation Name"], plan["Node Type"]))
+    for child in plan.get("Plans", []):
+        scans.extend(_scans(child))
+    return scans
+
+
+async def _explain(engine, query) -> list[tuple[str, str]]:
+    sql = str(
+        query.compile(
+            dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+        )
+    )
+    async with engine.begin() as connection:
+        # tables of a test database are tiny; make the planner take any usable index
+        await connection.execute(text("SET LOCAL enable_seqscan = off"))
+        plan = await connection.scalar(text(f"EXPLAIN (FORMAT JSON) {sql}"))
+
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return _scans(plan[0]["Plan"])
+
+
+@pytest.mark.parametrize(
+    "table, query",
+    HOT_PATH_QUERIES,
+    ids=[f"{table}-{i}" for i, (table, _) in enumerate(HOT_PATH_QUERIES)],
+)
+def test_hot_path_uses_an_index(engine, table, query):
+    scans = asyncio.run(_explain(engine, query))
+
+    # partitions are scanned under their own names, e.g. deposit_p2026_10
+    on_table = [
+        node
+        for relation, node in scans
+        if relation in (table, f"{table}_default")
+        or relation.startswith(f"{table}_p")
+    ]
+    assert on_table, scans
+    assert "Seq Scan" not in on_table, scans
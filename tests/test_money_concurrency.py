@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from factories import create_account, drop_account
+from src.account.crud import AccountCRUD
+from src.account.models import Account, Deposit, LedgerEntry, Withdraw
+from src.account.schemas import DepositCreateSchema, WithdrawCreateSchema
+
+DEPOSITS = 40
+DEPOSIT_AMOUNT = 200_000
+WITHDRAWS = 40
+WITHDRAW_AMOUNT = 150_000
+
+
+async def _deposit(session_local, account: Account) -> bool:
+    async with session_local() as db:
+        await AccountCRUD.create_deposit_in_account(
+            db=db,
+            account=account,
+            deposit_schema=DepositCreateSchema(amount=DEPOSIT_AMOUNT),
+        )
+    return True
+
+
+async def _withdraw(session_local, account: Account) -> bool:
+    async with session_local() as db:
+        try:
+            await AccountCRUD.create_withdraw_in_account(
+                db=db,
+                account=account,
+                withdraw_schema=WithdrawCreateSchema(amount=WITHDRAW_AMOUNT),
+            )
+        except HTTPException:
+            # not enough money yet; the balance must not go below zero
+            return False
+    return True
+
+
+async def _run(engine, stripes: int) -> None:
+    session_local = async_sessionmaker(bind=engine, expire_on_commit=False)
+    # a NULL balance has to be treated as 0
+    account = await create_account(session_local, money=None, stripes=stripes)
+    try:
+        operations = [_deposit(session_local, account) for _ in range(DEPOSITS)]
+        operations += [_withdraw(session_local, account) for _ in range(WITHDRAWS)]
+        # interleaved, so withdraws race the deposits they depend on
+        operations = operations[::2] + operations[1::2]
+        results = await asyncio.gather(*operations)
+        withdrawn = sum(results) - DEPOSITS
+
+        async with session_local() as db:
+            balance = await db.scalar(
+                select(Account.balance).where(Account.id == account.id)
+            )
+            ledger_sum = await db.scalar(
+                select(func.sum(LedgerEntry.balance_delta)).where(
+                    LedgerEntry.account_id == account.id
+                )
+            )
+            deposits = await db.scalar(
+                select(func.count()).where(Deposit.account_id == account.id)
+            )
+            withdraws = await db.scalar(
+                select(func.count()).where(Withdraw.account_id == account.id)
+            )
+    finally:
+        await drop_account(session_local, account)
+
+    assert deposits == DEPOSITS
+    assert withdraws == withdrawn
+    assert balance == DEPOSITS * DEPOSIT_AMOUNT - withdrawn * WITHDRAW_AMOUNT
+    assert balance >= 0
+    assert ledger_sum == balance
+
+
+@pytest.mark.parametrize("stripes", [0, 4])
+def test_parallel_deposits_and_withdraws_keep_the_balance(engine, stripes):
+    asyncio.run(_run(engine, stripes))